@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 import uvicorn
@@ -14,8 +15,20 @@ from src.api.routers import router as api_router
 from src.api.views import router as views_router
 from src.bot.handlers import router as bot_router
 from src.bot.setup import storage
+from src.infra.ai.agents.chatbot.agent import chatbot_runtime
+from src.infra.ai.agents.chatbot.consolidation import run_memory_consolidation
+from src.infra.ai.agents.chatbot.memory import memory_queue
+from src.infra.ai.rag import (
+    embedding_batcher,
+    embedding_cache,
+    embedding_client,
+    reembedding,
+    rescore_vectors,
+    store,
+)
 from src.infra.db.base import create_tables
 from src.settings import TEMPLATES_DIR, settings
+from src.utils.metrics import monitor_event_loop_lag
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +45,14 @@ dp.include_router(bot_router)
 async def lifespan(_: FastAPI):
     await create_tables()  # Создание таблиц
     await init_db.main()  # Добавление данных
+    await embedding_client.start()
+    await embedding_cache.open()
+    await rescore_vectors.open()
+    await reembedding.open()
+    await memory_queue.open()
+    await chatbot_runtime.open()
+    loop_lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    memory_consolidation = asyncio.create_task(run_memory_consolidation())
     await bot.set_webhook(
         url=WEBHOOK_URL,
         allowed_updates=dp.resolve_used_update_types(),
@@ -41,6 +62,19 @@ async def lifespan(_: FastAPI):
     yield
     await bot.delete_webhook()
     logger.info("Telegram bot webhook removed")
+    # Фоновые задачи останавливаются до закрытия клиентов, иначе они откроют их заново
+    loop_lag_monitor.cancel()
+    memory_consolidation.cancel()
+    await asyncio.gather(loop_lag_monitor, memory_consolidation, return_exceptions=True)
+    await chatbot_runtime.close()
+    await memory_queue.close()
+    await reembedding.close()
+    await embedding_batcher.close()
+    await embedding_client.close()
+    await embedding_cache.close()
+    await rescore_vectors.close()
+    await store.query_batcher.close()
+    await store.shutdown()
 
 
 app = FastAPI(title="Education AI API", version="0.1.0", lifespan=lifespan)
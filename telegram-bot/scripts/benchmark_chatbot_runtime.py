@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from src.infra.ai.agents.chatbot.agent import ChatbotRuntime, build_agent
+
+logger = logging.getLogger(__name__)
+
+
+async def per_message_before(path: Path, thread_id: str) -> float:
+    """Накладные расходы прежнего `call_chatbot`: соединение, DDL и сборка агента на сообщение"""
+
+    start_time = time.perf_counter()
+    async with AsyncSqliteSaver.from_conn_string(os.fspath(path)) as checkpointer:
+        await checkpointer.setup()
+        agent = build_agent(checkpointer)
+        await agent.aget_state({"configurable": {"thread_id": thread_id}})
+    return time.perf_counter() - start_time
+
+
+async def per_message_after(runtime: ChatbotRuntime, thread_id: str) -> float:
+    """Накладные расходы с долгоживущим runtime: только чтение состояния диалога"""
+
+    start_time = time.perf_counter()
+    agent = await runtime.get_agent()
+    await agent.aget_state({"configurable": {"thread_id": thread_id}})
+    return time.perf_counter() - start_time
+
+
+def report(name: str, timings: list[float]) -> None:
+    logger.info(
+        "%-8s mean %8.2f ms, p50 %8.2f ms, p95 %8.2f ms",
+        name,
+        np.mean(timings) * 1000,
+        np.percentile(timings, 50) * 1000,
+        np.percentile(timings, 95) * 1000,
+    )
+
+
+async def main(messages: int, users: int) -> None:
+    """Сравнение накладных расходов на сообщение без обращения к модели"""
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "checkpoint.sqlite"
+        before = [await per_message_before(path, f"{i % users}") for i in range(messages)]
+        runtime = ChatbotRuntime(path)
+        await runtime.open()
+        try:
+            after = [await per_message_after(runtime, f"{i % users}") for i in range(messages)]
+        finally:
+            await runtime.close()
+    logger.info("Per-message overhead over %s messages from %s users", messages, users)
+    report("before", before)
+    report("after", after)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Накладные расходы чат-бота на одно сообщение")
+    parser.add_argument("--messages", type=int, default=200, help="Количество сообщений")
+    parser.add_argument("--users", type=int, default=20, help="Количество диалогов")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.users))
@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+from uuid import uuid4
+
+import chromadb
+import numpy as np
+
+from scripts.benchmark_vector_storage import exact_top_k, load_corpus
+from src.infra.ai.rag import embedding_cache, embedding_client, get_embeddings
+from src.infra.ai.rag.pgvector import PgVectorClient
+from src.infra.ai.rag.store import VectorClient, run_in_store
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def run_backend(
+        client: VectorClient,
+        chunks: list[str],
+        vectors: np.ndarray,
+        queries: np.ndarray,
+        ground_truth: np.ndarray,
+        k: int,
+        batch_size: int,
+) -> dict[str, float]:
+    """Загрузка корпуса и поиск по нему через общий интерфейс хранилища"""
+
+    collection = await run_in_store(
+        "get_or_create_collection", client.get_or_create_collection, f"benchmark-{uuid4()}"
+    )
+    ids = [str(i) for i in range(len(chunks))]
+    metadatas = [{"part": i % 4} for i in range(len(chunks))]
+    start_time = time.perf_counter()
+    for i in range(0, len(ids), batch_size):
+        await run_in_store(
+            "upsert",
+            collection.upsert,
+            ids=ids[i:i + batch_size],
+            documents=chunks[i:i + batch_size],
+            embeddings=vectors[i:i + batch_size],
+            metadatas=metadatas[i:i + batch_size],
+        )
+    if isinstance(client, PgVectorClient) and client.index_type == "ivfflat":
+        await client.reindex(collection)
+    ingest_time = time.perf_counter() - start_time
+    latencies, filtered_latencies, recalls = [], [], []
+    for query, expected in zip(queries, ground_truth, strict=True):
+        start_time = time.perf_counter()
+        result = await run_in_store(
+            "query", collection.query, query_embeddings=query[None, :], n_results=k, include=[]
+        )
+        latencies.append(time.perf_counter() - start_time)
+        found = {int(doc_id) for doc_id in result["ids"][0]}
+        recalls.append(len(found & set(expected.tolist())) / k)
+        start_time = time.perf_counter()
+        await run_in_store(
+            "query",
+            collection.query,
+            query_embeddings=query[None, :],
+            n_results=k,
+            where={"part": 1},
+            include=["documents", "metadatas", "distances"],
+        )
+        filtered_latencies.append(time.perf_counter() - start_time)
+    start_time = time.perf_counter()
+    await run_in_store(
+        "query", collection.query, query_embeddings=queries, n_results=k, include=["distances"]
+    )
+    batch_time = time.perf_counter() - start_time
+    await run_in_store("delete_collection", client.delete_collection, collection.name)
+    return {
+        "ingest_docs_per_s": len(ids) / ingest_time,
+        "recall": float(np.mean(recalls)),
+        "latency_ms": float(np.mean(latencies) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "filtered_ms": float(np.mean(filtered_latencies) * 1000),
+        "batch_ms": batch_time * 1000,
+    }
+
+
+async def main(k: int, batch_size: int) -> None:
+    chunks, queries = load_corpus()
+    logger.info("Corpus: %s chunks, %s queries", len(chunks), len(queries))
+    try:
+        vectors = np.asarray(await get_embeddings(chunks), dtype=np.float32)
+        query_vectors = np.asarray(await get_embeddings(queries), dtype=np.float32)
+    finally:
+        await embedding_client.close()
+        await embedding_cache.close()
+    ground_truth = exact_top_k(vectors, query_vectors, k)
+    with tempfile.TemporaryDirectory() as chroma_path:
+        backends: list[tuple[str, VectorClient]] = [
+            ("chroma", chromadb.PersistentClient(chroma_path))
+        ]
+        for index_type, index_options, search_options in (
+                (
+                    "hnsw",
+                    {
+                        "m": settings.rag.pgvector_hnsw_m,
+                        "ef_construction": settings.rag.pgvector_hnsw_ef_construction,
+                    },
+                    {"hnsw.ef_search": settings.rag.pgvector_hnsw_ef_search},
+                ),
+                (
+                    "ivfflat",
+                    {"lists": settings.rag.pgvector_ivf_lists},
+                    {"ivfflat.probes": settings.rag.pgvector_ivf_probes},
+                ),
+        ):
+            backends.append((
+                f"pgvector {index_type}",
+                PgVectorClient(
+                    settings.postgres.dsn,
+                    index_type=index_type,
+                    index_options=index_options,
+                    search_options=search_options,
+                ),
+            ))
+        logger.info(
+            "%-18s %10s %9s %8s %8s %11s %12s",
+            "backend", "ingest/s", f"recall@{k}", "mean ms", "p95 ms", "filtered ms",
+            f"{len(queries)} batch ms",
+        )
+        for name, client in backends:
+            try:
+                report = await run_backend(
+                    client, chunks, vectors, query_vectors, ground_truth, k, batch_size
+                )
+            finally:
+                if isinstance(client, PgVectorClient):
+                    await client.close()
+            logger.info(
+                "%-18s %10.0f %9.3f %8.2f %8.2f %11.2f %12.1f",
+                name,
+                report["ingest_docs_per_s"],
+                report["recall"],
+                report["latency_ms"],
+                report["p95_ms"],
+                report["filtered_ms"],
+                report["batch_ms"],
+            )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Сравнение Chroma и pgvector на курсах")
+    parser.add_argument("-k", type=int, default=10, help="Количество результатов на запрос")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Документов в одной записи")
+    args = parser.parse_args()
+    asyncio.run(main(args.k, args.batch_size))
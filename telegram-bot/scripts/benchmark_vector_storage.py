@@ -0,0 +1,197 @@
+from typing import Any, Literal
+
+import argparse
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from uuid import uuid4
+
+import chromadb
+import numpy as np
+
+from src.core.entities.course import Course, QuizBlock
+from src.infra.ai.rag import embedding_cache, embedding_client, get_embeddings
+from src.infra.ai.rag.compact import truncate
+from src.infra.ai.rag.documents import iter_chunks
+from src.settings import BASE_DIR
+from src.utils.formatting import get_content_block_context
+
+DATA_DIR = BASE_DIR / "data" / "courses"
+
+logger = logging.getLogger(__name__)
+
+type Reduce = Callable[[np.ndarray], np.ndarray]
+type VectorDtype = Literal["float32", "float16", "int8"]
+
+
+class PCAProjection:
+    """Проекция на главные компоненты выборки векторов"""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray) -> None:
+        self.mean = mean
+        self.components = components
+
+    @classmethod
+    def fit(cls, sample: Any, dims: int) -> "PCAProjection":
+        vectors = np.asarray(sample, dtype=np.float32)
+        mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        return cls(mean, vt[:dims])
+
+    def transform(self, vectors: Any) -> np.ndarray:
+        return (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+
+
+def quantize(vectors: Any, dtype: VectorDtype) -> tuple[np.ndarray, np.ndarray]:
+    """Квантование векторов.
+
+    :returns: Коды и масштаб каждого вектора (для int8 - симметричный по max |x|).
+    """
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.ones(len(vectors), dtype=np.float32)
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales
+    return vectors.astype(dtype), scales
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def load_corpus() -> tuple[list[str], list[str]]:
+    """Чанки теории и запросы (цели обучения и вопросы квизов) всех курсов из `data/courses`"""
+
+    chunks, queries = [], []
+    for path in sorted(DATA_DIR.glob("*.json")):
+        course = Course.model_validate_json(path.read_text(encoding="utf-8"))
+        for module in course.modules:
+            queries.extend(module.learning_objectives)
+            for content_block in module.content_blocks:
+                if isinstance(content_block, QuizBlock):
+                    queries.extend(question for question, _ in content_block.questions)
+                text = f"# {module.title}\n\n{get_content_block_context(content_block)}"
+                chunks.extend(iter_chunks(text))
+    return chunks, queries
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    distances = (
+        (queries ** 2).sum(axis=1)[:, None]
+        + (vectors ** 2).sum(axis=1)[None, :]
+        - 2 * queries @ vectors.T
+    )
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def run_mode(
+        chroma: chromadb.ClientAPI,
+        vectors: np.ndarray,
+        queries: np.ndarray,
+        ground_truth: np.ndarray,
+        reduce: Reduce,
+        rescore_dtype: VectorDtype | None,
+        k: int,
+        oversample: int,
+) -> dict[str, float]:
+    """Поиск в коллекции Chroma по сжатым векторам с необязательным пересчётом кандидатов"""
+
+    reduced = reduce(vectors)
+    collection = chroma.create_collection(f"benchmark-{uuid4()}")
+    ids = [str(i) for i in range(len(vectors))]
+    for i in range(0, len(ids), 1000):
+        collection.add(ids=ids[i:i + 1000], embeddings=reduced[i:i + 1000])
+    index_bytes = reduced.shape[0] * reduced.shape[1] * 4
+    rescore_bytes = 0
+    if rescore_dtype is not None:
+        codes, scales = quantize(vectors, rescore_dtype)
+        rescore_bytes = codes.nbytes + scales.nbytes
+    n_candidates = k * oversample if rescore_dtype is not None else k
+    latencies, recalls = [], []
+    for query, expected in zip(queries, ground_truth, strict=True):
+        start_time = time.perf_counter()
+        result = collection.query(
+            query_embeddings=reduce(query[None, :]), n_results=n_candidates, include=[]
+        )
+        found = np.array([int(doc_id) for doc_id in result["ids"][0]])
+        if rescore_dtype is not None:
+            full = dequantize(codes[found], scales[found])
+            found = found[np.argsort(((full - query) ** 2).sum(axis=1))[:k]]
+        latencies.append(time.perf_counter() - start_time)
+        recalls.append(len(set(found.tolist()) & set(expected.tolist())) / k)
+    chroma.delete_collection(collection.name)
+    return {
+        "recall": float(np.mean(recalls)),
+        "latency_ms": float(np.mean(latencies) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "index_kb": index_bytes / 1024,
+        "rescore_kb": rescore_bytes / 1024,
+        "total_kb": (index_bytes + rescore_bytes) / 1024,
+    }
+
+
+async def main(k: int, oversample: int, dims: list[int]) -> None:
+    chunks, queries = load_corpus()
+    logger.info("Corpus: %s chunks, %s queries", len(chunks), len(queries))
+    try:
+        vectors = np.asarray(await get_embeddings(chunks), dtype=np.float32)
+        query_vectors = np.asarray(await get_embeddings(queries), dtype=np.float32)
+    finally:
+        await embedding_client.close()
+        await embedding_cache.close()
+    ground_truth = exact_top_k(vectors, query_vectors, k)
+    # Сервис пересчитывает по float32 (`compact.py`), остальные варианты - для сравнения
+    modes: list[tuple[str, Reduce, VectorDtype | None]] = [("full float32", lambda x: x, None)]
+    for n_dims in dims:
+        pca = PCAProjection.fit(vectors, n_dims)
+
+        def matryoshka(x: np.ndarray, n_dims: int = n_dims) -> np.ndarray:
+            return truncate(x, n_dims)
+
+        modes.extend([
+            (f"matryoshka-{n_dims}", matryoshka, None),
+            *(
+                (f"matryoshka-{n_dims} + rescore {dtype}", matryoshka, dtype)
+                for dtype in ("float32", "float16", "int8")
+            ),
+            (f"pca-{n_dims}", pca.transform, None),
+            (f"pca-{n_dims} + rescore float32", pca.transform, "float32"),
+        ])
+    chroma = chromadb.EphemeralClient()
+    logger.info(
+        "%-36s %9s %8s %8s %9s %10s %9s",
+        "mode", f"recall@{k}", "mean ms", "p95 ms", "index KB", "rescore KB", "total KB"
+    )
+    for name, reduce, rescore_dtype in modes:
+        report = run_mode(
+            chroma, vectors, query_vectors, ground_truth, reduce, rescore_dtype, k, oversample
+        )
+        logger.info(
+            "%-36s %9.3f %8.2f %8.2f %9.0f %10.0f %9.0f",
+            name,
+            report["recall"],
+            report["latency_ms"],
+            report["p95_ms"],
+            report["index_kb"],
+            report["rescore_kb"],
+            report["total_kb"],
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Сравнение режимов хранения векторов по recall@k, задержке и размеру"
+    )
+    parser.add_argument("-k", type=int, default=10, help="Количество результатов на запрос")
+    parser.add_argument(
+        "--oversample", type=int, default=4, help="Кандидатов на один результат при пересчёте"
+    )
+    parser.add_argument(
+        "--dims", type=int, nargs="+", default=[512, 256, 128], help="Размерности усечения"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.k, args.oversample, args.dims))
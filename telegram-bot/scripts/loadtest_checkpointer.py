@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver, empty_checkpoint
+from langgraph.checkpoint.base.id import uuid6
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from src.infra.ai.agents.chatbot.checkpoint import PostgresCheckpointSaver
+from src.infra.db.conn import engine
+
+logger = logging.getLogger(__name__)
+
+
+async def run_thread(
+        checkpointer: BaseCheckpointSaver, thread_id: str, turns: int
+) -> list[float]:
+    """Диалог из `turns` сообщений: чтение состояния и запись новой контрольной точки,
+    как на каждом шаге агента.
+    """
+
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    messages = []
+    latencies = []
+    for step in range(turns):
+        start_time = time.perf_counter()
+        await checkpointer.aget_tuple(config)
+        messages.extend([
+            HumanMessage(f"Вопрос {step} по материалам модуля"),
+            AIMessage(f"Ответ {step}: " + "подробное объяснение " * 50),
+        ])
+        checkpoint = empty_checkpoint()
+        checkpoint["id"] = str(uuid6(clockseq=step))
+        checkpoint["channel_values"] = {"messages": messages}
+        config = await checkpointer.aput(config, checkpoint, {"step": step}, {})
+        await checkpointer.aput_writes(config, [("messages", messages[-1:])], task_id=f"{step}")
+        latencies.append(time.perf_counter() - start_time)
+    return latencies
+
+
+async def run_load(
+        name: str, checkpointer: BaseCheckpointSaver, threads: int, turns: int
+) -> None:
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*(
+        run_thread(checkpointer, f"{name}-{threads}-{i}", turns) for i in range(threads)
+    ))
+    elapsed = time.perf_counter() - start_time
+    latencies = [latency for thread_latencies in results for latency in thread_latencies]
+    logger.info(
+        "%-8s %7s threads %10.0f turns/s, p50 %7.2f ms, p95 %7.2f ms",
+        name,
+        threads,
+        len(latencies) / elapsed,
+        np.percentile(latencies, 50) * 1000,
+        np.percentile(latencies, 95) * 1000,
+    )
+
+
+async def main(concurrency: list[int], turns: int) -> None:
+    # SQL каждого запроса в логах исказил бы результаты
+    engine.echo = False
+    postgres = PostgresCheckpointSaver()
+    await postgres.setup()
+    with tempfile.TemporaryDirectory() as directory:
+        async with aiosqlite.connect(Path(directory) / "checkpoint.sqlite") as conn:
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")
+            sqlite = AsyncSqliteSaver(conn)
+            await sqlite.setup()
+            for threads in concurrency:
+                await run_load("sqlite", sqlite, threads, turns)
+                await run_load("postgres", postgres, threads, turns)
+    for threads in concurrency:
+        for i in range(threads):
+            await postgres.adelete_thread(f"postgres-{threads}-{i}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Нагрузочный тест хранилищ истории чат-бота")
+    parser.add_argument(
+        "--threads", type=int, nargs="+", default=[1, 8, 32], help="Одновременных диалогов"
+    )
+    parser.add_argument("--turns", type=int, default=20, help="Сообщений в одном диалоге")
+    args = parser.parse_args()
+    asyncio.run(main(args.threads, args.turns))
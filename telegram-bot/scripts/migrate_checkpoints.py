@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+
+import aiosqlite
+
+from src.infra.ai.agents.chatbot.agent import SQLITE_PATH
+from src.infra.ai.agents.chatbot.checkpoint import PostgresCheckpointSaver
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_COLUMNS = (
+    "thread_id",
+    "checkpoint_ns",
+    "checkpoint_id",
+    "parent_checkpoint_id",
+    "type",
+    "checkpoint",
+    "metadata",
+)
+WRITE_COLUMNS = (
+    "thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx", "channel", "type", "value"
+)
+
+
+async def migrate(path: Path, page_size: int) -> None:
+    """Копирование диалогов из SQLite checkpointer в Postgres.
+
+    Строки переносятся как есть (сериализованные состояния не разбираются),
+    уже перенесённые пропускаются, поэтому повторный запуск безопасен.
+    """
+
+    checkpointer = PostgresCheckpointSaver()
+    await checkpointer.setup()
+    async with aiosqlite.connect(path) as conn:
+        for table, columns in (("checkpoints", CHECKPOINT_COLUMNS), ("writes", WRITE_COLUMNS)):
+            copied, last_rowid = 0, 0
+            while True:
+                async with conn.execute(
+                    f"SELECT rowid, {', '.join(columns)} FROM {table} WHERE rowid > ? "  # noqa: S608
+                    "ORDER BY rowid LIMIT ?",
+                    (last_rowid, page_size),
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                if not rows:
+                    break
+                last_rowid = rows[-1][0]
+                if table == "checkpoints":
+                    # В SQLite метаданные лежат байтами JSON, в Postgres - JSONB
+                    checkpoints = [
+                        (*row[1:7], row[7] if isinstance(row[7], str) else bytes(row[7]).decode())
+                        for row in rows
+                    ]
+                    await checkpointer.copy_rows(checkpoints, [])
+                else:
+                    await checkpointer.copy_rows([], [row[1:] for row in rows])
+                copied += len(rows)
+                logger.info("Copied %s rows of `%s`", copied, table)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Перенос истории чат-бота из SQLite в Postgres")
+    parser.add_argument(
+        "path", type=Path, nargs="?", default=SQLITE_PATH, help="Файл SQLite checkpointer"
+    )
+    parser.add_argument("--page-size", type=int, default=500, help="Строк в одной пачке")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.path, args.page_size))
@@ -0,0 +1,50 @@
+import argparse
+import logging
+from collections import defaultdict
+
+from src.infra.ai.agents.course_generator.tools import INDEX_NAME, get_course_index_name
+from src.infra.ai.rag import client
+
+PAGE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def main(drop_legacy: bool = False) -> None:
+    """Перенос знаний из общей коллекции в партиции курсов без повторной векторизации"""
+
+    legacy = client.get_collection(INDEX_NAME)
+    total, offset = legacy.count(), 0
+    moved: dict[str, int] = defaultdict(int)
+    while offset < total:
+        page = legacy.get(
+            limit=PAGE_SIZE, offset=offset, include=["documents", "metadatas", "embeddings"]
+        )
+        groups: dict[str, list[int]] = defaultdict(list)
+        for i, metadata in enumerate(page["metadatas"]):
+            groups[(metadata or {}).get("tenant_id", "unknown")].append(i)
+        for tenant_id, positions in groups.items():
+            client.get_or_create_collection(get_course_index_name(tenant_id)).upsert(
+                ids=[page["ids"][i] for i in positions],
+                documents=[page["documents"][i] for i in positions],
+                embeddings=[page["embeddings"][i] for i in positions],
+                metadatas=[page["metadatas"][i] for i in positions],
+            )
+            moved[tenant_id] += len(positions)
+        offset += len(page["ids"])
+        logger.info("Moved %s of %s chunks", offset, total)
+    for tenant_id, count in moved.items():
+        logger.info("Course `%s`: %s chunks", tenant_id, count)
+    if drop_legacy:
+        client.delete_collection(INDEX_NAME)
+        logger.info("Legacy collection `%s` dropped", INDEX_NAME)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Разбиение базы знаний на партиции курсов")
+    parser.add_argument(
+        "--drop-legacy", action="store_true", help="Удалить общую коллекцию после переноса"
+    )
+    args = parser.parse_args()
+    main(drop_legacy=args.drop_legacy)
@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+
+import anyio
+
+from src.infra.ai.rag import (
+    client,
+    export_snapshot,
+    import_snapshot,
+    reembedding,
+    rescore_vectors,
+    store,
+)
+
+
+async def export_all(directory: Path) -> None:
+    """Экспорт всех коллекций хранилища, по файлу на коллекцию"""
+
+    await anyio.Path(directory).mkdir(parents=True, exist_ok=True)
+    indexes = {collection_name: name for name, collection_name in store.aliases().items()}
+    for collection in await store.run_in_store("list_collections", client.list_collections):
+        collection_name = getattr(collection, "name", collection)
+        index_name = indexes.get(collection_name, collection_name)
+        await export_snapshot(index_name, directory / f"{index_name}.snapshot")
+
+
+async def main(args: argparse.Namespace) -> None:
+    # Переключённые индексы и активная модель эмбеддингов, без возобновления перевекторизации
+    await reembedding.open(resume=False)
+    try:
+        if args.command == "export" and args.all:
+            await export_all(args.path)
+        elif args.command == "export":
+            await export_snapshot(args.index, args.path)
+        else:
+            paths = sorted(args.path.glob("*.snapshot")) if args.path.is_dir() else [args.path]
+            for path in paths:
+                await import_snapshot(path, index_name=args.index, replace=args.replace)
+    finally:
+        await reembedding.close()
+        await rescore_vectors.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Снимки индексов базы знаний")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Выгрузка индекса в файл снимка")
+    export_parser.add_argument("path", type=Path, help="Файл снимка (каталог с --all)")
+    export_target = export_parser.add_mutually_exclusive_group(required=True)
+    export_target.add_argument("--index", help="Выгружаемый индекс")
+    export_target.add_argument("--all", action="store_true", help="Выгрузить все коллекции")
+    import_parser = commands.add_parser("import", help="Загрузка снимка в индекс")
+    import_parser.add_argument("path", type=Path, help="Файл снимка или каталог снимков")
+    import_parser.add_argument("--index", help="Целевой индекс, по умолчанию исходный")
+    import_parser.add_argument(
+        "--replace", action="store_true", help="Удалить индекс перед загрузкой"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -1,12 +1,14 @@
+import secrets
 from collections.abc import AsyncIterable
 
-from fastapi import Body, Depends, HTTPException, status
+from fastapi import Body, Depends, Header, HTTPException, status
 from pydantic import PositiveInt
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.app.services import check_daily_chat_limit
 from src.infra.db.conn import session_factory
 from src.infra.db.repos import CourseRepository
+from src.settings import settings
 
 
 async def get_db() -> AsyncIterable[AsyncSession]:
@@ -28,3 +30,19 @@ async def enforce_daily_chat_limit(
             detail="The daily chat limit has been reached (10 messages / day)!",
             headers={"Retry-After": "86400"},
         )
+
+
+def require_admin(
+    x_api_key: str | None = Header(None, description="Ключ служебных эндпоинтов")
+) -> None:
+    admin_api_key = settings.app.admin_api_key
+    if admin_api_key is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Admin API key is not configured!"
+        )
+    if x_api_key is None or not secrets.compare_digest(x_api_key, admin_api_key):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin API key!",
+            headers={"WWW-Authenticate": "ApiKey"},
+        )
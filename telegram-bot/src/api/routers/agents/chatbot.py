@@ -1,12 +1,19 @@
+import logging
+from collections.abc import AsyncIterator
 from uuid import UUID
 
 from fastapi import APIRouter, Body, Depends, Query, status
+from fastapi.responses import StreamingResponse
 from pydantic import PositiveInt
 
-from src.infra.ai.agents.chatbot.agent import call_chatbot
+from src.app.services import refund_daily_chat_limit
+from src.infra.ai.agents.chatbot.agent import call_chatbot, stream_chatbot
+from src.infra.ai.agents.schemas import ChatbotEvent
 
 from ...dependencies import enforce_daily_chat_limit
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/chatbot",
     tags=["Chatbot"],
@@ -26,3 +33,31 @@ async def generate_response(
 ) -> dict[str, str]:
     content = await call_chatbot(course_id, user_id, text)
     return {"text": content}
+
+
+@router.post(
+    path="/stream",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    summary="Потоковый ответ чат-бота (Server-Sent Events)"
+)
+async def stream_response(
+        course_id: UUID = Query(..., description="ID курса"),
+        user_id: PositiveInt = Body(..., embed=True, description="ID студента"),
+        text: str = Body(..., embed=True, description="Текст запроса студента")
+) -> StreamingResponse:
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in stream_chatbot(course_id, user_id, text):
+                yield f"event: {event.type}\ndata: {event.model_dump_json()}\n\n"
+        except Exception:
+            logger.exception("Chatbot stream failed for user %s", user_id)
+            await refund_daily_chat_limit(user_id)
+            yield f"event: error\ndata: {ChatbotEvent(type='error').model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Прокси не должен буферизовать поток, иначе токены придут одной пачкой
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+
+from .agents import router as agents_router
+from .courses import router as courses_router
+from .metrics import router as metrics_router
+from .reembedding import router as reembedding_router
+from .snapshots import router as snapshots_router
+
+router = APIRouter(prefix="/api/v1")
+
+router.include_router(agents_router)
+router.include_router(courses_router)
+router.include_router(metrics_router)
+router.include_router(reembedding_router)
+router.include_router(snapshots_router)
@@ -1,11 +1,14 @@
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 
 from src.core.entities.course import Course, Module
+from src.core.errors import ConflictError
+from src.infra.ai.agents.course_generator.theory_index import sync_course_theory
+from src.infra.ai.agents.course_generator.tools import purge_course_knowledge
 from src.infra.db.repos import CourseRepository
 
-from ..dependencies import get_course_repo
+from ..dependencies import get_course_repo, require_admin
 
 router = APIRouter(prefix="/courses", tags=["Courses"])
 
@@ -46,6 +49,26 @@ async def get_module(
     summary="Обновление курса"
 )
 async def update_course(
-        course: Course, repository: CourseRepository = Depends(get_course_repo)
+        course: Course,
+        background_tasks: BackgroundTasks,
+        repository: CourseRepository = Depends(get_course_repo),
 ) -> None:
     await repository.refresh(course)
+    # Перевекторизуются только изменённые блоки теории
+    background_tasks.add_task(sync_course_theory, course)
+
+
+@router.delete(
+    path="/{course_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Удаление курса вместе с его базой знаний",
+    dependencies=[Depends(require_admin)],
+)
+async def delete_course(
+        course_id: UUID, repository: CourseRepository = Depends(get_course_repo)
+) -> None:
+    try:
+        await repository.delete(course_id)
+    except ConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
+    await purge_course_knowledge(course_id)
@@ -0,0 +1,21 @@
+from typing import Any
+
+from fastapi import APIRouter, status
+
+from src.infra.ai.rag import embedding_cache
+from src.infra.ai.utils import prompt_cache_usage
+from src.utils.metrics import metrics
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get(
+    path="",
+    status_code=status.HTTP_200_OK,
+    summary="Получение метрик приложения"
+)
+async def get_metrics() -> dict[str, Any]:
+    return metrics.snapshot() | {
+        "embedding_cache": embedding_cache.stats,
+        "prompt_cache": prompt_cache_usage.stats,
+    }
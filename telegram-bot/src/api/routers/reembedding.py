@@ -0,0 +1,46 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from src.infra.ai.rag import reembedding
+from src.settings import settings
+
+from ..dependencies import require_admin
+
+router = APIRouter(
+    prefix="/reembedding", tags=["Re-embedding"], dependencies=[Depends(require_admin)]
+)
+
+
+@router.get(
+    path="",
+    status_code=status.HTTP_200_OK,
+    summary="Прогресс перевекторизации базы знаний"
+)
+async def get_reembedding_progress() -> dict[str, Any]:
+    return reembedding.snapshot()
+
+
+@router.post(
+    path="",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Запуск (или продолжение) перевекторизации под новую модель эмбеддингов"
+)
+async def start_reembedding() -> dict[str, Any]:
+    space_url, model_id = (
+        settings.huggingface.target_space_url, settings.huggingface.target_model_id
+    )
+    if space_url is None or model_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="HF_TARGET_SPACE_URL and HF_TARGET_MODEL_ID must be set!",
+        )
+    if reembedding.running:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Re-embedding is already running!"
+        )
+    try:
+        await reembedding.start(space_url, model_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
+    return reembedding.snapshot()
@@ -0,0 +1,78 @@
+from typing import Any
+
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, status
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+
+from src.infra.ai.rag import export_snapshot, import_snapshot
+
+from ..dependencies import require_admin
+
+router = APIRouter(
+    prefix="/snapshots", tags=["Snapshots"], dependencies=[Depends(require_admin)]
+)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _temp_path() -> Path:
+    with tempfile.NamedTemporaryFile(suffix=".snapshot", delete=False) as file:
+        return Path(file.name)
+
+
+@router.get(
+    path="/{index_name}",
+    status_code=status.HTTP_200_OK,
+    response_class=FileResponse,
+    summary="Выгрузка снимка индекса базы знаний одним файлом"
+)
+async def download_snapshot(index_name: str) -> FileResponse:
+    path = _temp_path()
+    try:
+        await export_snapshot(index_name, path)
+    except LookupError as e:
+        path.unlink(missing_ok=True)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
+    except RuntimeError as e:
+        path.unlink(missing_ok=True)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    return FileResponse(
+        path,
+        media_type="application/vnd.sqlite3",
+        filename=f"{index_name}.snapshot",
+        background=BackgroundTask(path.unlink, missing_ok=True),
+    )
+
+
+@router.post(
+    path="/{index_name}",
+    status_code=status.HTTP_201_CREATED,
+    summary="Загрузка снимка в индекс базы знаний"
+)
+async def upload_snapshot(
+        index_name: str, snapshot: UploadFile, replace: bool = False
+) -> dict[str, Any]:
+    path = _temp_path()
+    try:
+        async with await anyio.open_file(path, "wb") as file:
+            while chunk := await snapshot.read(CHUNK_SIZE):
+                await file.write(chunk)
+        manifest = await import_snapshot(path, index_name=index_name, replace=replace)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    except sqlite3.DatabaseError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Uploaded file is not a valid snapshot: {e}",
+        ) from e
+    finally:
+        path.unlink(missing_ok=True)
+    return manifest.model_dump()
@@ -103,3 +103,15 @@ async def check_daily_chat_limit(user_id: int) -> bool:
         chat_limit.increment_count()
         await student_repo.refresh_daily_chat_limit(chat_limit)
         return True
+
+
+async def refund_daily_chat_limit(user_id: int) -> None:
+    """Возврат сообщения в ежедневный лимит, если ассистент не смог ответить"""
+
+    async with session_factory() as session:
+        student_repo = StudentRepository(session)
+        chat_limit = await student_repo.get_or_create_daily_chat_limit(
+            user_id, today_date=current_datetime().date()
+        )
+        chat_limit.decrement_count()
+        await student_repo.refresh_daily_chat_limit(chat_limit)
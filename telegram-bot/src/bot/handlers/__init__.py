@@ -2,6 +2,7 @@ __all__ = ["router"]
 
 from aiogram import Router
 
+from .chat import router as chat_router
 from .leaderboard import router as leaderboard_router
 from .misc import router as misc_router
 from .profile import router as profile_router
@@ -18,4 +19,6 @@ router.include_routers(
     profile_router,
     leaderboard_router,
     misc_router,
+    # Последним: в режиме диалога любой текст, не перехваченный выше, уходит ассистенту
+    chat_router,
 )
@@ -0,0 +1,152 @@
+import logging
+import time
+from uuid import UUID
+
+from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+from aiogram.utils.chat_action import ChatActionSender
+
+from src.app.services import check_daily_chat_limit, refund_daily_chat_limit
+from src.infra.ai.agents.chatbot.agent import stream_chatbot
+from src.infra.db.conn import session_factory
+from src.infra.db.repos import StudentRepository
+from src.settings import settings
+from src.utils.formatting import sanitize_for_telegram
+
+from ..fsm import ChatForm
+from ..lexicon import (
+    CHAT_ERROR_TEXT,
+    CHAT_LIMIT_REACHED_TEXT,
+    CHAT_MODE_TEXT,
+    CHAT_NO_GROUP_TEXT,
+    CHAT_THINKING_TEXT,
+    CHAT_TOOL_STATUSES,
+    SESSION_EXPIRED_TEXT,
+)
+
+# Ограничение Telegram на длину текста одного сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+logger = logging.getLogger(__name__)
+
+router = Router(name=__name__)
+
+
+class ProgressiveMessage:
+    """Сообщение Telegram, которое дописывается по мере генерации ответа.
+
+    Правки отправляются не чаще раза в `interval` секунд, чтобы не упираться
+    в ограничение Telegram на редактирование. Ответ выводится без разметки:
+    незавершённый markdown модели ломает HTML-разметку бота.
+    """
+
+    def __init__(self, message: Message, interval: float) -> None:
+        self.message = message
+        self.interval = interval
+        self.text = ""
+        self.status = ""
+        self._shown = message.text or ""
+        self._edited_at = 0.0
+
+    def _render(self) -> str:
+        text = self.text or self.status or CHAT_THINKING_TEXT
+        if self.text and self.status:
+            text = f"{self.text}\n\n{self.status}"
+        # Пока ответ пишется, видна его последняя часть
+        return text[-MAX_MESSAGE_LENGTH:]
+
+    async def _edit(self, text: str) -> None:
+        if text == self._shown:
+            return
+        try:
+            await self.message.edit_text(text, parse_mode=None)
+        except TelegramRetryAfter as e:
+            # Правка пропускается, текст догонит следующая
+            logger.warning("Telegram asked to slow down edits for %s s", e.retry_after)
+            self._edited_at = time.monotonic() + e.retry_after
+            return
+        except TelegramBadRequest:
+            logger.exception("Failed to edit streamed message")
+            return
+        self._shown = text
+        self._edited_at = time.monotonic()
+
+    async def update(self, text: str = "", status: str | None = None) -> None:
+        """Дописать фрагмент ответа и/или сменить статус, правка - по расписанию"""
+
+        self.text += text
+        if status is not None:
+            self.status = status
+        if time.monotonic() - self._edited_at >= self.interval:
+            await self._edit(self._render())
+
+    async def finish(self, text: str) -> None:
+        """Итоговый ответ: первая часть в этом сообщении, остальное следующими"""
+
+        text = sanitize_for_telegram(text or self.text) or CHAT_THINKING_TEXT
+        parts = [
+            text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)
+        ]
+        await self._edit(parts[0])
+        for part in parts[1:]:
+            await self.message.answer(part, parse_mode=None)
+
+    async def fail(self, text: str) -> None:
+        """Замена заглушки или недописанного ответа сообщением об ошибке"""
+
+        await self._edit(text)
+
+
+async def stream_answer(
+        progressive: ProgressiveMessage, course_id: UUID, message: Message
+) -> None:
+    """Вывод событий потокового ответа ассистента в сообщение"""
+
+    async for event in stream_chatbot(course_id, message.from_user.id, message.text):
+        if event.type == "token":
+            await progressive.update(event.text, status="")
+        elif event.type == "tool_start":
+            await progressive.update(status=CHAT_TOOL_STATUSES.get(event.tool, CHAT_THINKING_TEXT))
+        elif event.type == "done":
+            await progressive.finish(event.text)
+
+
+@router.message(Command("chat"))
+async def cmd_chat(message: Message, state: FSMContext) -> None:
+    """Диалог с AI ассистентом"""
+
+    async with session_factory() as session:
+        student_repo = StudentRepository(session)
+        group = await student_repo.get_student_group(message.from_user.id)
+    if group is None:
+        await message.answer(CHAT_NO_GROUP_TEXT)
+        return
+    await state.set_state(ChatForm.in_message_typing)
+    await state.update_data(course_id=group.course_id)
+    await message.answer(CHAT_MODE_TEXT)
+
+
+@router.message(ChatForm.in_message_typing, F.text, ~F.text.startswith("/"))
+async def process_chat_message(message: Message, state: FSMContext) -> None:
+    """Потоковый ответ ассистента с постепенной правкой одного сообщения"""
+
+    course_id = (await state.get_data()).get("course_id")
+    if course_id is None:
+        logger.warning("FSM state is empty, user session is expired!")
+        await message.answer(SESSION_EXPIRED_TEXT)
+        return
+    if not await check_daily_chat_limit(message.from_user.id):
+        await message.answer(CHAT_LIMIT_REACHED_TEXT)
+        return
+    reply = await message.answer(CHAT_THINKING_TEXT, parse_mode=None)
+    progressive = ProgressiveMessage(reply, interval=settings.telegram.stream_edit_interval)
+    try:
+        async with ChatActionSender.typing(chat_id=message.chat.id, bot=message.bot):
+            await stream_answer(progressive, course_id, message)
+    except Exception:
+        logger.exception("Chatbot stream failed for user %s", message.from_user.id)
+        await refund_daily_chat_limit(message.from_user.id)
+        await progressive.fail(CHAT_ERROR_TEXT)
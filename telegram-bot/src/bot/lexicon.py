@@ -7,6 +7,7 @@ FIRE_EFFECT_ID = "5107584321108051014"
 STUDENT_CMD_MENU_TEXT = (
     "<b>⚙️ Главное меню</b>\n\n"
     " - /study - <i>🎓 изучение курса</i>\n"
+    " - /chat - <i>💬 вопрос AI ассистенту</i>\n"
     " - /profile - <i>👤 мой профиль</i>\n"
     " - /leaderboard - <i>🏆 доска лидеров</i>\n"
     " - /info - <i>ℹ️ информация о боте, инструкции</i>\n"
@@ -124,3 +125,42 @@ ASSIGNMENT_RESULT_TEMPLATE = (
     "<i>💭 Обратная связь</i>\n"
     "{ai_feedback}"
 )
+
+# Сообщение при входе в диалог с AI ассистентом
+CHAT_MODE_TEXT = (
+    "<b>💬 Диалог с AI ассистентом</b>\n\n"
+    "Задайте вопрос по материалам курса, ассистент ответит прямо в этом чате.\n\n"
+    "<i>Для возврата к обучению нажмите 👇</i>\n"
+    "/study"
+)
+
+# Текст при исчерпании дневного лимита сообщений ассистенту
+CHAT_LIMIT_REACHED_TEXT = (
+    "😴 Мы так увлеклись беседой, что потратили все сегодняшние сообщения!\n\n"
+    "<i>Возвращайтесь завтра</i>"
+)
+
+# Текст, если ассистент не смог ответить (сообщение не списывается с лимита)
+CHAT_ERROR_TEXT = (
+    "😔 Не получилось ответить на это сообщение, попробуйте ещё раз чуть позже.\n\n"
+    "Сообщение не засчитано в дневной лимит."
+)
+
+# Текст, если пользователь не состоит ни в одной учебной группе
+CHAT_NO_GROUP_TEXT = (
+    "🤷 Вы пока не записаны на курс, ассистенту не на что опереться.\n\n"
+    "<i>Обратитесь к преподавателю, чтобы вас добавили в группу</i>"
+)
+
+# Заглушка потокового ответа, пока ассистент не начал писать
+CHAT_THINKING_TEXT = "💭 Думаю ..."
+
+# Статусы инструментов ассистента во время потокового ответа
+CHAT_TOOL_STATUSES = {
+    "knowledge_search": "🔎 Ищу в материалах курса ...",
+    "batch_knowledge_search": "🔎 Ищу в материалах курса ...",
+    "get_current_module_context": "📖 Смотрю текущий модуль ...",
+    "remember": "📝 Запоминаю ...",
+    "search_memory": "🧠 Вспоминаю ...",
+    "batch_search_memory": "🧠 Вспоминаю ...",
+}
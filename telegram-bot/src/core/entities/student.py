@@ -164,3 +164,8 @@ class DailyChatLimit(BaseModel):
         """Увеличивает счётчик сообщений на 1"""
 
         self.current_count += 1
+
+    def decrement_count(self) -> None:
+        """Возвращает одно сообщение в лимит (например, если ответ не был получен)"""
+
+        self.current_count = max(self.current_count - 1, 0)
@@ -13,6 +13,8 @@ from src.core.entities.course import AnyAssignment
 from src.settings import settings
 from src.utils.formatting import get_assignment_context
 
+from ..utils import prompt_cache_usage
+
 logger = logging.getLogger(__name__)
 
 # model = ChatOpenAI(
@@ -27,6 +29,7 @@ model = ChatOpenAI(
     base_url=settings.deepseek.base_url,
     model=settings.deepseek.deepseek_chat,
     temperature=0.3,
+    callbacks=[prompt_cache_usage],
 )
 
 SYSTEM_PROMPT = """\
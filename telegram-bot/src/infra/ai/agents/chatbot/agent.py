@@ -1,25 +1,41 @@
-import os
+from typing import Literal
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from pathlib import Path
 from uuid import UUID
 
+import aiosqlite
 from langchain.agents import create_agent
-from langchain.agents.middleware import SummarizationMiddleware
+from langchain.agents.middleware import ModelRequest, SummarizationMiddleware, dynamic_prompt
 from langchain.tools import ToolRuntime, tool
+from langchain_core.messages import AIMessageChunk, ToolMessage
 from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph.state import CompiledStateGraph
 
-from src.core.commons import current_datetime
 from src.infra.db.conn import session_factory
 from src.infra.db.repos import CourseRepository, StudentRepository
 from src.settings import BASE_DIR, settings
-from src.utils.formatting import get_module_context
+from src.utils.metrics import metrics
+
+from ...utils import current_date, prompt_cache_usage
+from ..course_generator.tools import batch_knowledge_search, knowledge_search
+from ..schemas import ChatbotEvent, StudentContext
+from .checkpoint import PostgresCheckpointSaver
+from .memory import batch_search_memory, remember, search_memory
+from .prompts import CURRENT_DATE_PROMPT, SUMMARY_PROMPT, SYSTEM_PROMPT
 
-from ..course_generator.tools import knowledge_search
-from ..schemas import StudentContext
-from .memory import remember, search_memory
-from .prompts import SUMMARY_PROMPT, SYSTEM_PROMPT
+logger = logging.getLogger(__name__)
 
 SQLITE_PATH = BASE_DIR / "checkpoint.sqlite"
 
+NO_CURRENT_MODULE_TEXT = "Студент ещё не начал проходить курс, текущего модуля нет."
+MODULE_NOT_FOUND_TEXT = "Материал текущего модуля студента не найден."
+
 # model = ChatOpenAI(
 #     api_key=settings.yandexcloud.api_key,
 #     model=settings.yandexcloud.qwen3_235b,
@@ -32,6 +48,8 @@ model = ChatOpenAI(
     base_url=settings.deepseek.base_url,
     model=settings.deepseek.deepseek_chat,
     temperature=0.3,
+    stream_usage=True,
+    callbacks=[prompt_cache_usage],
 )
 
 summarization_middleware = SummarizationMiddleware(
@@ -47,30 +65,142 @@ summarization_middleware = SummarizationMiddleware(
     description="Получение материала модуля, который студент проходит прямо сейчас",
 )
 async def get_current_module_context(runtime: ToolRuntime[StudentContext]) -> str:
+    # Оба запроса обслуживаются кэшем, пока не изменились прогресс студента или курс
     async with session_factory() as session:
         student_repo = StudentRepository(session)
         course_repo = CourseRepository(session)
-        progress = await student_repo.get_learning_progress(runtime.context.user_id)
-        module = await course_repo.get_module(progress.current_module_id)
-    return get_module_context(module)
+        module_id = await student_repo.get_current_module_id(runtime.context.user_id)
+        if module_id is None:
+            return NO_CURRENT_MODULE_TEXT
+        return await course_repo.get_module_context(module_id) or MODULE_NOT_FOUND_TEXT
+
+
+@dynamic_prompt
+def chatbot_prompt(_: ModelRequest) -> str:
+    # Дата подставляется на каждый вызов модели, граф агента при этом не пересобирается.
+    # Она округлена до дня и стоит в конце, префикс промпта остаётся общим для всех вызовов
+    return SYSTEM_PROMPT + CURRENT_DATE_PROMPT.format(current_date=current_date())
+
+
+def build_agent(checkpointer: BaseCheckpointSaver) -> CompiledStateGraph:
+    """Сборка графа чат-бот агента поверх переданного checkpointer"""
+
+    return create_agent(
+        model=model,
+        context_schema=StudentContext,
+        middleware=[chatbot_prompt, summarization_middleware],
+        tools=[
+            knowledge_search,
+            batch_knowledge_search,
+            get_current_module_context,
+            remember,
+            search_memory,
+            batch_search_memory,
+        ],
+        checkpointer=checkpointer,
+    )
+
+
+class ChatbotRuntime:
+    """Чат-бот агент на всё время жизни приложения.
+
+    Checkpointer открывается и размечается один раз: SQLite - одно соединение в режиме WAL,
+    Postgres - соединения из общего пула приложения. Скомпилированный граф агента
+    переиспользуется всеми диалогами.
+    """
+
+    def __init__(self, path: Path, backend: Literal["sqlite", "postgres"] = "sqlite") -> None:
+        self.path = path
+        self.backend = backend
+        self._conn: aiosqlite.Connection | None = None
+        self._agent: CompiledStateGraph | None = None
+        self._lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        """Открытие соединения checkpointer, создание таблиц и сборка агента"""
+
+        async with self._lock:
+            if self._agent is not None:
+                return
+            if self.backend == "postgres":
+                checkpointer = PostgresCheckpointSaver()
+            else:
+                self._conn = await aiosqlite.connect(self.path)
+                await self._conn.execute("PRAGMA journal_mode=WAL")
+                await self._conn.execute("PRAGMA synchronous=NORMAL")
+                checkpointer = AsyncSqliteSaver(self._conn)
+            await checkpointer.setup()
+            self._agent = build_agent(checkpointer)
+        logger.info("Chatbot runtime opened with %s checkpoints", self.backend)
+
+    async def close(self) -> None:
+        """Закрытие соединения checkpointer"""
+
+        async with self._lock:
+            self._agent = None
+            if self._conn is None:
+                return
+            await self._conn.close()
+            self._conn = None
+        logger.info("Chatbot runtime closed")
+
+    async def get_agent(self) -> CompiledStateGraph:
+        # Ленивое открытие для скриптов, которые не проходят через lifespan
+        if self._agent is None:
+            await self.open()
+        return self._agent
+
+
+chatbot_runtime = ChatbotRuntime(SQLITE_PATH, backend=settings.chatbot.checkpointer)
 
 
 async def call_chatbot(course_id: UUID, user_id: int, user_prompt: str) -> str:
     """Вызов чат-бот агента для диалога со студентом в рамках его учебного прогресса"""
 
-    async with AsyncSqliteSaver.from_conn_string(os.fspath(SQLITE_PATH)) as checkpointer:
-        await checkpointer.setup()
-        agent = create_agent(
-            model=model,
-            system_prompt=SYSTEM_PROMPT.format(current_date=current_datetime()),
-            context_schema=StudentContext,
-            middleware=[summarization_middleware],
-            tools=[knowledge_search, get_current_module_context, remember, search_memory],
-            checkpointer=checkpointer,
-        )
-        result = await agent.ainvoke(
-            {"messages": [("human", user_prompt)]},
-            context=StudentContext(course_id=course_id, user_id=user_id),
-            config={"configurable": {"thread_id": f"{user_id}"}}
-        )
+    agent = await chatbot_runtime.get_agent()
+    result = await agent.ainvoke(
+        {"messages": [("human", user_prompt)]},
+        context=StudentContext(course_id=course_id, user_id=user_id),
+        config={"configurable": {"thread_id": f"{user_id}"}}
+    )
     return result["messages"][-1].content
+
+
+async def stream_chatbot(
+        course_id: UUID, user_id: int, user_prompt: str
+) -> AsyncIterator[ChatbotEvent]:
+    """Потоковый вызов чат-бот агента: токены ответа и статусы инструментов по мере работы.
+
+    :returns: События `token` (фрагмент ответа), `tool_start` / `tool_end` (вызов инструмента)
+        и завершающее `done` с полным текстом итогового ответа.
+    """
+
+    agent = await chatbot_runtime.get_agent()
+    start_time = time.monotonic()
+    answer: list[str] = []
+    is_first_token = True
+    async for message, metadata in agent.astream(
+        {"messages": [("human", user_prompt)]},
+        context=StudentContext(course_id=course_id, user_id=user_id),
+        config={"configurable": {"thread_id": f"{user_id}"}},
+        stream_mode="messages",
+    ):
+        if isinstance(message, ToolMessage):
+            yield ChatbotEvent(type="tool_end", tool=message.name)
+            continue
+        # Токены суммаризации истории идут из middleware и в ответ не попадают
+        if not isinstance(message, AIMessageChunk) or metadata.get("langgraph_node") != "model":
+            continue
+        for tool_call in message.tool_call_chunks:
+            if tool_call.get("name"):
+                # Текст перед вызовом инструмента не входит в итоговый ответ
+                answer.clear()
+                yield ChatbotEvent(type="tool_start", tool=tool_call["name"])
+        if isinstance(message.content, str) and message.content:
+            if is_first_token:
+                metrics.histogram("chatbot.ttft").observe(time.monotonic() - start_time)
+                is_first_token = False
+            answer.append(message.content)
+            yield ChatbotEvent(type="token", text=message.content)
+    metrics.histogram("chatbot.stream").observe(time.monotonic() - start_time)
+    yield ChatbotEvent(type="done", text="".join(answer))
@@ -0,0 +1,280 @@
+# Модуль реализует хранение истории диалогов чат-бота (checkpointer LangGraph) в Postgres.
+# Соединения берутся из общего пула SQLAlchemy, поэтому история доступна всем воркерам
+
+from typing import Any
+
+import json
+import random
+from collections.abc import AsyncIterator, Callable, Sequence
+from contextlib import AbstractAsyncContextManager
+
+import asyncpg
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.base import SerializerProtocol
+
+from src.infra.db.conn import raw_connection
+
+type ConnectionFactory = Callable[[], AbstractAsyncContextManager[asyncpg.Connection]]
+
+CHECKPOINTS_TABLE = "chat_checkpoints"
+WRITES_TABLE = "chat_checkpoint_writes"
+
+INSERT_CHECKPOINT = f"""
+    INSERT INTO {CHECKPOINTS_TABLE} (
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata
+    )
+    VALUES ($1, $2, $3, $4, $5, $6, $7::jsonb)
+"""  # noqa: S608
+
+INSERT_WRITE = f"""
+    INSERT INTO {WRITES_TABLE} (
+        thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value
+    )
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+"""  # noqa: S608
+
+
+def _config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }
+    }
+
+
+class PostgresCheckpointSaver(BaseCheckpointSaver[str]):
+    """Асинхронный checkpointer LangGraph поверх Postgres.
+
+    Схема повторяет `AsyncSqliteSaver` (таблицы контрольных точек и промежуточных записей),
+    поэтому история переносится из SQLite без пересериализации. Метаданные хранятся в JSONB
+    для фильтрации в `alist`. Поддерживается только асинхронный API.
+    """
+
+    def __init__(
+            self,
+            connect: ConnectionFactory = raw_connection,
+            serde: SerializerProtocol | None = None,
+    ) -> None:
+        super().__init__(serde=serde)
+        self.connect = connect
+
+    async def setup(self) -> None:
+        """Создание таблиц (идемпотентно)"""
+
+        async with self.connect() as conn:
+            await conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BYTEA NOT NULL,
+                    metadata JSONB NOT NULL DEFAULT '{{}}',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS {WRITES_TABLE} (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    value BYTEA,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                """
+            )
+
+    @staticmethod
+    def get_next_version(current: str | None, channel: None = None) -> str:  # noqa: ARG004
+        # Формат версий каналов совпадает с SQLite checkpointer
+        current_v = 0 if current is None else int(str(current).split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"  # noqa: S311
+
+    def _tuple(
+            self, row: asyncpg.Record, writes: Sequence[asyncpg.Record]
+    ) -> CheckpointTuple:
+        parent_id = row["parent_checkpoint_id"]
+        return CheckpointTuple(
+            config=_config(row["thread_id"], row["checkpoint_ns"], row["checkpoint_id"]),
+            checkpoint=self.serde.loads_typed((row["type"], row["checkpoint"])),
+            metadata=json.loads(row["metadata"]),
+            parent_config=(
+                _config(row["thread_id"], row["checkpoint_ns"], parent_id) if parent_id else None
+            ),
+            pending_writes=[
+                (write["task_id"], write["channel"], self.serde.loads_typed(
+                    (write["type"], write["value"])
+                ))
+                for write in writes
+            ],
+        )
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        async with self.connect() as conn:
+            if checkpoint_id:
+                row = await conn.fetchrow(
+                    f"SELECT * FROM {CHECKPOINTS_TABLE} "  # noqa: S608
+                    "WHERE thread_id = $1 AND checkpoint_ns = $2 AND checkpoint_id = $3",
+                    thread_id, checkpoint_ns, checkpoint_id,
+                )
+            else:
+                row = await conn.fetchrow(
+                    f"SELECT * FROM {CHECKPOINTS_TABLE} "  # noqa: S608
+                    "WHERE thread_id = $1 AND checkpoint_ns = $2 "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    thread_id, checkpoint_ns,
+                )
+            if row is None:
+                return None
+            writes = await conn.fetch(
+                f"SELECT task_id, channel, type, value FROM {WRITES_TABLE} "  # noqa: S608
+                "WHERE thread_id = $1 AND checkpoint_ns = $2 AND checkpoint_id = $3 "
+                "ORDER BY task_id, idx",
+                thread_id, checkpoint_ns, row["checkpoint_id"],
+            )
+        return self._tuple(row, writes)
+
+    async def alist(
+            self,
+            config: RunnableConfig | None,
+            *,
+            filter: dict[str, Any] | None = None,  # noqa: A002
+            before: RunnableConfig | None = None,
+            limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        clauses, params = [], []
+        configurable = (config or {}).get("configurable", {})
+        for column in ("thread_id", "checkpoint_ns", "checkpoint_id"):
+            if configurable.get(column) is not None:
+                params.append(configurable[column])
+                clauses.append(f"{column} = ${len(params)}")
+        if filter:
+            params.append(json.dumps(filter))
+            clauses.append(f"metadata @> ${len(params)}::jsonb")
+        if before is not None:
+            params.append(get_checkpoint_id(before))
+            clauses.append(f"checkpoint_id < ${len(params)}")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit_sql = f"LIMIT {int(limit)}" if limit else ""
+        # Строки читаются целиком, чтобы не держать соединение из пула между итерациями
+        async with self.connect() as conn:
+            rows = await conn.fetch(
+                f"SELECT * FROM {CHECKPOINTS_TABLE} {where} "  # noqa: S608
+                f"ORDER BY checkpoint_id DESC {limit_sql}",
+                *params,
+            )
+            writes = await conn.fetch(
+                f"SELECT * FROM {WRITES_TABLE} "  # noqa: S608
+                "WHERE (thread_id, checkpoint_ns, checkpoint_id) IN ("
+                "SELECT * FROM unnest($1::text[], $2::text[], $3::text[])"
+                ") ORDER BY task_id, idx",
+                [row["thread_id"] for row in rows],
+                [row["checkpoint_ns"] for row in rows],
+                [row["checkpoint_id"] for row in rows],
+            ) if rows else []
+        writes_by_checkpoint: dict[tuple[str, str, str], list[asyncpg.Record]] = {}
+        for write in writes:
+            key = (write["thread_id"], write["checkpoint_ns"], write["checkpoint_id"])
+            writes_by_checkpoint.setdefault(key, []).append(write)
+        for row in rows:
+            key = (row["thread_id"], row["checkpoint_ns"], row["checkpoint_id"])
+            yield self._tuple(row, writes_by_checkpoint.get(key, []))
+
+    async def aput(
+            self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions,  # noqa: ARG002
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_type, serialized = self.serde.dumps_typed(checkpoint)
+        async with self.connect() as conn:
+            await conn.execute(
+                f"{INSERT_CHECKPOINT} ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id) "
+                "DO UPDATE SET parent_checkpoint_id = EXCLUDED.parent_checkpoint_id, "
+                "type = EXCLUDED.type, checkpoint = EXCLUDED.checkpoint, "
+                "metadata = EXCLUDED.metadata",
+                thread_id,
+                checkpoint_ns,
+                checkpoint["id"],
+                config["configurable"].get("checkpoint_id"),
+                checkpoint_type,
+                serialized,
+                json.dumps(get_checkpoint_metadata(config, metadata), ensure_ascii=False),
+            )
+        return _config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    async def aput_writes(
+            self,
+            config: RunnableConfig,
+            writes: Sequence[tuple[str, Any]],
+            task_id: str,
+            task_path: str = "",  # noqa: ARG002
+    ) -> None:
+        # Специальные каналы (ошибки, прерывания) перезаписываются, обычные пишутся один раз
+        conflict = (
+            "DO UPDATE SET channel = EXCLUDED.channel, type = EXCLUDED.type, "
+            "value = EXCLUDED.value"
+            if all(channel in WRITES_IDX_MAP for channel, _ in writes)
+            else "DO NOTHING"
+        )
+        configurable = config["configurable"]
+        rows = [
+            (
+                configurable["thread_id"],
+                configurable.get("checkpoint_ns", ""),
+                configurable["checkpoint_id"],
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self.serde.dumps_typed(value),
+            )
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        async with self.connect() as conn:
+            await conn.executemany(
+                f"{INSERT_WRITE} ON CONFLICT "
+                f"(thread_id, checkpoint_ns, checkpoint_id, task_id, idx) {conflict}",
+                rows,
+            )
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        async with self.connect() as conn, conn.transaction():
+            for table in (WRITES_TABLE, CHECKPOINTS_TABLE):
+                await conn.execute(f"DELETE FROM {table} WHERE thread_id = $1", thread_id)  # noqa: S608
+
+    async def copy_rows(
+            self, checkpoints: Sequence[tuple[Any, ...]], writes: Sequence[tuple[Any, ...]]
+    ) -> None:
+        """Перенос уже сериализованных строк (например, из SQLite), существующие пропускаются.
+
+        :param checkpoints: Строки в порядке столбцов `INSERT_CHECKPOINT`.
+        :param writes: Строки в порядке столбцов `INSERT_WRITE`.
+        """
+
+        async with self.connect() as conn, conn.transaction():
+            if checkpoints:
+                await conn.executemany(f"{INSERT_CHECKPOINT} ON CONFLICT DO NOTHING", checkpoints)
+            if writes:
+                await conn.executemany(f"{INSERT_WRITE} ON CONFLICT DO NOTHING", writes)
@@ -0,0 +1,200 @@
+# Модуль реализует фоновую консолидацию долговременной памяти пользователей
+
+from typing import Any
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+from pydantic import BaseModel
+
+from src.settings import settings
+from src.utils.metrics import metrics
+
+from ...rag import compact
+from ...rag.store import get_collection, run_in_store
+from .memory import INDEX_NAME, memory_store
+
+logger = logging.getLogger(__name__)
+
+SECONDS_IN_DAY = 24 * 60 * 60
+
+
+class ConsolidationReport(BaseModel):
+    """Итог прохода консолидации"""
+
+    size_before: int = 0
+    size_after: int = 0
+    merged: int = 0
+    expired: int = 0
+    decayed: int = 0
+    forgotten: int = 0
+
+
+def cluster_duplicates(
+        embeddings: Any, order: list[int], similarity_threshold: float
+) -> list[list[int]]:
+    """Жадная кластеризация по косинусной близости.
+    Первый элемент кластера (в порядке `order`) становится его представителем.
+    """
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1, norms)
+    similarity = vectors @ vectors.T
+    clusters: list[list[int]] = []
+    for i in order:
+        for cluster in clusters:
+            if similarity[cluster[0], i] >= similarity_threshold:
+                cluster.append(i)
+                break
+        else:
+            clusters.append([i])
+    return clusters
+
+
+def _consolidate_cluster(
+        ids: list[str],
+        metadatas: list[dict[str, Any]],
+        members: list[int],
+        to_delete: set[str],
+        updates: dict[str, dict[str, Any]],
+        now: int,
+        report: ConsolidationReport,
+) -> None:
+    """Слияние дублей в представителя кластера и ослабление неуверенной записи.
+
+    Слияние подкрепляет запись и обновляет `updated_at`. Ослабление зависит от времени,
+    прошедшего с последнего обновления, а не от числа проходов консолидации.
+    """
+
+    policy = settings.memory
+    representative, *duplicates = members
+    metadata = metadatas[representative]
+    if duplicates:
+        metadata["mentions"] = sum(metadatas[i].get("mentions", 1) for i in members)
+        metadata["created_at"] = max(metadatas[i]["created_at"] for i in members)
+        metadata["updated_at"] = now
+        to_delete.update(ids[i] for i in duplicates)
+        updates[ids[representative]] = metadata
+        report.merged += len(duplicates)
+    confidence = metadata.get("confidence", 0.0)
+    elapsed_days = (now - metadata.get("updated_at", metadata["created_at"])) / SECONDS_IN_DAY
+    if confidence >= policy.low_confidence or elapsed_days <= 0:
+        return
+    confidence *= policy.confidence_decay ** (elapsed_days / policy.confidence_decay_days)
+    metadata["updated_at"] = now
+    if confidence < policy.min_confidence:
+        to_delete.add(ids[representative])
+        report.forgotten += 1
+    else:
+        metadata["confidence"] = round(confidence, 4)
+        updates[ids[representative]] = metadata
+        report.decayed += 1
+
+
+def plan_user_consolidation(
+        ids: list[str],
+        metadatas: list[dict[str, Any]],
+        embeddings: Any,
+        now: int,
+        report: ConsolidationReport,
+) -> tuple[list[str], dict[str, dict[str, Any]]]:
+    """Расчёт изменений памяти одного пользователя.
+
+    :returns: Идентификаторы на удаление и новые метаданные изменённых записей.
+    """
+
+    policy = settings.memory
+    to_delete: set[str] = set()
+    updates: dict[str, dict[str, Any]] = {}
+    metadatas = [dict(metadata or {}) for metadata in metadatas]
+    for i, metadata in enumerate(metadatas):
+        if "created_at" not in metadata:
+            # Записи до введения политики получают отсчёт с первой консолидации
+            metadata["created_at"] = now
+            updates[ids[i]] = metadata
+    alive = []
+    for i, metadata in enumerate(metadatas):
+        age_days = (now - metadata["created_at"]) / SECONDS_IN_DAY
+        if metadata.get("memory_type") == "episodic" and age_days > policy.episodic_ttl_days:
+            to_delete.add(ids[i])
+            report.expired += 1
+        else:
+            alive.append(i)
+    by_type: dict[str, list[int]] = {}
+    for i in alive:
+        by_type.setdefault(metadatas[i].get("memory_type", ""), []).append(i)
+    for positions in by_type.values():
+        # Представителем кластера становится самая уверенная и свежая запись
+        positions.sort(
+            key=lambda i: (metadatas[i].get("confidence", 0.0), metadatas[i]["created_at"]),
+            reverse=True,
+        )
+        local = cluster_duplicates(
+            [embeddings[i] for i in positions],
+            list(range(len(positions))),
+            policy.duplicate_similarity,
+        )
+        for cluster in local:
+            _consolidate_cluster(
+                ids, metadatas, [positions[j] for j in cluster], to_delete, updates, now, report
+            )
+    return list(to_delete), {
+        doc_id: metadata for doc_id, metadata in updates.items() if doc_id not in to_delete
+    }
+
+
+async def consolidate_memory() -> ConsolidationReport:
+    """Проход консолидации по памяти всех пользователей:
+    слияние дублей, ослабление неуверенных записей и удаление устаревших эпизодов.
+    """
+
+    start_time = time.monotonic()
+    now = int(time.time())
+    collection = await get_collection(INDEX_NAME)
+    report = ConsolidationReport(size_before=await run_in_store("count", collection.count))
+    result = await run_in_store("get", collection.get, include=["metadatas"])
+    user_ids = {metadata["user_id"] for metadata in result["metadatas"] if metadata}
+    for user_id in user_ids:
+        result = await compact.get(
+            collection,
+            where={"user_id": user_id},
+            include=["metadatas", "embeddings"],
+        )
+        if not result["ids"]:
+            continue
+        to_delete, updates = plan_user_consolidation(
+            result["ids"], result["metadatas"], result["embeddings"], now, report
+        )
+        if to_delete:
+            await compact.delete(collection, to_delete)
+        if updates:
+            await run_in_store(
+                "update", collection.update, ids=list(updates), metadatas=list(updates.values())
+            )
+        if to_delete or updates:
+            # Другие воркеры перечитают память пользователя по истечении `memory_cache_ttl`
+            memory_store.invalidate(user_id)
+    report.size_after = await run_in_store("count", collection.count)
+    metrics.increment("memory.consolidation.removed", report.size_before - report.size_after)
+    logger.info(
+        "Memory consolidated in %s seconds, size %s -> %s: %s",
+        round(time.monotonic() - start_time, 2),
+        report.size_before, report.size_after, report.model_dump()
+    )
+    return report
+
+
+async def run_memory_consolidation(
+        interval: float = settings.memory.consolidation_interval
+) -> None:
+    """Периодическая консолидация памяти (запускается задачей на время жизни приложения)"""
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await consolidate_memory()
+        except Exception:
+            logger.exception("Memory consolidation failed")
@@ -3,10 +3,13 @@
 from typing import Any, Literal
 
 import logging
+import time
 
 from langchain.tools import ToolRuntime, tool
 from pydantic import BaseModel, Field, NonNegativeFloat
 
+from src.settings import MEMORY_QUEUE_PATH, settings
+
 from ... import rag
 from ..schemas import UserContext
 
@@ -16,6 +19,23 @@ MemoryType = Literal["facts", "episodic", "semantic"]
 
 logger = logging.getLogger(__name__)
 
+# Память одного пользователя - десятки фактов, точный поиск по ним дешевле HNSW запроса
+memory_store = rag.ExactStore(
+    INDEX_NAME,
+    partition_key="user_id",
+    max_partitions=settings.rag.memory_cache_users,
+    max_age=settings.rag.memory_cache_ttl,
+)
+# Матрицы в памяти построены на эмбеддингах старой модели
+rag.reembedding.on_cutover(memory_store.invalidate)
+# Запись воспоминаний не блокирует ответ агента, очередь видна поиску до записи
+memory_queue = rag.WriteBehindQueue(
+    memory_store,
+    path=MEMORY_QUEUE_PATH,
+    batch_size=settings.memory.write_batch_size,
+    flush_interval=settings.memory.write_interval,
+)
+
 
 class RememberInput(BaseModel):
     """Входные аргументы для запоминания информации"""
@@ -75,14 +95,14 @@ async def remember(
         "Remembering [%s] information (conf=%.2f): '%s ...'",
         memory_type, confidence, text[:100]
     )
-    await rag.index_document(
-        index_name=INDEX_NAME,
-        text=text,
+    await memory_queue.enqueue(
+        runtime.context.user_id,
+        document=text,
         metadata={
-            "user_id": runtime.context.user_id,
             "memory_type": memory_type,
             "confidence": confidence,
-        }
+            "created_at": int(time.time()),
+        },
     )
 
 
@@ -135,12 +155,43 @@ async def search_memory(
         runtime: ToolRuntime[UserContext], query: str, memory_type: MemoryType
 ) -> str:
     logger.info("Searching [%s] memory for query: '%s ...'", memory_type, query[:100])
-    docs = await rag.retrieve_documents(
-        index_name=INDEX_NAME,
-        query=query,
-        metadata_filter={
-            "$and": [{"user_id": runtime.context.user_id}, {"memory_type": memory_type}]
-        },
-        format_result_func=format_result,
+    [hits] = await memory_queue.search_many(
+        runtime.context.user_id, [query], metadata_filter={"memory_type": memory_type}
+    )
+    return "\n\n".join(format_result(hit.document, hit.metadata, hit.distance) for hit in hits)
+
+
+class BatchSearchMemoryInput(BaseModel):
+    """Входные аргументы для поиска релевантной памяти по нескольким запросам"""
+
+    queries: list[str] = Field(
+        min_length=1,
+        max_length=10,
+        description="Естественно-языковые запросы, каждый про отдельную потребность",
+    )
+    memory_type: MemoryType = Field(
+        description="В какой категории памяти искать: 'facts', 'episodic' или 'semantic'"
+    )
+
+
+@tool(
+    "batch_search_memory",
+    description="""\
+    Ищет в долговременной памяти пользователя сразу по нескольким запросам.
+    Используй вместо нескольких вызовов search_memory подряд.
+    """,
+    args_schema=BatchSearchMemoryInput,
+)
+async def batch_search_memory(
+        runtime: ToolRuntime[UserContext], queries: list[str], memory_type: MemoryType
+) -> str:
+    logger.info("Searching [%s] memory for %s queries", memory_type, len(queries))
+    hits_per_query = await memory_queue.search_many(
+        runtime.context.user_id, queries, metadata_filter={"memory_type": memory_type}
+    )
+    return "\n\n".join(
+        f"## Запрос: {query}\n\n" + "\n\n".join(
+            format_result(hit.document, hit.metadata, hit.distance) for hit in hits
+        )
+        for query, hits in zip(queries, hits_per_query, strict=True)
     )
-    return "\n\n".join(docs)
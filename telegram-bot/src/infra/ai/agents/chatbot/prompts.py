@@ -43,8 +43,11 @@ SYSTEM_PROMPT = """\
 4. Используй доступные инструменты, когда это действительно нужно:
    • get_current_module_context — чтобы получить контекст текущего модуля студента
    • knowledge_search — выполняет поиск информации в материалах курса
+   • batch_knowledge_search — поиск в материалах курса сразу по нескольким запросам
    • remember — для запоминания полезной информации о студенте
    • search_memory - поиск информации о студента в твоей памяти
+   • batch_search_memory - поиск в твоей памяти сразу по нескольким запросам
+   Если нужно несколько поисков — делай один batch-вызов вместо нескольких одиночных.
 
 5. Не злоупотребляй инструментами. Сначала попробуй ответить на основе знаний и контекста диалога.
 
@@ -59,12 +62,15 @@ SYSTEM_PROMPT = """\
 • «Не переживай, это нормально на данном этапе»
 • «Смотри, если сделать вот так — станет понятнее»
 
-Текущая дата: {current_date}
-
 Ты — не преподаватель, а именно помощник. Твоя цель — чтобы студент сам разобрался
 и почувствовал уверенность.
 """
 
+# Изменчивая часть промпта идёт после статичной, чтобы не сбивать кэш префикса у провайдера
+CURRENT_DATE_PROMPT = """
+
+Текущая дата: {current_date}"""
+
 SUMMARY_PROMPT = """\
 Ты выполняешь суммаризацию диалога между студентом и ассистентом курса.
 Проанализируй представленный обмен сообщениями и составь краткое резюме, которое:
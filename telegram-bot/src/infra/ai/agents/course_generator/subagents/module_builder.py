@@ -13,10 +13,11 @@ from pydantic import BaseModel, Field
 
 from src.core.entities.course import AssignmentType, Module
 from src.settings import settings
-from src.utils.formatting import get_content_blocks_context, get_module_context
+from src.utils.formatting import get_module_context
 
-from .... import rag
+from ....utils import prompt_cache_usage
 from ...schemas import CourseContext, GeneratedContentType
+from ..theory_index import index_module_theory
 from .practician import call_practice_agent
 from .theorist import call_theory_agent
 
@@ -35,6 +36,7 @@ model = ChatOpenAI(
     base_url=settings.deepseek.base_url,
     model=settings.deepseek.deepseek_chat,
     temperature=0.3,
+    callbacks=[prompt_cache_usage],
 )
 
 
@@ -163,15 +165,7 @@ async def generate_content_blocks(state: AgentState) -> dict[str, Module]:
     logger.info(
         "Saving generated content blocks of `%s` module to knowledge base ...", module.title
     )
-    rag.indexing(
-        text=get_content_blocks_context(module.content_blocks),
-        metadata={
-            "tenant_id": state["course_context"].course_id,
-            "module_id": f"{module.id}",
-            "source": f"{module.title}",
-            "category": "theory"
-        }
-    )
+    await index_module_theory(state["course_context"].course_id, module)
     return {"module": module}
 
 
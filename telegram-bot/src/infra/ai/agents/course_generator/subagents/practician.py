@@ -14,7 +14,9 @@ from src.core.entities.course import (
     Module,
 )
 from src.settings import settings
-from src.utils.formatting import get_module_context
+from src.utils.context_cache import module_context_cache
+
+from ....utils import prompt_cache_usage
 
 logger = logging.getLogger(__name__)
 
@@ -145,6 +147,7 @@ model = ChatOpenAI(
     base_url=settings.deepseek.base_url,
     model=settings.deepseek.deepseek_chat,
     temperature=0.2,
+    callbacks=[prompt_cache_usage],
 )
 
 config = {
@@ -171,7 +174,7 @@ async def call_practice_agent(assignment_type: AssignmentType, module: Module) -
     prompt_template = (
         "## Теоретический материал пройденного модуля:\n\n"
         "<THEORY>"
-        f"{get_module_context(module)}\n"
+        f"{module_context_cache.render(module)}\n"
         f"</THEORY>"
     )
     result = await agent.ainvoke({"messages": [("human", prompt_template)]})
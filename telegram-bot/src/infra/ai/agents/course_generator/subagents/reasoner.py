@@ -12,9 +12,10 @@ from pydantic import BaseModel, Field
 
 from src.settings import settings
 
+from ....utils import prompt_cache_usage
 from ...schemas import GenerationContext
 from ...tools import browse_page, web_search
-from ..tools import knowledge_search, save_knowledge
+from ..tools import batch_knowledge_search, knowledge_search, save_knowledge
 
 logger = logging.getLogger(__name__)
 
@@ -24,11 +25,6 @@ REASONER_PROMPT = """\
 включая цели, модули, ключевые темы, практические задания, типичные ошибки
 и методические рекомендации.
 
-ЗАПРОС ПРЕПОДАВАТЕЛЯ:
-{prompt}
-
-В этом запросе содержится описание темы, целевой аудитории, возможные пожелания и ограничения.
-
 У тебя есть два инструмента:
 1. **call_researcher_agent** — вызвать агента-исследователя для глубокого изучения предметной
    области, материалов преподавателя или педагогических подходов. Передай ему конкретный запрос
@@ -106,6 +102,10 @@ REASONER_PROMPT = """\
 который будет на его основе генерировать контент курса.
 Опирайся на лучшие педагогические практики: таксономию Блума, принципы микрообучения,
 активное вовлечение.
+
+ЗАПРОС ПРЕПОДАВАТЕЛЯ (содержит описание темы, целевой аудитории, возможные пожелания
+и ограничения):
+{prompt}
 """
 
 RESEARCHER_PROMPT = """\
@@ -117,7 +117,8 @@ RESEARCHER_PROMPT = """\
 1. **knowledge_search** — поиск по материалам преподавателя (документы,
    загруженные в его рабочий кабинет). Всегда начинай с этого инструмента,
    так как материалы преподавателя наиболее релевантны (для поиска по материалам преподавателя
-   используй category = 'data').
+   используй category = 'data'). Если нужно найти несколько разных аспектов,
+   используй **batch_knowledge_search** с несколькими запросами за один вызов.
 2. **web_search** — поиск в интернете. Используй, если knowledge_search не дал достаточно
    информации или нужны свежие данные, примеры из практики, исследования.
 3. **browse_page** — детальное чтение веб-страницы. Используй после web_search,
@@ -163,7 +164,7 @@ CRITIC_PROMPT = """\
 - Ясность и логичность структуры.
 - Потенциальные сложности для учеников и преподавателя.
 
-Тебе доступен комментарий преподавателя (он будет в контексте)
+Тебе доступен комментарий преподавателя (он приведён в конце)
 и текущий план курса (в истории сообщений). Проанализируй их и подготовь список замечаний
 и рекомендаций.
 
@@ -177,6 +178,9 @@ CRITIC_PROMPT = """\
 Формат ответа: перечень замечаний и предложений в виде маркированного списка.
 Каждый пункт начинается с проблемной области (например, «Целевая аудитория: ...»)
 и содержит рекомендацию.
+
+КОММЕНТАРИЙ ПРЕПОДАВАТЕЛЯ:
+{prompt}
 """
 
 # model = ChatOpenAI(
@@ -192,6 +196,7 @@ model = ChatOpenAI(
     base_url=settings.deepseek.base_url,
     model=settings.deepseek.deepseek_chat,
     temperature=0.2,
+    callbacks=[prompt_cache_usage],
 )
 
 
@@ -218,7 +223,7 @@ async def call_researcher_agent(runtime: ToolRuntime[GenerationContext], task: s
     researcher_agent = create_agent(
         model=model,
         system_prompt=RESEARCHER_PROMPT,
-        tools=[knowledge_search, web_search, browse_page, save_knowledge],
+        tools=[knowledge_search, batch_knowledge_search, web_search, browse_page, save_knowledge],
         middleware=[
             ToolCallLimitMiddleware(
                 tool_name="web_search", run_limit=2, thread_limit=4
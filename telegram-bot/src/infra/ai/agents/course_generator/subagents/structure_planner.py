@@ -7,6 +7,8 @@ from pydantic import BaseModel, Field
 
 from src.settings import settings
 
+from ....utils import prompt_cache_usage
+
 SYSTEM_PROMPT = """\
 ## Роль
 Ты профессиональный методист (педагогический дизайнер), который проектирует логику обучения,
@@ -44,6 +46,7 @@ model = ChatOpenAI(
     base_url=settings.deepseek.base_url,
     model=settings.deepseek.deepseek_chat,
     temperature=0.5,
+    callbacks=[prompt_cache_usage],
 )
 
 
@@ -18,6 +18,7 @@ from src.core.entities.course import (
 )
 from src.settings import settings
 
+from ....utils import prompt_cache_usage
 from ...schemas import CourseContext, GeneratedContentType
 from ..tools import knowledge_search
 
@@ -106,6 +107,7 @@ model = ChatOpenAI(
     base_url=settings.deepseek.base_url,
     model=settings.deepseek.deepseek_chat,
     temperature=0.2,
+    callbacks=[prompt_cache_usage],
 )
 
 config = {
@@ -0,0 +1,155 @@
+# Модуль реализует инкрементальную индексацию теоретического материала курса
+
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from src.core.entities.course import AnyContentBlock, Course, Module
+from src.utils.formatting import get_content_block_context
+from src.utils.metrics import metrics
+
+from ... import rag
+from ...rag.store import get_collection, run_in_store
+from .tools import get_course_index_name
+
+logger = logging.getLogger(__name__)
+
+# Ключ метаданных чанка с хэшем контент блока, из которого он получен
+BLOCK_HASH_KEY = "block_hash"
+
+# Синхронизации теории одного курса выполняются по очереди
+_course_locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+# Последняя сохранённая версия курса, ожидающая синхронизации
+_pending_courses: dict[str, Course] = {}
+
+
+class TheoryIndexReport(BaseModel):
+    """Итог синхронизации теории курса с базой знаний"""
+
+    blocks_total: int = 0
+    blocks_unchanged: int = 0
+    blocks_indexed: int = 0
+    blocks_removed: int = 0
+    chunks_deleted: int = 0
+
+    @property
+    def avoided_ratio(self) -> float:
+        """Доля блоков, которые не пришлось векторизовать заново"""
+
+        return self.blocks_unchanged / self.blocks_total if self.blocks_total else 1.0
+
+
+def hash_content_block(module: Module, content_block: AnyContentBlock) -> str:
+    """Хэш контента блока (вместе с названием модуля, которое попадает в текст чанков)"""
+
+    payload = f"{module.title}\n{content_block.model_dump_json()}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+async def _load_manifest(
+        index_name: str, modules: list[Module], prune_modules: bool
+) -> dict[tuple[str | None, str | None], list[str]]:
+    """Манифест уже проиндексированной теории: (id модуля, хэш блока) -> id чанков.
+
+    Чанки, записанные до появления хэшей блоков, могут не иметь `module_id`,
+    такие чанки относятся к модулю по названию в `source`, чтобы первая
+    синхронизация модуля заменила их, а не добавила новые рядом. Теория без модуля,
+    сохранённая агентом через `save_knowledge`, в манифест не попадает и не удаляется.
+    """
+
+    collection = await get_collection(index_name)
+    result = await run_in_store(
+        "get", collection.get, where={"category": "theory"}, include=["metadatas"]
+    )
+    module_ids = {module.title: str(module.id) for module in modules}
+    manifest: dict[tuple[str | None, str | None], list[str]] = {}
+    for doc_id, metadata in zip(result["ids"], result["metadatas"], strict=True):
+        module_id = metadata.get("module_id")
+        if module_id is None and BLOCK_HASH_KEY not in metadata:
+            module_id = module_ids.get(metadata.get("source"))
+        if module_id is None or (not prune_modules and module_id not in module_ids.values()):
+            continue
+        manifest.setdefault((module_id, metadata.get(BLOCK_HASH_KEY)), []).append(doc_id)
+    return manifest
+
+
+async def _sync_theory(
+        course_id: UUID | str, modules: list[Module], prune_modules: bool = False
+) -> TheoryIndexReport:
+    """Синхронизация теории модулей с базой знаний курса, вызывается под блокировкой курса.
+
+    Векторизуются только новые и изменённые блоки, чанки удалённых
+    и изменённых блоков удаляются, неизменённые остаются как есть.
+
+    :param course_id: Идентификатор курса.
+    :param modules: Актуальные модули.
+    :param prune_modules: Удалять теорию модулей, которых больше нет в `modules`.
+    :returns: Отчёт о выполненной и сэкономленной работе.
+    """
+
+    index_name = get_course_index_name(course_id)
+    manifest = await _load_manifest(index_name, modules, prune_modules)
+    wanted = {
+        (str(module.id), hash_content_block(module, content_block)): (module, content_block)
+        for module in modules
+        for content_block in module.content_blocks
+    }
+    report = TheoryIndexReport(blocks_total=len(wanted))
+    for (module_id, block_hash), (module, content_block) in wanted.items():
+        if (module_id, block_hash) in manifest:
+            report.blocks_unchanged += 1
+            continue
+        await rag.index_document(
+            index_name=index_name,
+            text=f"# {module.title}\n\n{get_content_block_context(content_block)}",
+            metadata={
+                "tenant_id": str(course_id),
+                "module_id": module_id,
+                "source": module.title,
+                "category": "theory",
+                BLOCK_HASH_KEY: block_hash,
+            },
+        )
+        report.blocks_indexed += 1
+    # Старые чанки удаляются после записи новых, чтобы поиск не оставался без теории
+    stale = [key for key in manifest if key not in wanted]
+    report.blocks_removed = len(stale)
+    stale_ids = [doc_id for key in stale for doc_id in manifest[key]]
+    report.chunks_deleted = len(stale_ids)
+    await rag.delete_documents(index_name, stale_ids)
+    metrics.increment("rag.theory.blocks_indexed", report.blocks_indexed)
+    metrics.increment("rag.theory.blocks_unchanged", report.blocks_unchanged)
+    logger.info(
+        "Synced theory of course `%s`: %s, %.0f%% of blocks reused",
+        course_id, report.model_dump(), report.avoided_ratio * 100
+    )
+    return report
+
+
+async def index_module_theory(course_id: UUID | str, module: Module) -> TheoryIndexReport:
+    """Индексация теории одного модуля (например, сразу после генерации)"""
+
+    async with _course_locks[str(course_id)]:
+        return await _sync_theory(course_id, [module])
+
+
+async def sync_course_theory(course: Course) -> TheoryIndexReport | None:
+    """Синхронизация теории всего курса после его изменения.
+
+    Фоновые синхронизации одного курса не пересекаются, и каждая берёт последнюю
+    сохранённую версию курса: опоздавшая задача не вернёт индекс к старой версии.
+
+    :returns: Отчёт или `None`, если эту версию уже синхронизировала предыдущая задача.
+    """
+
+    course_id = str(course.id)
+    _pending_courses[course_id] = course
+    async with _course_locks[course_id]:
+        course = _pending_courses.pop(course_id, None)
+        if course is None:
+            return None
+        return await _sync_theory(course.id, course.modules, prune_modules=True)
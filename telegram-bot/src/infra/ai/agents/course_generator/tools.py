@@ -1,6 +1,7 @@
-from typing import Literal
+from typing import Any, Literal
 
 import logging
+from uuid import UUID
 
 from langchain.tools import ToolRuntime, tool
 from pydantic import BaseModel, Field, NonNegativeFloat
@@ -13,6 +14,18 @@ INDEX_NAME = "main-index"
 logger = logging.getLogger(__name__)
 
 
+def get_course_index_name(course_id: UUID | str) -> str:
+    """Знания каждого курса хранятся в отдельной партиции (коллекции) индекса"""
+
+    return rag.partition_name(INDEX_NAME, course_id)
+
+
+async def purge_course_knowledge(course_id: UUID | str) -> None:
+    """Удаление всей базы знаний курса одной операцией"""
+
+    await rag.drop_index(get_course_index_name(course_id))
+
+
 class SaveKnowledgeInput(BaseModel):
     """Аргументы для сохранения знаний"""
 
@@ -55,14 +68,15 @@ async def save_knowledge(
         category, source, score, text[:150]
     )
     await rag.index_document(
-        index_name=INDEX_NAME,
+        index_name=get_course_index_name(runtime.context.course_id),
         text=text,
         metadata={
             "tenant_id": str(runtime.context.course_id),
             "source": source,
             "category": category,
             "score": score,
-        }
+        },
+        dedup_by="tenant_id",
     )
 
 
@@ -75,6 +89,12 @@ class KnowledgeSearchInput(BaseModel):
     ] | None = Field(default=None, description="Тип информации, который нужно найти")
 
 
+def _build_knowledge_filter(
+        category: Literal["data", "web_research", "theory"] | None = None
+) -> dict[str, Any] | None:
+    return None if category is None else {"category": category}
+
+
 @tool(
     "knowledge_search",
     description="Поиск информации в базе знаний курса",
@@ -85,18 +105,56 @@ async def knowledge_search(
         search_query: str,
         category: Literal["data", "web_research", "theory"] | None = None
 ) -> str:
-    meta_filter = {}
-    tenant_filter = {"tenant_id": str(runtime.context.course_id)}
     if category is not None:
         logger.info(
             "Searching knowledge by category - `%s` and query: '%s ...'",
             category, search_query[:100]
         )
-        meta_filter["$and"] = [tenant_filter, {"category": category}]
     else:
         logger.info("Searching knowledge by query `%s`", search_query[:100])
-        meta_filter.update(**tenant_filter)
-    docs = await rag.retrieve_documents(
-        index_name=INDEX_NAME, query=search_query, metadata_filter=meta_filter
+    docs = await rag.retrieve_context(
+        index_name=get_course_index_name(runtime.context.course_id),
+        query=search_query,
+        metadata_filter=_build_knowledge_filter(category),
+        hybrid=True,
     )
     return "\n\n".join(docs)
+
+
+class BatchKnowledgeSearchInput(BaseModel):
+    search_queries: list[str] = Field(
+        min_length=1, max_length=10, description="Запросы для поиска информации"
+    )
+    category: Literal[
+        "data",
+        "web_research",
+        "theory"
+    ] | None = Field(default=None, description="Тип информации, который нужно найти")
+
+
+@tool(
+    "batch_knowledge_search",
+    description="""\
+    Поиск информации в базе знаний курса сразу по нескольким запросам.
+    Используй вместо нескольких вызовов knowledge_search подряд.
+    """,
+    args_schema=BatchKnowledgeSearchInput,
+)
+async def batch_knowledge_search(
+        runtime: ToolRuntime[CourseContext],
+        search_queries: list[str],
+        category: Literal["data", "web_research", "theory"] | None = None
+) -> str:
+    logger.info(
+        "Searching knowledge by category - `%s` and %s queries", category, len(search_queries)
+    )
+    docs_per_query = await rag.retrieve_context_many(
+        index_name=get_course_index_name(runtime.context.course_id),
+        queries=search_queries,
+        metadata_filter=_build_knowledge_filter(category),
+        hybrid=True,
+    )
+    return "\n\n".join(
+        f"## Запрос: {search_query}\n\n" + "\n\n".join(docs)
+        for search_query, docs in zip(search_queries, docs_per_query, strict=True)
+    )
@@ -12,7 +12,9 @@ from src.core.entities.course import (
     TestType,
 )
 from src.settings import settings
-from src.utils.formatting import get_module_context
+from src.utils.context_cache import module_context_cache
+
+from ..utils import prompt_cache_usage
 
 # model = ChatOpenAI(
 #     api_key=settings.yandexcloud.api_key,
@@ -27,6 +29,7 @@ model = ChatOpenAI(
     base_url=settings.deepseek.base_url,
     model=settings.deepseek.deepseek_chat,
     temperature=0.2,
+    callbacks=[prompt_cache_usage],
 )
 
 config = {
@@ -75,7 +78,7 @@ async def call_knowledge_tester(test_type: TestType, module: Module) -> AnyKnowl
     prompt_template = (
         "## Теоретический материал пройденного модуля:\n\n"
         "<THEORY>"
-        f"{get_module_context(module)}\n"
+        f"{module_context_cache.render(module)}\n"
         f"</THEORY>"
     )
     result = await agent.ainvoke({"messages": [("human", prompt_template)]})
@@ -62,3 +62,11 @@ class UserContext(BaseModel):
 
 class StudentContext(CourseContext, UserContext):
     """Контекстная информация студента для взаимодействия с чат-ботом"""
+
+
+class ChatbotEvent(BaseModel):
+    """Событие потокового ответа чат-бота"""
+
+    type: Literal["token", "tool_start", "tool_end", "done", "error"]
+    text: str = ""  # Фрагмент ответа для `token`, полный ответ для `done`
+    tool: str | None = None  # Название инструмента для `tool_start` и `tool_end`
@@ -9,6 +9,8 @@ from src.core.entities.course import DetailedAnswerTest
 from src.settings import settings
 from src.utils.formatting import prepare_test_for_checking
 
+from ..utils import prompt_cache_usage
+
 # model = ChatOpenAI(
 #     api_key=settings.yandexcloud.api_key,
 #     model=settings.yandexcloud.qwen3_235b,
@@ -21,6 +23,7 @@ model = ChatOpenAI(
     base_url=settings.deepseek.base_url,
     model=settings.deepseek.deepseek_chat,
     temperature=0.2,
+    callbacks=[prompt_cache_usage],
 )
 
 SYSTEM_PROMPT = """\
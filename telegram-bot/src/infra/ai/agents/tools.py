@@ -13,6 +13,7 @@ from src.infra.intergrations import rutube, yandex_web_search
 from src.settings import settings
 from src.utils.browser_automation import get_page_text
 
+from ..utils import prompt_cache_usage
 from .prompts import CODER_PROMPT, MERMAID_PROMPT
 
 logger = logging.getLogger(__name__)
@@ -75,7 +76,8 @@ async def draw_mermaid(prompt: str) -> str:
         model=settings.yandexcloud.qwen3_235b,
         base_url=settings.yandexcloud.base_url,
         temperature=0.3,
-     )
+        callbacks=[prompt_cache_usage],
+    )
     chain = (
         ChatPromptTemplate.from_messages([
             ("system", MERMAID_PROMPT), MessagesPlaceholder("messages")
@@ -104,6 +106,7 @@ async def write_code(language: str, prompt: str) -> str:
         temperature=0.2,
         max_tokens=3000,
         max_retries=3,
+        callbacks=[prompt_cache_usage],
     )
     chain = ChatPromptTemplate.from_template(CODER_PROMPT) | model | StrOutputParser()
     return await chain.ainvoke({"language": language, "prompt": prompt})
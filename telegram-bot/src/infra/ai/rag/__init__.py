@@ -0,0 +1,39 @@
+__all__ = [
+    "ExactStore",
+    "WriteBehindQueue",
+    "client",
+    "delete_documents",
+    "drop_index",
+    "embedding_batcher",
+    "embedding_cache",
+    "embedding_client",
+    "export_snapshot",
+    "get_embeddings",
+    "import_snapshot",
+    "index_document",
+    "partition_name",
+    "reembedding",
+    "rescore_vectors",
+    "retrieve_context",
+    "retrieve_context_many",
+    "retrieve_documents",
+    "retrieve_documents_many",
+]
+
+from .cache import embedding_cache
+from .compact import rescore_vectors
+from .documents import (
+    delete_documents,
+    drop_index,
+    index_document,
+    retrieve_context,
+    retrieve_context_many,
+    retrieve_documents,
+    retrieve_documents_many,
+)
+from .embeddings import embedding_batcher, embedding_client, get_embeddings
+from .exact import ExactStore
+from .migration import reembedding
+from .snapshot import export_snapshot, import_snapshot
+from .store import client, partition_name
+from .write_behind import WriteBehindQueue
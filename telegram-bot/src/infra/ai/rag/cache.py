@@ -0,0 +1,170 @@
+# Модуль реализует персистентный контентно-адресуемый кэш эмбеддингов
+
+import asyncio
+import hashlib
+import logging
+import time
+from array import array
+from pathlib import Path
+
+import aiosqlite
+
+from src.settings import EMBEDDINGS_CACHE_PATH, settings
+
+logger = logging.getLogger(__name__)
+
+# Ограничение SQLite на количество параметров в одном запросе
+MAX_QUERY_PARAMS = 500
+
+
+def _hash_text(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def _to_blob(embedding: list[float]) -> bytes:
+    return array("f", embedding).tobytes()
+
+
+def _from_blob(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """Дисковый кэш эмбеддингов в SQLite с вытеснением по LRU.
+
+    Ключ - (идентификатор модели, SHA-256 текста), значение - float32 вектор.
+    """
+
+    def __init__(self, path: Path, model_id: str, max_entries: int = 100_000) -> None:
+        self.path = path
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: aiosqlite.Connection | None = None
+        self._size = 0
+        self._lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        """Открытие соединения и создание таблицы кэша"""
+
+        async with self._lock:
+            if self._conn is not None:
+                return
+            self._conn = await aiosqlite.connect(self.path)
+            await self._conn.execute("PRAGMA journal_mode=WAL")
+            await self._conn.execute("PRAGMA synchronous=NORMAL")
+            await self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                    model_id TEXT NOT NULL,
+                    text_hash BLOB NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model_id, text_hash)
+                )"""
+            )
+            await self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+            await self._conn.commit()
+            async with self._conn.execute("SELECT COUNT(*) FROM embeddings") as cursor:
+                (self._size,) = await cursor.fetchone()
+        logger.info("Embedding cache opened at `%s`, %s entries", self.path, self._size)
+
+    async def close(self) -> None:
+        """Закрытие соединения с кэшем"""
+
+        if self._conn is None:
+            return
+        await self._conn.close()
+        self._conn = None
+        logger.info("Embedding cache closed, stats: %s", self.stats)
+
+    async def _get_conn(self) -> aiosqlite.Connection:
+        if self._conn is None:
+            await self.open()
+        return self._conn
+
+    @property
+    def stats(self) -> dict[str, float]:
+        """Счётчики попаданий и промахов"""
+
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    async def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        """Поиск эмбеддингов в кэше.
+
+        :param texts: Тексты для поиска.
+        :returns: Эмбеддинги в порядке текстов, `None` для промахов.
+        """
+
+        conn = await self._get_conn()
+        hashes = [_hash_text(text) for text in texts]
+        found: dict[bytes, list[float]] = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique_hashes), MAX_QUERY_PARAMS):
+            chunk = unique_hashes[i:i + MAX_QUERY_PARAMS]
+            placeholders = ", ".join("?" * len(chunk))
+            async with conn.execute(
+                "SELECT text_hash, vector FROM embeddings "  # noqa: S608
+                f"WHERE model_id = ? AND text_hash IN ({placeholders})",
+                (self.model_id, *chunk),
+            ) as cursor:
+                found.update({text_hash: _from_blob(blob) async for text_hash, blob in cursor})
+        if found:
+            found_hashes = list(found)
+            for i in range(0, len(found_hashes), MAX_QUERY_PARAMS):
+                chunk = found_hashes[i:i + MAX_QUERY_PARAMS]
+                placeholders = ", ".join("?" * len(chunk))
+                await conn.execute(
+                    "UPDATE embeddings SET last_used = ? "  # noqa: S608
+                    f"WHERE model_id = ? AND text_hash IN ({placeholders})",
+                    (time.time(), self.model_id, *chunk),
+                )
+            await conn.commit()
+        embeddings = [found.get(text_hash) for text_hash in hashes]
+        hits = sum(embedding is not None for embedding in embeddings)
+        self.hits += hits
+        self.misses += len(embeddings) - hits
+        return embeddings
+
+    async def put_many(self, texts: list[str], embeddings: list[list[float]]) -> None:
+        """Сохранение эмбеддингов в кэш с вытеснением давно неиспользуемых записей"""
+
+        conn = await self._get_conn()
+        now = time.time()
+        rows = {
+            _hash_text(text): _to_blob(embedding)
+            for text, embedding in zip(texts, embeddings, strict=True)
+        }
+        cursor = await conn.executemany(
+            "INSERT OR IGNORE INTO embeddings (model_id, text_hash, vector, last_used) "
+            "VALUES (?, ?, ?, ?)",
+            [(self.model_id, text_hash, blob, now) for text_hash, blob in rows.items()],
+        )
+        self._size += max(cursor.rowcount, 0)
+        overflow = self._size - self.max_entries
+        if overflow > 0:
+            await conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            self._size -= overflow
+            logger.info("Evicted %s least recently used embeddings from cache", overflow)
+        await conn.commit()
+
+
+embedding_cache = EmbeddingCache(
+    path=EMBEDDINGS_CACHE_PATH,
+    model_id=settings.huggingface.model_id,
+    max_entries=settings.rag.embeddings_cache_size,
+)
@@ -0,0 +1,270 @@
+# Модуль реализует компактное хранение векторов: усечённые векторы в Chroma
+# и полноразмерные float32 векторы для точного пересчёта расстояний лучших кандидатов.
+#
+# Компактный режим уменьшает HNSW индекс Chroma в памяти, но увеличивает объём на диске:
+# полные векторы остаются в SQLite, поэтому на чанк хранится `(vector_dims + D) * 4` байт
+# вместо `D * 4` (для bge-m3 с D=1024 и vector_dims=256 - 5 КБ вместо 4 КБ, +25%).
+# Замеры recall и размеров по режимам: `scripts/benchmark_vector_storage.py`.
+
+from typing import Any
+
+import asyncio
+import logging
+from pathlib import Path
+
+import aiosqlite
+import numpy as np
+
+from src.settings import RESCORE_VECTORS_PATH, settings
+from src.utils.metrics import metrics
+
+from .store import VectorCollection, compact_dims, query_batcher, run_in_store
+
+logger = logging.getLogger(__name__)
+
+# Ограничение SQLite на количество параметров в одном запросе
+MAX_QUERY_PARAMS = 500
+
+
+def truncate(vectors: Any, dims: int) -> np.ndarray:
+    """Усечение векторов до первых `dims` координат с нормировкой (Matryoshka).
+
+    Модели, обученные с Matryoshka loss (в том числе bge-m3), концентрируют
+    основную информацию в первых координатах, поэтому префикс остаётся эмбеддингом.
+    """
+
+    prefix = np.asarray(vectors, dtype=np.float32)[:, :dims]
+    norms = np.linalg.norm(prefix, axis=1, keepdims=True)
+    return prefix / np.where(norms == 0, 1, norms)
+
+
+class RescoreVectors:
+    """Полноразмерные float32 векторы коллекций компактного режима в SQLite.
+
+    Ключ - (физическая коллекция, id чанка), поэтому теневые коллекции
+    перевекторизации хранятся независимо от исходных.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._conn: aiosqlite.Connection | None = None
+        self._lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        """Открытие соединения и создание таблицы векторов"""
+
+        async with self._lock:
+            if self._conn is not None:
+                return
+            self._conn = await aiosqlite.connect(self.path)
+            await self._conn.execute("PRAGMA journal_mode=WAL")
+            await self._conn.execute("PRAGMA synchronous=NORMAL")
+            await self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS vectors (
+                    collection TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    dtype TEXT NOT NULL,
+                    scale REAL NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (collection, id)
+                )"""
+            )
+            await self._conn.commit()
+        logger.info("Rescore vectors opened at `%s`", self.path)
+
+    async def close(self) -> None:
+        """Закрытие соединения"""
+
+        if self._conn is None:
+            return
+        await self._conn.close()
+        self._conn = None
+
+    async def _get_conn(self) -> aiosqlite.Connection:
+        if self._conn is None:
+            await self.open()
+        return self._conn
+
+    async def put_many(self, collection_name: str, ids: list[str], vectors: Any) -> None:
+        conn = await self._get_conn()
+        await conn.executemany(
+            "INSERT OR REPLACE INTO vectors (collection, id, dtype, scale, vector) "
+            "VALUES (?, ?, 'float32', 1, ?)",
+            [
+                (collection_name, doc_id, vector.tobytes())
+                for doc_id, vector in zip(ids, np.asarray(vectors, np.float32), strict=True)
+            ],
+        )
+        await conn.commit()
+
+    async def get_many(self, collection_name: str, ids: list[str]) -> dict[str, np.ndarray]:
+        """Векторы чанков по идентификаторам, отсутствующие пропускаются"""
+
+        conn = await self._get_conn()
+        vectors = {}
+        unique_ids = list(dict.fromkeys(ids))
+        for i in range(0, len(unique_ids), MAX_QUERY_PARAMS):
+            chunk = unique_ids[i:i + MAX_QUERY_PARAMS]
+            placeholders = ", ".join("?" * len(chunk))
+            async with conn.execute(
+                "SELECT id, dtype, scale, vector FROM vectors "  # noqa: S608
+                f"WHERE collection = ? AND id IN ({placeholders})",
+                (collection_name, *chunk),
+            ) as cursor:
+                # Строки, записанные до перехода на float32, могут быть квантованными
+                async for doc_id, dtype, scale, blob in cursor:
+                    vectors[doc_id] = np.frombuffer(blob, dtype=dtype).astype(np.float32) * scale
+        return vectors
+
+    async def delete_many(self, collection_name: str, ids: list[str]) -> None:
+        conn = await self._get_conn()
+        await conn.executemany(
+            "DELETE FROM vectors WHERE collection = ? AND id = ?",
+            [(collection_name, doc_id) for doc_id in ids],
+        )
+        await conn.commit()
+
+    async def drop(self, collection_name: str) -> None:
+        conn = await self._get_conn()
+        await conn.execute("DELETE FROM vectors WHERE collection = ?", (collection_name,))
+        await conn.commit()
+
+
+rescore_vectors = RescoreVectors(RESCORE_VECTORS_PATH)
+
+
+async def upsert(
+        collection: VectorCollection,
+        ids: list[str],
+        documents: list[str],
+        embeddings: Any,
+        metadatas: list[dict[str, Any]] | None = None,
+) -> None:
+    """Запись чанков: в компактной коллекции Chroma получает усечённые векторы,
+    а полноразмерные сохраняются для пересчёта расстояний.
+    """
+
+    dims = compact_dims(collection)
+    if dims is not None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        # Сначала полные векторы, чтобы найденный в Chroma чанк всегда можно было пересчитать
+        await rescore_vectors.put_many(collection.name, ids, vectors)
+        embeddings = truncate(vectors, dims)
+    await run_in_store(
+        "upsert",
+        collection.upsert,
+        ids=ids,
+        documents=documents,
+        embeddings=embeddings,
+        metadatas=metadatas,
+    )
+
+
+async def delete(collection: VectorCollection, ids: list[str]) -> None:
+    """Удаление чанков из коллекции вместе с их полноразмерными векторами"""
+
+    await run_in_store("delete", collection.delete, ids=ids)
+    if compact_dims(collection) is not None:
+        await rescore_vectors.delete_many(collection.name, ids)
+
+
+async def drop(collection_name: str) -> None:
+    """Удаление полноразмерных векторов удалённой коллекции"""
+
+    await rescore_vectors.drop(collection_name)
+
+
+async def _fill_missing(
+        collection: VectorCollection,
+        ids: list[str],
+        vectors: dict[str, np.ndarray],
+        dims: int | None,
+) -> None:
+    """Подстановка усечённых векторов из Chroma вместо отсутствующих полноразмерных.
+
+    Усечённый вектор дополняется нулями до полной размерности `dims` (если она известна),
+    поэтому расстояния до него сопоставимы с остальными, хоть и приближённо.
+    """
+
+    missing = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in vectors]
+    if not missing:
+        return
+    logger.warning(
+        "%s full-size vectors of `%s` are missing, using truncated ones",
+        len(missing), collection.name
+    )
+    metrics.increment("rag.rescore.missing", len(missing))
+    result = await run_in_store("get", collection.get, ids=missing, include=["embeddings"])
+    for doc_id, embedding in zip(result["ids"], result["embeddings"], strict=True):
+        vector = np.asarray(embedding, dtype=np.float32)
+        vectors[doc_id] = vector if dims is None else np.pad(vector, (0, dims - len(vector)))
+
+
+async def get(collection: VectorCollection, **kwargs: Any) -> dict[str, Any]:
+    """`collection.get`, возвращающий полноразмерные эмбеддинги в любом режиме"""
+
+    include = kwargs.get("include", [])
+    if compact_dims(collection) is None or "embeddings" not in include:
+        return await run_in_store("get", collection.get, **kwargs)
+    kwargs["include"] = [field for field in include if field != "embeddings"]
+    result = await run_in_store("get", collection.get, **kwargs)
+    vectors = await rescore_vectors.get_many(collection.name, result["ids"])
+    dims = len(next(iter(vectors.values()))) if vectors else None
+    await _fill_missing(collection, result["ids"], vectors, dims)
+    result["embeddings"] = [vectors[doc_id] for doc_id in result["ids"]]
+    return result
+
+
+async def query(
+        collection: VectorCollection,
+        query_embeddings: list[list[float]],
+        n_results: int,
+        include_embeddings: bool = False,
+        **params: Any,
+) -> dict[str, list[list[Any]]]:
+    """`collection.query` с пересчётом расстояний в компактном режиме.
+
+    Chroma ищет `n_results * rescore_oversample` кандидатов по усечённым векторам,
+    после чего кандидаты упорядочиваются по точному квадрату L2 полноразмерных векторов.
+    Эмбеддинги в результате (с `include_embeddings`) всегда полноразмерные.
+    """
+
+    include = ["documents", "metadatas", "distances"]
+    dims = compact_dims(collection)
+    if dims is None:
+        if include_embeddings:
+            include.append("embeddings")
+        return await query_batcher.query(
+            collection, query_embeddings, n_results=n_results, include=include, **params
+        )
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    result = await query_batcher.query(
+        collection,
+        truncate(queries, dims),
+        n_results=n_results * settings.rag.rescore_oversample,
+        include=include,
+        **params,
+    )
+    candidate_ids = [doc_id for ids in result["ids"] for doc_id in ids]
+    vectors = await rescore_vectors.get_many(collection.name, candidate_ids)
+    await _fill_missing(collection, candidate_ids, vectors, queries.shape[1])
+    rescored: dict[str, list[list[Any]]] = {field: [] for field in ("ids", *include)}
+    if include_embeddings:
+        rescored["embeddings"] = []
+    for i, query_vector in enumerate(queries):
+        rows = [j for j, doc_id in enumerate(result["ids"][i]) if doc_id in vectors]
+        if not rows:
+            for values in rescored.values():
+                values.append([])
+            continue
+        matrix = np.array([vectors[result["ids"][i][j]] for j in rows])
+        distances = ((matrix - query_vector) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:n_results]
+        rescored["ids"].append([result["ids"][i][rows[k]] for k in order])
+        rescored["documents"].append([result["documents"][i][rows[k]] for k in order])
+        rescored["metadatas"].append([result["metadatas"][i][rows[k]] for k in order])
+        rescored["distances"].append([float(distances[k]) for k in order])
+        if include_embeddings:
+            rescored["embeddings"].append([matrix[k] for k in order])
+    metrics.increment("rag.rescore.candidates", len(vectors))
+    return rescored
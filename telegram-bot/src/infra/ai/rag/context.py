@@ -0,0 +1,76 @@
+# Модуль реализует сборку контекста из найденных чанков: MMR-диверсификация и бюджет токенов
+
+import math
+from collections.abc import Callable, Sequence
+
+import numpy as np
+
+# Грубая оценка для смешанного русско-английского текста
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Приблизительное количество токенов в тексте"""
+
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr_order(
+        query_embedding: Sequence[float],
+        embeddings: Sequence[Sequence[float]],
+        lambda_mult: float = 0.7,
+        min_relevance: float = 0.0,
+        duplicate_similarity: float = 0.95,
+) -> list[int]:
+    """Упорядочивание кандидатов по Maximal Marginal Relevance.
+
+    :param query_embedding: Эмбеддинг запроса.
+    :param embeddings: Эмбеддинги кандидатов.
+    :param lambda_mult: Баланс релевантности (1.0) и разнообразия (0.0).
+    :param min_relevance: Кандидаты с косинусной близостью к запросу ниже порога отбрасываются.
+    :param duplicate_similarity: Кандидаты, ближе этого порога к уже выбранному, отбрасываются.
+    :returns: Индексы кандидатов в порядке выбора.
+    """
+
+    if not embeddings:
+        return []
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    candidates = _normalize(np.asarray(embeddings, dtype=np.float32))
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    remaining = [i for i in range(len(candidates)) if relevance[i] >= min_relevance]
+    selected: list[int] = []
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        best = int(np.argmax(scores))
+        index = remaining.pop(best)
+        if redundancy[best] < duplicate_similarity:
+            selected.append(index)
+    return selected
+
+
+def pack_to_budget[T](
+        items: Sequence[T], render: Callable[[T], str], token_budget: int
+) -> list[str]:
+    """Жадная упаковка отрендеренных элементов (в заданном порядке) в бюджет токенов.
+    Не влезающий элемент пропускается, и проверяются следующие, более короткие.
+    """
+
+    packed, used = [], 0
+    for item in items:
+        text = render(item)
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            continue
+        packed.append(text)
+        used += tokens
+    return packed
@@ -0,0 +1,182 @@
+# Модуль реализует подавление почти-дубликатов чанков с помощью SimHash
+
+from typing import Any
+
+import hashlib
+import logging
+import re
+from collections.abc import Iterable
+
+from src.infra.db.conn import raw_connection
+from src.settings import settings
+
+from .store import VectorCollection, run_in_store
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+# Ключ метаданных чанка, в котором хранится отпечаток
+FINGERPRINT_KEY = "simhash"
+
+WORD_PATTERN = re.compile(r"\w+", flags=re.UNICODE)
+
+# Версия содержимого индекса, общая для всех воркеров: растёт при каждой записи
+# и удалении чанков, кэш отпечатков индекса действителен, пока версия не изменилась
+VERSIONS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rag_index_versions (
+        index_name TEXT PRIMARY KEY,
+        version BIGINT NOT NULL
+    )
+"""
+
+BUMP_VERSION = """
+    INSERT INTO rag_index_versions (index_name, version) VALUES ($1, 1)
+    ON CONFLICT (index_name) DO UPDATE SET version = rag_index_versions.version + 1
+    RETURNING version
+"""
+
+
+def simhash(text: str) -> int:
+    """64-битный SimHash текста по шинглам из трёх слов"""
+
+    words = WORD_PATTERN.findall(text.lower())
+    shingles = (
+        [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+        or words
+    )
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest())
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def to_metadata_value(fingerprint: int) -> int:
+    """Chroma хранит целые как знаковые int64"""
+
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def from_metadata_value(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class TenantFingerprints:
+    """Отпечатки уже проиндексированных чанков одного арендатора (курса)"""
+
+    def __init__(self, fingerprints: Iterable[int], max_distance: int) -> None:
+        self.fingerprints = list(fingerprints)
+        self.max_distance = max_distance
+
+    def _is_near(self, fingerprint: int, others: Iterable[int]) -> bool:
+        return any((fingerprint ^ other).bit_count() <= self.max_distance for other in others)
+
+    def filter(self, chunks: Iterable[str]) -> tuple[list[str], list[int]]:
+        """Отбрасывание почти-дубликатов, в том числе внутри самой пачки чанков.
+
+        :returns: Уникальные чанки и их отпечатки.
+        """
+
+        kept_chunks, kept_fingerprints = [], []
+        for chunk in chunks:
+            fingerprint = simhash(chunk)
+            if self._is_near(fingerprint, self.fingerprints) or self._is_near(
+                fingerprint, kept_fingerprints
+            ):
+                continue
+            kept_chunks.append(chunk)
+            kept_fingerprints.append(fingerprint)
+        return kept_chunks, kept_fingerprints
+
+    def add(self, fingerprints: Iterable[int]) -> None:
+        self.fingerprints.extend(fingerprints)
+
+
+class NearDuplicateFilter:
+    """Кэш отпечатков по арендаторам, загружаемый из метаданных коллекции.
+
+    Чанки арендатора могут добавить или удалить другие воркеры, поэтому при каждой
+    проверке версия индекса в Postgres (один запрос по ключу) сверяется с версией,
+    под которую загружен кэш, и при расхождении отпечатки индекса перечитываются.
+    """
+
+    def __init__(self, threshold: float = 0.9) -> None:
+        self.threshold = threshold
+        self._tenants: dict[tuple[str, str, Any], TenantFingerprints] = {}
+        self._versions: dict[str, int] = {}
+        self._schema_ready = False
+
+    @property
+    def max_distance(self) -> int:
+        """Допустимое расстояние Хэмминга для заданного порога сходства"""
+
+        return round((1 - self.threshold) * FINGERPRINT_BITS)
+
+    async def _ensure_schema(self) -> None:
+        if self._schema_ready:
+            return
+        async with raw_connection() as conn:
+            await conn.execute(VERSIONS_SCHEMA)
+        self._schema_ready = True
+
+    async def _sync_version(self, index_name: str) -> None:
+        """Сброс кэша индекса, если его изменил другой воркер"""
+
+        await self._ensure_schema()
+        async with raw_connection() as conn:
+            version = await conn.fetchval(
+                "SELECT version FROM rag_index_versions WHERE index_name = $1", index_name
+            )
+        version = version or 0
+        if self._versions.get(index_name) != version:
+            self.forget(index_name)
+            self._versions[index_name] = version
+
+    async def changed(self, index_name: str) -> None:
+        """Отметка записи или удаления чанков индекса для всех воркеров.
+
+        Вызывается после изменения коллекции. Если между проверкой и отметкой индекс
+        менял кто-то ещё, кэш индекса сбрасывается и перечитается при следующей проверке.
+        """
+
+        await self._ensure_schema()
+        async with raw_connection() as conn:
+            version = await conn.fetchval(BUMP_VERSION, index_name)
+        if self._versions.get(index_name) != version - 1:
+            self.forget(index_name)
+        self._versions[index_name] = version
+
+    async def get_tenant(
+            self, collection: VectorCollection, index_name: str, tenant_key: str, tenant: Any
+    ) -> TenantFingerprints:
+        await self._sync_version(index_name)
+        key = (index_name, tenant_key, tenant)
+        if key in self._tenants:
+            return self._tenants[key]
+        result = await run_in_store(
+            "get", collection.get, where={tenant_key: tenant}, include=["metadatas"]
+        )
+        self._tenants[key] = TenantFingerprints(
+            (
+                from_metadata_value(metadata[FINGERPRINT_KEY])
+                for metadata in result["metadatas"]
+                if metadata and FINGERPRINT_KEY in metadata
+            ),
+            max_distance=self.max_distance,
+        )
+        logger.info(
+            "Loaded %s fingerprints for `%s` = `%s` in `%s`",
+            len(self._tenants[key].fingerprints), tenant_key, tenant, index_name
+        )
+        return self._tenants[key]
+
+    def forget(self, index_name: str) -> None:
+        """Сброс отпечатков всех арендаторов коллекции"""
+
+        for key in [key for key in self._tenants if key[0] == index_name]:
+            del self._tenants[key]
+
+
+duplicates_filter = NearDuplicateFilter(threshold=settings.rag.dedup_threshold)
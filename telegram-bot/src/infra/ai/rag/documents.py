@@ -0,0 +1,539 @@
+from typing import Any, NamedTuple
+
+import logging
+import time
+from collections.abc import Callable, Iterator, Sequence
+from itertools import batched, starmap
+from uuid import uuid4
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
+
+from src.settings import settings
+from src.utils.metrics import metrics
+
+from . import compact
+from .context import mmr_order, pack_to_budget
+from .dedup import FINGERPRINT_KEY, duplicates_filter, to_metadata_value
+from .embeddings import get_embeddings
+from .lexical import lexical_indexes
+from .migration import forget_alias, reembedding
+from .store import (
+    VectorCollection,
+    drop_collection,
+    get_collection,
+    is_transient_store_error,
+    resolve,
+)
+
+logger = logging.getLogger(__name__)
+
+splitter = RecursiveCharacterTextSplitter(chunk_size=1024, chunk_overlap=50, length_function=len)
+
+
+def iter_chunks(text: str, segment_size: int = 32 * 1024) -> Iterator[str]:
+    """Ленивое разбиение текста на чанки.
+
+    Текст режется на сегменты по границам абзацев, и сплиттер обрабатывает
+    по одному сегменту, не материализуя весь список чанков документа.
+    """
+
+    start = 0
+    while start < len(text):
+        end = min(start + segment_size, len(text))
+        if end < len(text):
+            boundary = text.rfind("\n\n", start, end)
+            if boundary > start:
+                end = boundary
+        yield from splitter.split_text(text[start:end])
+        start = end
+
+
+async def _index_window(
+        index_name: str,
+        collection: VectorCollection,
+        chunks: list[str],
+        metadatas: list[dict[str, Any]] | None,
+) -> list[str]:
+    """Векторизация и запись одного окна чанков.
+
+    Запросы эмбеддингов повторяются по пачкам внутри `get_embeddings` (а при
+    недоступном сервисе сразу отклоняются), здесь повторяется только запись
+    окна при временном сбое векторного хранилища.
+    """
+
+    ids = [str(uuid4()) for _ in range(len(chunks))]
+    embeddings = await get_embeddings(chunks)
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        retry=retry_if_exception(is_transient_store_error),
+        reraise=True,
+    ):
+        with attempt:
+            # upsert с заранее выбранными id делает повтор окна идемпотентным
+            await compact.upsert(
+                collection,
+                ids=ids,
+                documents=chunks,
+                embeddings=embeddings,
+                metadatas=metadatas,
+            )
+    lexical_indexes.add(index_name, ids, chunks, metadatas)
+    return ids
+
+
+async def index_document(
+        index_name: str,
+        text: str,
+        metadata: dict[str, Any] | None = None,
+        window_size: int = settings.rag.indexing_window,
+        progress_callback: Callable[[int, int], None] | None = None,
+        dedup_by: str | None = None,
+) -> list[str]:
+    """Потоковая индексация и добавление документа в семантический индекс.
+
+    Чанки векторизуются и записываются окнами по `window_size`, поэтому в памяти
+    одновременно находятся векторы только одного окна, а сбой окна не теряет уже
+    записанные окна.
+
+    :param index_name: Индекс в который нужно добавить документ.
+    :param text: Текст документа.
+    :param metadata: Мета-информация документа.
+    :param window_size: Количество чанков в одном окне.
+    :param progress_callback: Функция, получающая (обработано символов, всего символов).
+    :param dedup_by: Ключ метаданных арендатора (например `tenant_id`), в пределах которого
+    почти-дубликаты уже проиндексированных чанков пропускаются.
+    :returns: Идентификаторы чанков в индексе.
+    :exception ValueError: В метаданных нет ключа `dedup_by`.
+    """
+
+    if dedup_by is not None and (metadata is None or dedup_by not in metadata):
+        raise ValueError(f"Metadata must contain the `{dedup_by}` key to deduplicate by it!")
+    if not text.strip():
+        logger.warning("Attempted to index empty text!")
+        return []
+    start_time = time.monotonic()
+    logger.info("Starting index document text, length %s characters", len(text))
+    collection = await get_collection(index_name)
+    tenant = None if dedup_by is None else await duplicates_filter.get_tenant(
+        collection, index_name, dedup_by, metadata[dedup_by]
+    )
+    ids, processed_chars, skipped = [], 0, 0
+    for window in batched(iter_chunks(text), window_size, strict=False):
+        processed_chars = min(processed_chars + sum(len(chunk) for chunk in window), len(text))
+        chunks = list(window)
+        metadatas = None if metadata is None else [metadata.copy() for _ in chunks]
+        if tenant is not None:
+            chunks, fingerprints = tenant.filter(window)
+            skipped += len(window) - len(chunks)
+            metadatas = [
+                metadata | {FINGERPRINT_KEY: to_metadata_value(fingerprint)}
+                for fingerprint in fingerprints
+            ]
+        if chunks:
+            ids.extend(await _index_window(index_name, collection, chunks, metadatas))
+        if tenant is not None:
+            tenant.add(fingerprints)
+        logger.info(
+            "Indexed %s chunks, progress %s%%",
+            len(ids), round(processed_chars / len(text) * 100, 2)
+        )
+        if progress_callback is not None:
+            progress_callback(processed_chars, len(text))
+    if ids:
+        await duplicates_filter.changed(index_name)
+    if skipped:
+        metrics.increment("rag.dedup.skipped", skipped)
+        logger.info("Skipped %s near-duplicate chunks by `%s`", skipped, dedup_by)
+    logger.info(
+        "Finished indexing text, time %s seconds", round(time.monotonic() - start_time, 2))
+    return ids
+
+
+async def delete_documents(index_name: str, ids: list[str]) -> None:
+    """Удаление чанков из индекса по идентификаторам"""
+
+    if not ids:
+        return
+    collection = await get_collection(index_name)
+    await compact.delete(collection, ids)
+    lexical_indexes.remove(index_name, ids)
+    # Отпечатки удалённых чанков перечитаются из коллекции при следующей индексации
+    duplicates_filter.forget(index_name)
+    await duplicates_filter.changed(index_name)
+    logger.info("Deleted %s chunks from `%s`", len(ids), index_name)
+
+
+async def drop_index(index_name: str) -> None:
+    """Удаление индекса (коллекции) вместе с его лексическим индексом и отпечатками"""
+
+    collection_name = resolve(index_name)
+    await drop_collection(index_name)
+    await forget_alias(index_name)
+    await compact.drop(collection_name)
+    lexical_indexes.forget(index_name)
+    duplicates_filter.forget(index_name)
+    await duplicates_filter.changed(index_name)
+    logger.info("Dropped index `%s`", index_name)
+
+
+def _format_result_default(
+        document: str, metadata: dict[str, Any], distance: float | None = None
+) -> str:
+    """Дефолтная функция для форматирования результата поиска релевантных документов"""
+
+    return (
+        f"**Relevance score:** {round(distance, 2)}\n"
+        f"**Source:** {metadata.get('source', '')}\n"
+        f"**Category:** {metadata.get('category', '')}\n"
+        "**Document:**\n"
+        f"{document}"
+    )
+
+
+class SearchHit(NamedTuple):
+    """Найденный в индексе чанк"""
+
+    id: str
+    document: str
+    metadata: dict[str, Any] | None
+    distance: float
+    embedding: Sequence[float] | None = None
+
+
+def _squared_l2(a: list[float], b: list[float]) -> float:
+    # Совпадает с метрикой `l2` коллекций Chroma по умолчанию
+    return sum((x - y) ** 2 for x, y in zip(a, b, strict=True))
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """Слияние нескольких ранжирований методом Reciprocal Rank Fusion"""
+
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (k + rank)
+    return sorted(scores, key=scores.__getitem__, reverse=True)
+
+
+async def _hybrid_search(
+        index_name: str,
+        collection: VectorCollection,
+        lexical_queries: list[str],
+        embeddings: list[list[float]],
+        vector_hits: list[list[SearchHit]],
+        metadata_filter: dict[str, Any] | None,
+        n_results: int,
+) -> list[list[SearchHit]]:
+    """Слияние векторной выдачи с выдачей BM25 через RRF"""
+
+    lexical_index = await lexical_indexes.get(index_name, collection)
+    fused_ids = []
+    for query, hits in zip(lexical_queries, vector_hits, strict=True):
+        lexical_hits = lexical_index.search(query, n_results=n_results * 2, where=metadata_filter)
+        lexical_ids = [doc_id for doc_id, _ in lexical_hits]
+        fused_ids.append(
+            reciprocal_rank_fusion([[hit.id for hit in hits], lexical_ids])[:n_results]
+        )
+    # Чанки, найденные только лексически, догружаются одним запросом
+    known = {hit.id: hit for hits in vector_hits for hit in hits}
+    missing = list({doc_id for ids in fused_ids for doc_id in ids if doc_id not in known})
+    fetched = {}
+    if missing:
+        result = await compact.get(
+            collection, ids=missing, include=["documents", "metadatas", "embeddings"]
+        )
+        fetched = {
+            doc_id: (document, metadata, embedding)
+            for doc_id, document, metadata, embedding in zip(
+                result["ids"], result["documents"], result["metadatas"], result["embeddings"],
+                strict=True
+            )
+        }
+    fused_hits = []
+    for ids, embedding, hits in zip(fused_ids, embeddings, vector_hits, strict=True):
+        by_id = {hit.id: hit for hit in hits}
+        query_hits = []
+        for doc_id in ids:
+            if doc_id in by_id:
+                query_hits.append(by_id[doc_id])
+            elif doc_id in fetched:
+                document, metadata, doc_embedding = fetched[doc_id]
+                query_hits.append(SearchHit(
+                    doc_id,
+                    document,
+                    metadata,
+                    _squared_l2(embedding, list(doc_embedding)),
+                    doc_embedding,
+                ))
+        fused_hits.append(query_hits)
+    return fused_hits
+
+
+async def _dual_read(
+        shadow_name: str,
+        queries: list[str],
+        hits: list[list[SearchHit]],
+        metadata_filter: dict[str, Any] | None,
+        n_results: int,
+        include_embeddings: bool,
+) -> list[list[SearchHit]]:
+    """Слияние выдачи с теневой коллекцией новой модели во время перевекторизации.
+
+    Расстояния разных моделей несравнимы, поэтому выдачи сливаются по рангам (RRF).
+    Если нужны эмбеддинги чанков, берутся только чанки из старой выдачи,
+    так как эмбеддинги теневой коллекции другой размерности.
+    """
+
+    try:
+        shadow = await reembedding.get_shadow(shadow_name)
+        params = {} if metadata_filter is None else {"where": metadata_filter}
+        result = await compact.query(
+            shadow, await reembedding.embed_queries(queries), n_results, **params
+        )
+    except Exception:
+        logger.exception("Shadow read from `%s` failed, using the current index", shadow_name)
+        return hits
+    merged = []
+    for query_hits, *columns in zip(
+        hits,
+        result["ids"],
+        result["documents"],
+        result["metadatas"],
+        result["distances"],
+        strict=True,
+    ):
+        hits_map = {hit.id: hit for hit in query_hits}
+        shadow_hits = list(starmap(SearchHit, zip(*columns, strict=True)))
+        if not include_embeddings:
+            for hit in shadow_hits:
+                hits_map.setdefault(hit.id, hit)
+        ranking = reciprocal_rank_fusion(
+            [[hit.id for hit in query_hits], [hit.id for hit in shadow_hits]]
+        )
+        merged.append([hits_map[doc_id] for doc_id in ranking if doc_id in hits_map][:n_results])
+    return merged
+
+
+async def _embed_queries(queries: list[str]) -> list[list[float]]:
+    # Одиночный запрос идёт через микро-батчер, несколько - одним батчем
+    return await get_embeddings(queries, batch_size=len(queries) if len(queries) > 1 else None)
+
+
+async def search_many(
+        index_name: str,
+        queries: list[str],
+        metadata_filter: dict[str, Any] | None = None,
+        search_string: str | None = None,
+        n_results: int = 10,
+        hybrid: bool = False,
+        include_embeddings: bool = False,
+        query_embeddings: list[list[float]] | None = None,
+) -> list[list[SearchHit]]:
+    """Поиск чанков сразу для нескольких запросов.
+    Все запросы векторизуются одним запросом и ищутся одним вызовом `collection.query`
+    (в компактном режиме хранения с пересчётом расстояний по полноразмерным векторам).
+
+    В гибридном режиме векторная выдача сливается с выдачей BM25 индекса,
+    а `search_string` (если задана) используется как лексический запрос вместо
+    сканирования документов через `$contains`.
+    С `include_embeddings` у найденных чанков заполняется эмбеддинг.
+    Уже посчитанные эмбеддинги запросов передаются в `query_embeddings`,
+    чтобы не векторизовать запросы повторно.
+    """
+
+    if not queries:
+        return []
+    collection = await get_collection(index_name)
+    logger.info(
+        "Retrieving for %s queries: '%s...'", len(queries), "', '".join(q[:50] for q in queries)
+    )
+    params = {}
+    embeddings = (
+        await _embed_queries(queries) if query_embeddings is None else query_embeddings
+    )
+    if metadata_filter is not None:
+        params["where"] = metadata_filter
+    if search_string is not None and not hybrid:
+        params["where_document"] = {"$contains": search_string}
+    # Для слияния берётся расширенный пул кандидатов
+    result = await compact.query(
+        collection,
+        embeddings,
+        n_results * 2 if hybrid else n_results,
+        include_embeddings=include_embeddings,
+        **params,
+    )
+    hits = [
+        list(starmap(SearchHit, zip(*columns, strict=False)))
+        for columns in zip(
+            result["ids"],
+            result["documents"],
+            result["metadatas"],
+            result["distances"],
+            *([result["embeddings"]] if include_embeddings else []),
+            strict=False,
+        )
+    ]
+    if hybrid:
+        lexical_queries = [query if search_string is None else search_string for query in queries]
+        hits = await _hybrid_search(
+            index_name, collection, lexical_queries, embeddings, hits, metadata_filter, n_results
+        )
+    shadow_name = reembedding.shadow_of(index_name)
+    if shadow_name is not None:
+        hits = await _dual_read(
+            shadow_name, queries, hits, metadata_filter, n_results, include_embeddings
+        )
+    return hits
+
+
+async def retrieve_documents_many(
+        index_name: str,
+        queries: list[str],
+        metadata_filter: dict[str, Any] | None = None,
+        search_string: str | None = None,
+        n_results: int = 10,
+        format_result_func: Callable[
+            [str, dict[str, Any], float | None], str
+        ] = _format_result_default,
+        hybrid: bool = False,
+) -> list[list[str]]:
+    """Извлечение релевантных документов сразу для нескольких запросов.
+
+    :param index_name: Индекс к которому нужно сделать запрос.
+    :param queries: Запросы для поиска.
+    :param metadata_filter: Метаданные для фильтрации, пример: `{"source": "my_file.pdf"}`.
+    :param search_string: Подстрока для поиска.
+    :param n_results: Количество извлекаемых документов на каждый запрос.
+    :param format_result_func: Функция для форматирования результата к строке (тексту).
+    :param hybrid: Гибридный поиск (векторный + BM25 со слиянием через RRF).
+    :returns: Найденные документы для каждого запроса в порядке запросов.
+    """
+
+    hits = await search_many(
+        index_name,
+        queries,
+        metadata_filter=metadata_filter,
+        search_string=search_string,
+        n_results=n_results,
+        hybrid=hybrid,
+    )
+    return [
+        [format_result_func(hit.document, hit.metadata, hit.distance) for hit in query_hits]
+        for query_hits in hits
+    ]
+
+
+async def retrieve_documents(
+        index_name: str,
+        query: str,
+        metadata_filter: dict[str, Any] | None = None,
+        search_string: str | None = None,
+        n_results: int = 10,
+        format_result_func: Callable[
+            [str, dict[str, Any], float | None], str
+        ] = _format_result_default,
+        hybrid: bool = False,
+) -> list[str]:
+    """Извлечение релевантных документов из семантического индекса.
+
+    :param index_name: Индекс к которому нужно сделать запрос.
+    :param query: Запрос для поиска.
+    :param metadata_filter: Метаданные для фильтрации, пример: `{"source": "my_file.pdf"}`.
+    :param search_string: Подстрока для поиска.
+    :param n_results: Количество извлекаемых документов.
+    :param format_result_func: Функция для форматирования результата к строке (тексту).
+    :param hybrid: Гибридный поиск (векторный + BM25 со слиянием через RRF).
+    """
+
+    [documents] = await retrieve_documents_many(
+        index_name,
+        [query],
+        metadata_filter=metadata_filter,
+        search_string=search_string,
+        n_results=n_results,
+        format_result_func=format_result_func,
+        hybrid=hybrid,
+    )
+    return documents
+
+
+async def retrieve_context_many(
+        index_name: str,
+        queries: list[str],
+        token_budget: int = settings.rag.context_token_budget,
+        metadata_filter: dict[str, Any] | None = None,
+        n_candidates: int = 20,
+        min_relevance: float = 0.3,
+        format_result_func: Callable[
+            [str, dict[str, Any], float | None], str
+        ] = _format_result_default,
+        hybrid: bool = False,
+) -> list[list[str]]:
+    """Извлечение контекста для промпта в пределах бюджета токенов.
+
+    Кандидаты переранжируются по MMR, почти-дубликаты и нерелевантные чанки
+    отбрасываются, а оставшиеся упаковываются в `token_budget` на каждый запрос.
+
+    :param index_name: Индекс к которому нужно сделать запрос.
+    :param queries: Запросы для поиска.
+    :param token_budget: Бюджет токенов на отформатированные документы одного запроса.
+    :param metadata_filter: Метаданные для фильтрации, пример: `{"source": "my_file.pdf"}`.
+    :param n_candidates: Количество кандидатов для переранжирования.
+    :param min_relevance: Минимальная косинусная близость чанка к запросу.
+    :param format_result_func: Функция для форматирования результата к строке (тексту).
+    :param hybrid: Гибридный поиск (векторный + BM25 со слиянием через RRF).
+    :returns: Отобранные документы для каждого запроса в порядке запросов.
+    """
+
+    # Эмбеддинги запросов нужны и для поиска, и для MMR, поэтому считаются один раз
+    query_embeddings = await _embed_queries(queries) if queries else []
+    hits = await search_many(
+        index_name,
+        queries,
+        metadata_filter=metadata_filter,
+        n_results=n_candidates,
+        hybrid=hybrid,
+        include_embeddings=True,
+        query_embeddings=query_embeddings,
+    )
+    contexts = []
+    for query_hits, query_embedding in zip(hits, query_embeddings, strict=True):
+        order = mmr_order(
+            query_embedding, [hit.embedding for hit in query_hits], min_relevance=min_relevance
+        )
+        contexts.append(pack_to_budget(
+            [query_hits[i] for i in order],
+            lambda hit: format_result_func(hit.document, hit.metadata, hit.distance),
+            token_budget,
+        ))
+    logger.info(
+        "Packed %s of %s candidates into %s tokens budget",
+        sum(len(context) for context in contexts), sum(len(h) for h in hits), token_budget
+    )
+    return contexts
+
+
+async def retrieve_context(
+        index_name: str,
+        query: str,
+        token_budget: int = settings.rag.context_token_budget,
+        metadata_filter: dict[str, Any] | None = None,
+        format_result_func: Callable[
+            [str, dict[str, Any], float | None], str
+        ] = _format_result_default,
+        hybrid: bool = False,
+) -> list[str]:
+    """Извлечение контекста для одного запроса в пределах бюджета токенов"""
+
+    [context] = await retrieve_context_many(
+        index_name,
+        [query],
+        token_budget=token_budget,
+        metadata_filter=metadata_filter,
+        format_result_func=format_result_func,
+        hybrid=hybrid,
+    )
+    return context
@@ -0,0 +1,374 @@
+# Модуль реализует клиент для векторизации текста через HF space
+
+from typing import Self
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from http import HTTPStatus
+from types import TracebackType
+
+import aiohttp
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+from src.settings import settings
+from src.utils.metrics import metrics
+
+from .cache import embedding_cache
+
+logger = logging.getLogger(__name__)
+
+type BatchCallback = Callable[[list[str], list[list[float]]], Awaitable[None]]
+
+
+class EmbeddingServiceUnavailableError(Exception):
+    """HF space признан недоступным, запрос отклонён без обращения к нему"""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Ошибка, которую имеет смысл повторить: сеть, таймаут, 429 и 5xx ответы space"""
+
+    if isinstance(error, aiohttp.ClientResponseError):
+        return (
+            error.status == HTTPStatus.TOO_MANY_REQUESTS
+            or error.status >= HTTPStatus.INTERNAL_SERVER_ERROR
+        )
+    return isinstance(error, (aiohttp.ClientError, TimeoutError))
+
+
+class CircuitBreaker:
+    """Автоматический выключатель запросов к HF space.
+
+    После `failure_threshold` временных ошибок подряд space считается недоступным
+    и запросы сразу отклоняются. Через `reset_timeout` секунд пропускается один пробный
+    запрос: успех замыкает цепь, ошибка снова размыкает её.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def reset(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    async def __aenter__(self) -> Self:
+        if self._opened_at is None:
+            return self
+        if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+            metrics.increment("embeddings.breaker.rejected")
+            raise EmbeddingServiceUnavailableError(f"Embedding service `{self.name}` is down!")
+        self._probing = True
+        return self
+
+    async def __aexit__(
+            self,
+            exc_type: type[BaseException] | None,
+            exc_value: BaseException | None,
+            traceback: TracebackType | None,
+    ) -> None:
+        probing, self._probing = self._probing, False
+        if exc_value is None:
+            if self._opened_at is not None:
+                logger.info("Embedding service `%s` is back, circuit closed", self.name)
+            self.reset()
+            return
+        if not is_transient(exc_value):
+            return
+        self._failures += 1
+        if probing or self._failures >= self.failure_threshold:
+            if not probing:
+                logger.warning(
+                    "Embedding service `%s` failed %s times in a row, circuit opened",
+                    self.name, self._failures
+                )
+            self._opened_at = time.monotonic()
+            metrics.increment("embeddings.breaker.opened")
+
+
+class EmbeddingClient:
+    """Клиент для получения эмбеддингов с пулом keep-alive соединений.
+
+    Батчи отправляются конкурентно (не более `max_concurrency` одновременно),
+    а результаты собираются в исходном порядке. Размер батча подстраивается
+    под наблюдаемую задержку HF space (AIMD: плавно растёт, пока ответ укладывается
+    в `target_latency`, и уменьшается вдвое, если space начинает тормозить).
+
+    Повторы с экспоненциальной задержкой и таймаут применяются к каждому батчу отдельно,
+    поэтому ошибка одного батча не заставляет заново отправлять уже векторизованные.
+    """
+
+    def __init__(
+            self,
+            base_url: str,
+            batch_size: int = 10,
+            min_batch_size: int = 1,
+            max_batch_size: int = 64,
+            target_latency: float = 2.0,
+            max_concurrency: int = 4,
+            max_connections: int = 8,
+            request_timeout: float = 30,
+            connect_timeout: float = 5,
+            max_attempts: int = 3,
+            breaker_failure_threshold: int = 5,
+            breaker_reset_timeout: float = 30,
+    ) -> None:
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.request_timeout = request_timeout
+        self.max_attempts = max_attempts
+        # Таймаут всей попытки задаётся в `_embed_batch`, сессия ограничивает только соединение
+        self.timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout)
+        self.breaker = CircuitBreaker(
+            base_url,
+            failure_threshold=breaker_failure_threshold,
+            reset_timeout=breaker_reset_timeout,
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: aiohttp.ClientSession | None = None
+        self._latency: float | None = None  # Сглаженная задержка одного батча
+
+    async def start(self) -> None:
+        """Открытие пула соединений (вызывается в lifespan приложения)"""
+
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections, keepalive_timeout=60, ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            base_url=self.base_url,
+            connector=connector,
+            timeout=self.timeout,
+            headers={"Content-Type": "application/json"},
+        )
+        logger.info("Embedding client started for `%s`", self.base_url)
+
+    async def close(self) -> None:
+        """Закрытие пула соединений"""
+
+        if self._session is None:
+            return
+        await self._session.close()
+        self._session = None
+        logger.info("Embedding client closed")
+
+    async def switch(self, base_url: str) -> None:
+        """Переключение на другой HF space, новые запросы сразу идут на новый адрес"""
+
+        self.base_url = base_url
+        self._latency = None
+        self.breaker.name = base_url
+        self.breaker.reset()
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+        logger.info("Embedding client switched to `%s`", base_url)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # Ленивое открытие для скриптов и CLI, которые не проходят через lifespan
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    def _adapt_batch_size(self, elapsed: float) -> None:
+        """Подстройка размера батча под наблюдаемую задержку"""
+
+        self._latency = (
+            elapsed if self._latency is None else 0.7 * self._latency + 0.3 * elapsed
+        )
+        if self._latency > self.target_latency:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        elif self._latency < self.target_latency / 2:
+            self.batch_size = min(self.max_batch_size, self.batch_size + 1)
+
+    async def _post_batch(self, texts: list[str]) -> list[list[float]]:
+        session = await self._get_session()
+        async with self._semaphore, self.breaker:
+            start_time = time.monotonic()
+            async with (
+                asyncio.timeout(self.request_timeout),
+                session.post(url="/embeddings", json={"texts": texts}) as response,
+            ):
+                response.raise_for_status()
+                data = await response.json()
+            self._adapt_batch_size(time.monotonic() - start_time)
+        if data.get("embeddings") is None:
+            raise ValueError("Missing embeddings values in JSON response!")
+        return data["embeddings"]
+
+    async def _embed_batch(
+            self, texts: list[str], on_batch: BatchCallback | None = None
+    ) -> list[list[float]]:
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_exponential_jitter(initial=1, max=10),
+            retry=retry_if_exception(is_transient),
+            reraise=True,
+        ):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    metrics.increment("embeddings.batch.retries")
+                embeddings = await self._post_batch(texts)
+        if on_batch is not None:
+            await on_batch(texts, embeddings)
+        return embeddings
+
+    async def embed(
+            self,
+            texts: list[str],
+            batch_size: int | None = None,
+            on_batch: BatchCallback | None = None,
+    ) -> list[list[float]]:
+        """Векторизация текстов с конкурентной отправкой батчей.
+
+        :param texts: Тексты, которые нужно векторизовать.
+        :param batch_size: Фиксированный размер батча, по умолчанию адаптивный.
+        :param on_batch: Вызывается с текстами и эмбеддингами каждого готового батча,
+            чтобы результат сохранился, даже если другой батч завершится ошибкой.
+        :returns: Массив эмбеддингов в порядке исходных текстов.
+        """
+
+        if not texts:
+            return []
+        batch_size = batch_size or self.batch_size
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        logger.info(
+            "POST: `%s` for get embeddings, %s texts in %s batches",
+            f"{self.base_url}/embeddings", len(texts), len(batches)
+        )
+        results = await asyncio.gather(*(self._embed_batch(batch, on_batch) for batch in batches))
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+
+class EmbeddingBatcher:
+    """Микро-батчинг одиночных запросов на векторизацию.
+
+    Конкурентные запросы с одним текстом копятся `max_wait` секунд (или до `max_batch_size`
+    текстов) и уходят в HF space одним запросом, каждый вызывающий получает свой вектор.
+    """
+
+    def __init__(
+            self, client: EmbeddingClient, max_wait: float = 0.005, max_batch_size: int = 32
+    ) -> None:
+        self.client = client
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self._pending: list[tuple[str, asyncio.Future[list[float]]]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> list[float]:
+        """Поставить текст в очередь и дождаться его эмбеддинга"""
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        task = asyncio.create_task(self._send(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, pending: list[tuple[str, asyncio.Future[list[float]]]]) -> None:
+        # Одинаковые тексты (например, один и тот же запрос студента) векторизуются один раз
+        texts = list(dict.fromkeys(text for text, _ in pending))
+        try:
+            embeddings = await self.client.embed(texts, batch_size=len(texts))
+        except Exception as error:  # noqa: BLE001
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        embeddings_map = dict(zip(texts, embeddings, strict=True))
+        for text, future in pending:
+            if not future.done():
+                future.set_result(embeddings_map[text])
+        logger.debug("Coalesced %s embedding requests into one batch", len(pending))
+
+    async def close(self) -> None:
+        """Отправка оставшихся запросов и ожидание их завершения"""
+
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+embedding_client = EmbeddingClient(
+    base_url=settings.huggingface.space_url,
+    batch_size=settings.huggingface.batch_size,
+    max_batch_size=settings.huggingface.max_batch_size,
+    target_latency=settings.huggingface.target_latency,
+    max_concurrency=settings.huggingface.max_concurrency,
+    max_connections=settings.huggingface.max_connections,
+    request_timeout=settings.huggingface.request_timeout,
+    connect_timeout=settings.huggingface.connect_timeout,
+    max_attempts=settings.huggingface.max_attempts,
+    breaker_failure_threshold=settings.huggingface.breaker_failure_threshold,
+    breaker_reset_timeout=settings.huggingface.breaker_reset_timeout,
+)
+
+embedding_batcher = EmbeddingBatcher(
+    embedding_client,
+    max_wait=settings.huggingface.coalesce_window,
+    max_batch_size=settings.huggingface.coalesce_max_batch_size,
+)
+
+
+async def get_embeddings(texts: list[str], batch_size: int | None = None) -> list[list[float]]:
+    """Векторизация текста, повторные тексты берутся из кэша.
+
+    Каждый готовый батч сразу попадает в кэш, поэтому повторный вызов после ошибки
+    отправляет в space только невекторизованные тексты.
+
+    :param texts: Тексты, которые нужно векторизовать.
+    :param batch_size: Количество текста векторизуемого за один запрос (по умолчанию адаптивное).
+    :returns: Массив ембедингов.
+    """
+
+    embeddings = await embedding_cache.get_many(texts)
+    misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if not misses:
+        return embeddings
+    miss_texts = [texts[i] for i in misses]
+    if len(miss_texts) == 1 and batch_size is None:
+        miss_embeddings = [await embedding_batcher.submit(miss_texts[0])]
+        await embedding_cache.put_many(miss_texts, miss_embeddings)
+    else:
+        miss_embeddings = await embedding_client.embed(
+            miss_texts, batch_size=batch_size, on_batch=embedding_cache.put_many
+        )
+    for i, embedding in zip(misses, miss_embeddings, strict=True):
+        embeddings[i] = embedding
+    return embeddings
@@ -0,0 +1,250 @@
+# Модуль реализует точный поиск по небольшим разделам коллекции в памяти процесса
+
+from typing import Any
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from uuid import uuid4
+
+import numpy as np
+
+from src.utils.metrics import metrics
+
+from . import compact
+from .documents import SearchHit
+from .embeddings import get_embeddings
+from .lexical import matches_filter
+from .store import get_collection
+
+logger = logging.getLogger(__name__)
+
+
+class ExactIndex:
+    """Чанки одного раздела с эмбеддингами в непрерывной матрице"""
+
+    def __init__(
+            self,
+            ids: list[str],
+            documents: list[str],
+            metadatas: list[dict[str, Any] | None],
+            embeddings: Any,
+    ) -> None:
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.norms = np.empty(0, dtype=np.float32)
+        self.add(ids, documents, metadatas, embeddings)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(
+            self,
+            ids: list[str],
+            documents: list[str],
+            metadatas: list[dict[str, Any] | None],
+            embeddings: Any,
+    ) -> None:
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        self.matrix = vectors if not self.ids else np.vstack([self.matrix, vectors])
+        self.norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+        self.metadatas.extend(metadatas)
+
+    def search(
+            self, query_embeddings: Any, n_results: int, where: dict[str, Any] | None = None
+    ) -> list[list[SearchHit]]:
+        """Точный поиск ближайших чанков одним матричным умножением на все запросы.
+
+        :param query_embeddings: Эмбеддинги запросов.
+        :param n_results: Количество чанков на каждый запрос.
+        :param where: Фильтр по метаданным в синтаксисе Chroma.
+        :returns: Найденные чанки для каждого запроса по возрастанию расстояния.
+        """
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        mask = np.fromiter(
+            (matches_filter(metadata, where) for metadata in self.metadatas),
+            dtype=bool,
+            count=len(self),
+        )
+        k = min(n_results, int(mask.sum()))
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+        # Квадрат L2 расстояния, как у коллекций Chroma по умолчанию
+        distances = (
+            np.einsum("ij,ij->i", queries, queries)[:, None]
+            + self.norms[None, :]
+            - 2 * queries @ self.matrix.T
+        )
+        distances[:, ~mask] = np.inf
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(distances, top, strict=True):
+            ordered = candidates[np.argsort(row[candidates])]
+            results.append([
+                SearchHit(
+                    self.ids[i], self.documents[i], self.metadatas[i], max(float(row[i]), 0.0)
+                )
+                for i in ordered
+            ])
+        return results
+
+
+class ExactStore:
+    """Точный поиск по разделам коллекции (например, памяти одного пользователя).
+
+    Коллекция Chroma остаётся постоянным хранилищем, а раздел загружается
+    в память при первом обращении и вытесняется по LRU. Записи других процессов
+    (воркеров, консолидации) видны после перечитывания раздела, не позже `max_age` секунд.
+    """
+
+    def __init__(
+            self,
+            index_name: str,
+            partition_key: str,
+            max_partitions: int = 1000,
+            max_age: float = 60.0,
+    ) -> None:
+        self.index_name = index_name
+        self.partition_key = partition_key
+        self.max_partitions = max_partitions
+        self.max_age = max_age
+        self._partitions: OrderedDict[Any, ExactIndex] = OrderedDict()
+        self._loaded_at: dict[Any, float] = {}
+        self._locks: dict[Any, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def _load(self, partition: Any) -> ExactIndex:
+        collection = await get_collection(self.index_name)
+        result = await compact.get(
+            collection,
+            where={self.partition_key: partition},
+            include=["documents", "metadatas", "embeddings"],
+        )
+        return ExactIndex(
+            result["ids"], result["documents"], result["metadatas"], result["embeddings"]
+        )
+
+    async def get_partition(self, partition: Any) -> ExactIndex:
+        """Раздел из памяти или загруженный из коллекции (если в памяти нет или он устарел)"""
+
+        if self._is_fresh(partition):
+            self._partitions.move_to_end(partition)
+            return self._partitions[partition]
+        async with self._locks[partition]:
+            if not self._is_fresh(partition):
+                self._partitions[partition] = await self._load(partition)
+                self._partitions.move_to_end(partition)
+                self._loaded_at[partition] = time.monotonic()
+                logger.info(
+                    "Loaded %s vectors of `%s` = `%s` from `%s`",
+                    len(self._partitions[partition]),
+                    self.partition_key, partition, self.index_name
+                )
+                while len(self._partitions) > self.max_partitions:
+                    evicted, _ = self._partitions.popitem(last=False)
+                    self._locks.pop(evicted, None)
+                    self._loaded_at.pop(evicted, None)
+        return self._partitions[partition]
+
+    def _is_fresh(self, partition: Any) -> bool:
+        loaded_at = self._loaded_at.get(partition)
+        return (
+            partition in self._partitions
+            and loaded_at is not None
+            and time.monotonic() - loaded_at < self.max_age
+        )
+
+    def invalidate(self, partition: Any | None = None) -> None:
+        """Сброс раздела (или всех), следующее обращение перечитает его из коллекции"""
+
+        if partition is None:
+            self._partitions.clear()
+            self._loaded_at.clear()
+        else:
+            self._partitions.pop(partition, None)
+            self._loaded_at.pop(partition, None)
+
+    async def add(
+            self,
+            partition: Any,
+            documents: list[str],
+            metadatas: list[dict[str, Any]] | None = None,
+            embeddings: list[list[float]] | None = None,
+            ids: list[str] | None = None,
+    ) -> list[str]:
+        """Запись документов раздела в коллекцию и в загруженную матрицу.
+
+        Запись с переданными идентификаторами идемпотентна: повтор перезаписывает
+        те же документы коллекции и не дублирует их в матрице.
+
+        :returns: Идентификаторы записанных документов.
+        """
+
+        if not documents:
+            return []
+        if embeddings is None:
+            embeddings = await get_embeddings(documents)
+        if ids is None:
+            ids = [str(uuid4()) for _ in range(len(documents))]
+        metadatas = [
+            {**(metadata or {}), self.partition_key: partition}
+            for metadata in (metadatas or [None] * len(documents))
+        ]
+        collection = await get_collection(self.index_name)
+        await compact.upsert(
+            collection,
+            ids=ids,
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas,
+        )
+        index = self._partitions.get(partition)
+        if index is not None:
+            known = set(index.ids)
+            new = [i for i, doc_id in enumerate(ids) if doc_id not in known]
+            index.add(
+                [ids[i] for i in new],
+                [documents[i] for i in new],
+                [metadatas[i] for i in new],
+                [embeddings[i] for i in new],
+            )
+        return ids
+
+    async def search_embeddings(
+            self,
+            partition: Any,
+            query_embeddings: list[list[float]],
+            metadata_filter: dict[str, Any] | None = None,
+            n_results: int = 10,
+    ) -> list[list[SearchHit]]:
+        """Точный поиск в разделе по уже векторизованным запросам"""
+
+        index = await self.get_partition(partition)
+        if not len(index):
+            return [[] for _ in query_embeddings]
+        start_time = time.perf_counter()
+        hits = index.search(query_embeddings, n_results, metadata_filter)
+        metrics.histogram("exact_store.search").observe(time.perf_counter() - start_time)
+        return hits
+
+    async def search_many(
+            self,
+            partition: Any,
+            queries: list[str],
+            metadata_filter: dict[str, Any] | None = None,
+            n_results: int = 10,
+    ) -> list[list[SearchHit]]:
+        """Точный поиск в разделе сразу по нескольким запросам"""
+
+        index = await self.get_partition(partition)
+        if not queries or not len(index):
+            return [[] for _ in queries]
+        embeddings = await get_embeddings(
+            queries, batch_size=len(queries) if len(queries) > 1 else None
+        )
+        return await self.search_embeddings(partition, embeddings, metadata_filter, n_results)
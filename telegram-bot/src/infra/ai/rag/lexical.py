@@ -0,0 +1,298 @@
+# Модуль реализует лексический BM25 индекс с русским стеммингом
+
+from typing import Any
+
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable
+
+from .store import VectorCollection, run_in_store
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+(?:-\w+)*", flags=re.UNICODE)
+CYRILLIC_PATTERN = re.compile(r"[а-яё]")
+
+# Стеммер Портера для русского языка
+VOWELS = "аеиоуыэюя"
+RVRE = re.compile(rf"^(.*?[{VOWELS}])(.*)$")
+PERFECTIVE_GERUND = re.compile(r"((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$")
+REFLEXIVE = re.compile(r"(с[яь])$")
+ADJECTIVE = re.compile(
+    r"(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$"
+)
+PARTICIPLE = re.compile(r"((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$")
+VERB = re.compile(
+    r"((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|"
+    r"ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$"
+)
+NOUN = re.compile(
+    r"(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|"
+    r"ию|ью|ю|ия|ья|я)$"
+)
+DERIVATIONAL = re.compile(rf".*[^{VOWELS}]+[{VOWELS}].*ость?$")
+DERIVATIONAL_SUFFIX = re.compile(r"ость?$")
+SUPERLATIVE = re.compile(r"(ейше|ейш)$")
+
+
+def stem(word: str) -> str:
+    """Стемминг русского слова, остальные слова возвращаются без изменений"""
+
+    word = word.lower().replace("ё", "е")
+    if not CYRILLIC_PATTERN.search(word):
+        return word
+    match = RVRE.match(word)
+    if match is None:
+        return word
+    prefix, rv = match.groups()
+    temp = PERFECTIVE_GERUND.sub("", rv, count=1)
+    if temp == rv:
+        rv = REFLEXIVE.sub("", rv, count=1)
+        temp = ADJECTIVE.sub("", rv, count=1)
+        if temp != rv:
+            rv = PARTICIPLE.sub("", temp, count=1)
+        else:
+            temp = VERB.sub("", rv, count=1)
+            rv = NOUN.sub("", rv, count=1) if temp == rv else temp
+    else:
+        rv = temp
+    rv = re.sub(r"и$", "", rv, count=1)
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_SUFFIX.sub("", rv, count=1)
+    temp = re.sub(r"ь$", "", rv, count=1)
+    if temp == rv:
+        rv = SUPERLATIVE.sub("", rv, count=1)
+        rv = re.sub(r"нн$", "н", rv, count=1)
+    else:
+        rv = temp
+    return prefix + rv
+
+
+def tokenize(text: str) -> list[str]:
+    """Токенизация со стеммингом, составные термины (V-model) индексируются целиком и по частям"""
+
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if "-" in token:
+            tokens.append(token)
+            tokens.extend(stem(part) for part in token.split("-") if len(part) > 1)
+        elif len(token) > 1:
+            tokens.append(stem(token))
+    return tokens
+
+
+def matches_filter(metadata: dict[str, Any] | None, where: dict[str, Any] | None) -> bool:
+    """Проверка метаданных на соответствие фильтру в синтаксисе Chroma `where`"""
+
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif not _matches_condition(metadata.get(key), condition):
+            return False
+    return True
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    operator, operand = next(iter(condition.items()))
+    match operator:
+        case "$eq":
+            return value == operand
+        case "$ne":
+            return value != operand
+        case "$in":
+            return value in operand
+        case "$nin":
+            return value not in operand
+        case "$gt":
+            return value is not None and value > operand
+        case "$gte":
+            return value is not None and value >= operand
+        case "$lt":
+            return value is not None and value < operand
+        case "$lte":
+            return value is not None and value <= operand
+    raise ValueError(f"Unsupported filter operator `{operator}`!")
+
+
+class BM25Index:
+    """Инвертированный индекс с ранжированием Okapi BM25"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[str, int]] = defaultdict(dict)
+        # Термины каждого документа, чтобы удаление не обходило весь словарь
+        self.doc_terms: dict[str, list[str]] = {}
+        self.doc_lengths: dict[str, int] = {}
+        self.metadatas: dict[str, dict[str, Any] | None] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(
+            self,
+            ids: Iterable[str],
+            documents: Iterable[str],
+            metadatas: Iterable[dict[str, Any] | None],
+    ) -> None:
+        for doc_id, document, metadata in zip(ids, documents, metadatas, strict=True):
+            self.remove([doc_id])
+            term_counts = Counter(tokenize(document))
+            for term, count in term_counts.items():
+                self.postings[term][doc_id] = count
+            self.doc_terms[doc_id] = list(term_counts)
+            length = sum(term_counts.values())
+            self.doc_lengths[doc_id] = length
+            self.metadatas[doc_id] = metadata
+            self._total_length += length
+
+    def remove(self, ids: Iterable[str]) -> None:
+        for doc_id in ids:
+            length = self.doc_lengths.pop(doc_id, None)
+            if length is None:
+                continue
+            self.metadatas.pop(doc_id, None)
+            self._total_length -= length
+            for term in self.doc_terms.pop(doc_id):
+                del self.postings[term][doc_id]
+                if not self.postings[term]:
+                    del self.postings[term]
+
+    def search(
+            self, query: str, n_results: int = 10, where: dict[str, Any] | None = None
+    ) -> list[tuple[str, float]]:
+        """Поиск документов по запросу.
+
+        :returns: Пары (id документа, BM25 скор) по убыванию скора.
+        """
+
+        if not self.doc_lengths:
+            return []
+        total_docs = len(self.doc_lengths)
+        avg_length = self._total_length / total_docs
+        scores: dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores, key=scores.__getitem__, reverse=True)
+        return [
+            (doc_id, scores[doc_id])
+            for doc_id in ranked
+            if matches_filter(self.metadatas.get(doc_id), where)
+        ][:n_results]
+
+
+class LexicalIndexes:
+    """BM25 индексы по коллекциям. Индекс строится из коллекции при первом обращении
+    и дальше обновляется вместе с записью в неё.
+
+    Записи, сделанные во время построения, накапливаются и применяются к новому индексу.
+    Изменения других процессов подхватываются пересборкой: раз в `refresh_interval` секунд
+    число документов индекса сверяется с коллекцией, и не реже чем раз в `max_age` секунд
+    индекс собирается заново. Пока идёт пересборка, поиск использует прежний индекс.
+    """
+
+    def __init__(self, refresh_interval: float = 30.0, max_age: float = 600.0) -> None:
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self._indexes: dict[str, BM25Index] = {}
+        self._built_at: dict[str, float] = {}
+        self._checked_at: dict[str, float] = {}
+        self._locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._pending_events: dict[str, list[Callable[[BM25Index], None]]] = {}
+
+    async def _is_stale(
+            self, index_name: str, index: BM25Index, collection: VectorCollection
+    ) -> bool:
+        now = time.monotonic()
+        if now - self._built_at[index_name] >= self.max_age:
+            return True
+        if now - self._checked_at[index_name] < self.refresh_interval:
+            return False
+        self._checked_at[index_name] = now
+        return await run_in_store("count", collection.count) != len(index)
+
+    async def get(self, index_name: str, collection: VectorCollection) -> BM25Index:
+        index = self._indexes.get(index_name)
+        if index is not None and (
+            self._locks[index_name].locked()
+            or not await self._is_stale(index_name, index, collection)
+        ):
+            return index
+        requested_at = time.monotonic()
+        async with self._locks[index_name]:
+            # Индекс мог пересобрать другой запрос, пока этот ждал блокировку
+            if self._built_at.get(index_name, -math.inf) < requested_at:
+                await self._build(index_name, collection)
+        return self._indexes[index_name]
+
+    async def _build(self, index_name: str, collection: VectorCollection) -> None:
+        self._pending_events[index_name] = []
+        try:
+            result = await run_in_store(
+                "get", collection.get, include=["documents", "metadatas"]
+            )
+            index = BM25Index()
+            await asyncio.to_thread(
+                index.add, result["ids"], result["documents"], result["metadatas"]
+            )
+            # Записи, пришедшие после начала чтения коллекции (повтор добавления безопасен)
+            for event in self._pending_events[index_name]:
+                event(index)
+        finally:
+            del self._pending_events[index_name]
+        self._indexes[index_name] = index
+        self._built_at[index_name] = self._checked_at[index_name] = time.monotonic()
+        logger.info("Built BM25 index for `%s`, %s documents", index_name, len(index))
+
+    def _apply(self, index_name: str, event: Callable[[BM25Index], None]) -> None:
+        index = self._indexes.get(index_name)
+        if index is not None:
+            event(index)
+        if index_name in self._pending_events:
+            self._pending_events[index_name].append(event)
+
+    def add(
+            self,
+            index_name: str,
+            ids: list[str],
+            documents: list[str],
+            metadatas: list[dict[str, Any]] | None,
+    ) -> None:
+        """Обновление построенного или строящегося индекса, непостроенный соберётся из коллекции"""
+
+        metadatas = metadatas or [None] * len(ids)
+        self._apply(index_name, lambda index: index.add(ids, documents, metadatas))
+
+    def remove(self, index_name: str, ids: list[str]) -> None:
+        self._apply(index_name, lambda index: index.remove(ids))
+
+    def forget(self, index_name: str) -> None:
+        """Сброс индекса удалённой коллекции"""
+
+        self._indexes.pop(index_name, None)
+        self._built_at.pop(index_name, None)
+        self._checked_at.pop(index_name, None)
+        self._locks.pop(index_name, None)
+
+
+lexical_indexes = LexicalIndexes()
@@ -0,0 +1,644 @@
+# Модуль реализует фоновую перевекторизацию коллекций под новую модель эмбеддингов
+
+from typing import IO, Any, Literal
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import re
+from collections.abc import Callable
+from contextlib import suppress
+from pathlib import Path
+
+import aiosqlite
+from chromadb.errors import NotFoundError
+from pydantic import BaseModel
+
+from src.infra.db.conn import raw_connection
+from src.settings import REEMBEDDING_STATE_PATH, settings
+
+from . import compact, store
+from .cache import embedding_cache
+from .embeddings import EmbeddingClient, embedding_client
+from .store import VectorCollection, client, run_in_store
+
+logger = logging.getLogger(__name__)
+
+ReembeddingStatus = Literal["idle", "copying", "cutover", "failed"]
+
+# Переключённые индексы, активная модель и состояние перевекторизации (для двойного
+# чтения из теневых коллекций) общие для всех воркеров и хранятся в Postgres
+SHARED_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rag_index_aliases (
+        index_name TEXT PRIMARY KEY,
+        collection_name TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS rag_active_model (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        space_url TEXT NOT NULL,
+        model_id TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS rag_reembedding (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        status TEXT NOT NULL,
+        space_url TEXT NOT NULL,
+        model_id TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS rag_reembedding_shadows (
+        index_name TEXT PRIMARY KEY,
+        shadow_name TEXT NOT NULL
+    );
+"""
+
+UPSERT_REEMBEDDING = """
+    INSERT INTO rag_reembedding (id, status, space_url, model_id) VALUES (1, $1, $2, $3)
+    ON CONFLICT (id) DO UPDATE SET
+        status = EXCLUDED.status, space_url = EXCLUDED.space_url, model_id = EXCLUDED.model_id
+"""
+
+UPSERT_SHADOW = """
+    INSERT INTO rag_reembedding_shadows (index_name, shadow_name) VALUES ($1, $2)
+    ON CONFLICT (index_name) DO UPDATE SET shadow_name = EXCLUDED.shadow_name
+"""
+
+UPSERT_ALIAS = """
+    INSERT INTO rag_index_aliases (index_name, collection_name) VALUES ($1, $2)
+    ON CONFLICT (index_name) DO UPDATE SET collection_name = EXCLUDED.collection_name
+"""
+
+UPSERT_ACTIVE_MODEL = """
+    INSERT INTO rag_active_model (id, space_url, model_id) VALUES (1, $1, $2)
+    ON CONFLICT (id) DO UPDATE SET space_url = EXCLUDED.space_url, model_id = EXCLUDED.model_id
+"""
+
+# Документов в одной странице при сверке содержимого исходной и теневой коллекций
+RECONCILE_PAGE_SIZE = 1000
+
+
+def shadow_collection_name(index_name: str, model_id: str) -> str:
+    """Имя теневой коллекции индекса для новой модели"""
+
+    return f"{index_name}.{re.sub(r'[^a-zA-Z0-9_-]+', '-', model_id).strip('-')}"
+
+
+def content_hash(document: str | None, metadata: dict[str, Any] | None) -> str:
+    """Отпечаток содержимого документа для сверки копий"""
+
+    payload = json.dumps([document, metadata], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def forget_alias(index_name: str) -> None:
+    """Удаление общего переключения индекса (например, при удалении индекса)"""
+
+    async with raw_connection() as conn:
+        await conn.execute("DELETE FROM rag_index_aliases WHERE index_name = $1", index_name)
+
+
+class IndexProgress(BaseModel):
+    """Прогресс копирования одного индекса в теневую коллекцию"""
+
+    index_name: str
+    source: str
+    shadow: str
+    offset: int = 0
+    total: int = 0
+    copied: bool = False
+
+
+class Reembedding:
+    """Перевекторизация всех индексов без простоя.
+
+    Документы и метаданные постранично копируются в теневые коллекции с эмбеддингами
+    новой модели (с паузами между страницами), прогресс сохраняется после каждой страницы,
+    и после падения задача продолжается с места остановки. Пока идёт копирование,
+    поиск читает и старую, и теневую коллекцию. Перед переключением теневые коллекции
+    сверяются с исходными по отпечаткам содержимого, поэтому изменения, сделанные после
+    копирования страницы, не теряются. Затем индексы и клиент эмбеддингов переключаются
+    на новую модель одним шагом.
+
+    Переключение и состояние задачи записываются в Postgres, остальные воркеры
+    подхватывают их каждые `refresh_interval` секунд, поэтому двойное чтение
+    включается во всех воркерах, а не только в лидере. Старые коллекции удаляются после
+    повторной сверки спустя два интервала, когда все воркеры уже пишут в новые. Задачу
+    ведёт один процесс-лидер, удерживающий блокировку файла состояния.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            page_size: int = 64,
+            pause: float = 0.5,
+            refresh_interval: float = 10.0,
+    ) -> None:
+        self.path = path
+        self.page_size = page_size
+        self.pause = pause
+        self.refresh_interval = refresh_interval
+        self.leader = False
+        self.status: ReembeddingStatus = "idle"
+        self.progress: dict[str, IndexProgress] = {}
+        self.target_client: EmbeddingClient | None = None
+        self.target_model_id: str | None = None
+        # Векторизация живых запросов новой моделью не ждёт страниц копирования
+        self.query_client: EmbeddingClient | None = None
+        self._dual_read: dict[str, str] = {}
+        self._conn: aiosqlite.Connection | None = None
+        self._task: asyncio.Task | None = None
+        self._watcher: asyncio.Task | None = None
+        self._switch_lock = asyncio.Lock()
+        self._lock_file: IO | None = None
+        self._shadows: dict[str, VectorCollection] = {}
+        self._cutover_hooks: list[Callable[[], None]] = []
+
+    async def open(self, resume: bool = True) -> None:
+        """Загрузка переключённых индексов и активной модели, возобновление прерванной задачи
+        в процессе-лидере и запуск периодического обновления переключений.
+
+        :param resume: Возобновить прерванную задачу (скриптам достаточно индексов и модели).
+        """
+
+        if self._conn is not None:
+            return
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS aliases (
+                index_name TEXT PRIMARY KEY,
+                collection_name TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS active_model (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                space_url TEXT NOT NULL,
+                model_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                space_url TEXT NOT NULL,
+                model_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS progress (
+                index_name TEXT PRIMARY KEY,
+                payload TEXT NOT NULL
+            );
+            """
+        )
+        await self._conn.commit()
+        await self._setup_shared()
+        await self.refresh()
+        self._watcher = asyncio.create_task(self._watch())
+        if not resume or not await self._acquire_leadership():
+            return
+        async with self._conn.execute("SELECT space_url, model_id FROM job") as cursor:
+            job = await cursor.fetchone()
+        if job is not None:
+            async with self._conn.execute("SELECT payload FROM progress") as cursor:
+                for (payload,) in await cursor.fetchall():
+                    progress = IndexProgress.model_validate_json(payload)
+                    self.progress[progress.index_name] = progress
+            logger.info("Resuming re-embedding to `%s`", job[1])
+            await self._start(*job)
+
+    async def _setup_shared(self) -> None:
+        """Создание общих таблиц и перенос переключений, записанных в файл состояния
+        до появления общего хранилища.
+        """
+
+        async with self._conn.execute("SELECT index_name, collection_name FROM aliases") as cursor:
+            legacy_aliases = await cursor.fetchall()
+        async with self._conn.execute("SELECT space_url, model_id FROM active_model") as cursor:
+            legacy_model = await cursor.fetchone()
+        async with raw_connection() as conn, conn.transaction():
+            await conn.execute(SHARED_SCHEMA)
+            await conn.executemany(
+                "INSERT INTO rag_index_aliases (index_name, collection_name) VALUES ($1, $2) "
+                "ON CONFLICT (index_name) DO NOTHING",
+                legacy_aliases,
+            )
+            if legacy_model is not None:
+                await conn.execute(
+                    "INSERT INTO rag_active_model (id, space_url, model_id) VALUES (1, $1, $2) "
+                    "ON CONFLICT (id) DO NOTHING",
+                    *legacy_model,
+                )
+
+    async def refresh(self) -> None:
+        """Применение переключений индексов и модели, сделанных любым воркером"""
+
+        async with self._switch_lock:
+            await self._apply_shared()
+
+    async def _apply_shared(self) -> None:
+        async with raw_connection() as conn:
+            rows = await conn.fetch("SELECT index_name, collection_name FROM rag_index_aliases")
+            active = await conn.fetchrow("SELECT space_url, model_id FROM rag_active_model")
+            job = await conn.fetchrow("SELECT status, space_url, model_id FROM rag_reembedding")
+            shadows = await conn.fetch(
+                "SELECT index_name, shadow_name FROM rag_reembedding_shadows"
+            )
+        await self._apply_job(job, {row["index_name"]: row["shadow_name"] for row in shadows})
+        shared = {row["index_name"]: row["collection_name"] for row in rows}
+        # Индексы, удалённые из общего хранилища, снова читаются под своим именем
+        changed = {name: name for name in store.aliases() if name not in shared} | {
+            name: collection_name
+            for name, collection_name in shared.items()
+            if store.resolve(name) != collection_name
+        }
+        store.set_aliases(changed)
+        switched = active is not None and active["model_id"] != embedding_cache.model_id
+        if switched:
+            logger.warning(
+                "Collections were re-embedded with `%s`, overriding `%s`",
+                active["model_id"], embedding_cache.model_id
+            )
+            embedding_cache.model_id = active["model_id"]
+            await embedding_client.switch(active["space_url"])
+        if changed or switched:
+            logger.info("Applied re-embedding switch of %s indexes", len(changed))
+            for hook in self._cutover_hooks:
+                hook()
+
+    async def _apply_job(self, job: Any, shadows: dict[str, str]) -> None:
+        """Двойное чтение по состоянию задачи, которую ведёт лидер"""
+
+        if not self.leader:
+            self.status = "idle" if job is None else job["status"]
+            self.target_model_id = None if job is None else job["model_id"]
+        copying = job is not None and job["status"] == "copying"
+        self._dual_read = shadows if copying else {}
+        space_url = job["space_url"] if copying else None
+        if self.query_client is not None and self.query_client.base_url != space_url:
+            await self.query_client.close()
+            self.query_client = None
+        if space_url is not None and self.query_client is None:
+            self.query_client = EmbeddingClient(base_url=space_url)
+
+    async def _publish(self, status: ReembeddingStatus) -> None:
+        """Запись состояния задачи и теневых коллекций для всех воркеров"""
+
+        self.status = status
+        shadows = {name: progress.shadow for name, progress in self.progress.items()}
+        async with raw_connection() as conn, conn.transaction():
+            await conn.execute(
+                UPSERT_REEMBEDDING, status, self.target_client.base_url, self.target_model_id
+            )
+            await conn.executemany(UPSERT_SHADOW, list(shadows.items()))
+        async with self._switch_lock:
+            await self._apply_job(
+                {
+                    "status": status,
+                    "space_url": self.target_client.base_url,
+                    "model_id": self.target_model_id,
+                },
+                shadows,
+            )
+
+    async def _finish_shared(self) -> None:
+        """Удаление общего состояния завершённой задачи"""
+
+        self.status = "idle"
+        async with raw_connection() as conn, conn.transaction():
+            await conn.execute("DELETE FROM rag_reembedding")
+            await conn.execute("DELETE FROM rag_reembedding_shadows")
+        async with self._switch_lock:
+            await self._apply_job(None, {})
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh re-embedding aliases")
+
+    async def _acquire_leadership(self) -> bool:
+        """Захват блокировки файла состояния: задачу ведёт только один процесс"""
+
+        if self.leader:
+            return True
+
+        def try_lock() -> IO | None:
+            lock_file = self.path.with_name(f"{self.path.name}.lock").open("w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+            return lock_file
+
+        self._lock_file = await asyncio.to_thread(try_lock)
+        self.leader = self._lock_file is not None
+        return self.leader
+
+    async def close(self) -> None:
+        for task in (self._watcher, self._task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._watcher = self._task = None
+        for embedder in (self.target_client, self.query_client):
+            if embedder is not None:
+                await embedder.close()
+        self.query_client = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+            self.leader = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def on_cutover(self, callback: Callable[[], None]) -> None:
+        """Регистрация сброса кэшей, построенных на эмбеддингах старой модели"""
+
+        self._cutover_hooks.append(callback)
+
+    def snapshot(self) -> dict[str, Any]:
+        processed = sum(progress.offset for progress in self.progress.values())
+        total = sum(progress.total for progress in self.progress.values())
+        return {
+            "status": self.status,
+            "leader": self.leader,
+            "target_model_id": self.target_model_id,
+            "processed": processed,
+            "total": total,
+            "percent": round(processed / total * 100, 2) if total else 0.0,
+            "indexes": {
+                name: progress.model_dump(include={"offset", "total", "copied"})
+                for name, progress in self.progress.items()
+            },
+        }
+
+    async def start(self, space_url: str, model_id: str) -> None:
+        """Запуск перевекторизации всех индексов под модель `model_id`"""
+
+        if self.running:
+            raise RuntimeError("Re-embedding is already running!")
+        if not await self._acquire_leadership():
+            raise RuntimeError("Re-embedding is run by another worker!")
+        # Упавшая задача для той же модели продолжается с сохранённых позиций
+        if model_id != self.target_model_id:
+            self.progress.clear()
+            await self._conn.execute("DELETE FROM progress")
+        await self._conn.execute(
+            "INSERT OR REPLACE INTO job (id, space_url, model_id) VALUES (1, ?, ?)",
+            (space_url, model_id),
+        )
+        await self._conn.commit()
+        await self._start(space_url, model_id)
+
+    async def _start(self, space_url: str, model_id: str) -> None:
+        if self.target_client is not None:
+            await self.target_client.close()
+        self.target_model_id = model_id
+        # Отдельный пул с одним батчем в полёте, чтобы не конкурировать с живыми запросами
+        self.target_client = EmbeddingClient(
+            base_url=space_url,
+            batch_size=self.page_size,
+            max_batch_size=self.page_size,
+            max_concurrency=1,
+            max_connections=2,
+        )
+        self._task = asyncio.create_task(self._run())
+
+    async def _save_progress(self, progress: IndexProgress) -> None:
+        await self._conn.execute(
+            "INSERT OR REPLACE INTO progress (index_name, payload) VALUES (?, ?)",
+            (progress.index_name, progress.model_dump_json()),
+        )
+        await self._conn.commit()
+
+    async def _discover(self) -> list[IndexProgress]:
+        """Индексы, ещё не поставленные в план перевекторизации"""
+
+        collections = await run_in_store("list_collections", client.list_collections)
+        names = {getattr(collection, "name", collection) for collection in collections}
+        shadows = {progress.shadow for progress in self.progress.values()}
+        logical = {
+            collection_name: index_name for index_name, collection_name in store.aliases().items()
+        }
+        discovered = []
+        for name in names - shadows:
+            index_name = logical.get(name, name)
+            if index_name in self.progress:
+                continue
+            progress = IndexProgress(
+                index_name=index_name,
+                source=name,
+                shadow=shadow_collection_name(index_name, self.target_model_id),
+            )
+            self.progress[index_name] = progress
+            await self._save_progress(progress)
+            discovered.append(progress)
+        return discovered
+
+    async def _migrate(self) -> None:
+        await self._discover()
+        await self._publish("copying")
+        while True:
+            for progress in self.progress.values():
+                if not progress.copied:
+                    await self._copy(progress)
+            # Индексы, созданные во время копирования (например, новые курсы)
+            if not await self._discover():
+                break
+            await self._publish("copying")
+        await self._publish("cutover")
+        await self._cutover()
+        await self._finish_shared()
+
+    async def _run(self) -> None:
+        try:
+            await self._migrate()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Re-embedding failed, it will resume from the last checkpoint")
+            try:
+                await self._publish("failed")
+            except Exception:
+                self.status = "failed"
+                logger.exception("Failed to publish the re-embedding failure")
+
+    async def get_shadow(self, collection_name: str) -> VectorCollection:
+        shadow = self._shadows.get(collection_name)
+        if shadow is None:
+            shadow = await store.create_collection(collection_name)
+            self._shadows[collection_name] = shadow
+        return shadow
+
+    async def _copy_documents(self, shadow: VectorCollection, page: dict[str, Any]) -> None:
+        embeddings = await self.target_client.embed(page["documents"])
+        await compact.upsert(
+            shadow,
+            ids=page["ids"],
+            documents=page["documents"],
+            embeddings=embeddings,
+            metadatas=page["metadatas"],
+        )
+
+    async def _copy(self, progress: IndexProgress) -> None:
+        """Постраничное копирование индекса с сохранением позиции после каждой страницы"""
+
+        try:
+            source = await run_in_store("get_collection", client.get_collection, progress.source)
+        except NotFoundError:
+            # Индекс удалён во время копирования, теневая коллекция уберётся при переключении
+            progress.copied = True
+            await self._save_progress(progress)
+            return
+        shadow = await self.get_shadow(progress.shadow)
+        progress.total = await run_in_store("count", source.count)
+        while progress.offset < progress.total:
+            page = await run_in_store(
+                "get",
+                source.get,
+                limit=self.page_size,
+                offset=progress.offset,
+                include=["documents", "metadatas"],
+            )
+            if not page["ids"]:
+                break
+            await self._copy_documents(shadow, page)
+            progress.offset += len(page["ids"])
+            progress.total = await run_in_store("count", source.count)
+            await self._save_progress(progress)
+            await asyncio.sleep(self.pause)
+        progress.copied = True
+        await self._save_progress(progress)
+        logger.info("Copied `%s` into `%s`", progress.index_name, progress.shadow)
+
+    @staticmethod
+    async def _content_hashes(collection: VectorCollection) -> dict[str, str]:
+        """Отпечатки содержимого всех документов коллекции"""
+
+        hashes, offset = {}, 0
+        while True:
+            page = await run_in_store(
+                "get",
+                collection.get,
+                limit=RECONCILE_PAGE_SIZE,
+                offset=offset,
+                include=["documents", "metadatas"],
+            )
+            if not page["ids"]:
+                return hashes
+            for doc_id, document, metadata in zip(
+                    page["ids"], page["documents"], page["metadatas"], strict=True
+            ):
+                hashes[doc_id] = content_hash(document, metadata)
+            offset += len(page["ids"])
+
+    async def _reconcile(self, progress: IndexProgress) -> None:
+        """Перенос изменений, сделанных в исходной коллекции после копирования страниц:
+        новые и изменённые (в том числе `update` и `upsert`) документы копируются заново,
+        удалённые удаляются из теневой коллекции.
+        """
+
+        try:
+            source = await run_in_store("get_collection", client.get_collection, progress.source)
+        except NotFoundError:
+            # Исходная коллекция уже удалена завершённым ранее переключением
+            return
+        shadow = await self.get_shadow(progress.shadow)
+        source_hashes = await self._content_hashes(source)
+        shadow_hashes = await self._content_hashes(shadow)
+        stale = [
+            doc_id for doc_id, digest in source_hashes.items()
+            if shadow_hashes.get(doc_id) != digest
+        ]
+        removed = list(shadow_hashes.keys() - source_hashes.keys())
+        for i in range(0, len(stale), self.page_size):
+            page = await run_in_store(
+                "get",
+                source.get,
+                ids=stale[i:i + self.page_size],
+                include=["documents", "metadatas"],
+            )
+            await self._copy_documents(shadow, page)
+        if removed:
+            await compact.delete(shadow, removed)
+        if stale or removed:
+            logger.info(
+                "Reconciled `%s`: %s copied, %s removed",
+                progress.index_name, len(stale), len(removed)
+            )
+
+    async def _forget_deleted(self) -> None:
+        """Исключение индексов, удалённых во время копирования, вместе с их тенями"""
+
+        collections = await run_in_store("list_collections", client.list_collections)
+        names = {getattr(collection, "name", collection) for collection in collections}
+        for index_name, progress in list(self.progress.items()):
+            if progress.source in names or store.resolve(index_name) == progress.shadow:
+                continue
+            with suppress(NotFoundError):
+                await run_in_store("delete_collection", client.delete_collection, progress.shadow)
+            await compact.drop(progress.shadow)
+            self._shadows.pop(progress.shadow, None)
+            del self.progress[index_name]
+            await self._conn.execute("DELETE FROM progress WHERE index_name = ?", (index_name,))
+            await self._conn.commit()
+            logger.info("Index `%s` was deleted during re-embedding", index_name)
+
+    async def _cutover(self) -> None:
+        await self._forget_deleted()
+        for progress in self.progress.values():
+            await self._reconcile(progress)
+        async with self._switch_lock:
+            async with raw_connection() as conn, conn.transaction():
+                await conn.executemany(
+                    UPSERT_ALIAS,
+                    [(name, progress.shadow) for name, progress in self.progress.items()],
+                )
+                await conn.execute(
+                    UPSERT_ACTIVE_MODEL, self.target_client.base_url, self.target_model_id
+                )
+            # Индексы, клиент и кэш эмбеддингов переключаются без ожиданий между шагами
+            store.set_aliases({name: progress.shadow for name, progress in self.progress.items()})
+            embedding_cache.model_id = self.target_model_id
+            await embedding_client.switch(self.target_client.base_url)
+            for hook in self._cutover_hooks:
+                hook()
+        logger.info("Switched %s indexes to `%s`", len(self.progress), self.target_model_id)
+        # Пока остальные воркеры не обновили переключение, они пишут в старые коллекции
+        await asyncio.sleep(2 * self.refresh_interval)
+        for progress in self.progress.values():
+            await self._reconcile(progress)
+            with suppress(NotFoundError):
+                await run_in_store("delete_collection", client.delete_collection, progress.source)
+            await compact.drop(progress.source)
+        await self._conn.execute("DELETE FROM job")
+        await self._conn.execute("DELETE FROM progress")
+        await self._conn.commit()
+        self._shadows.clear()
+        self.progress.clear()
+        await self.target_client.close()
+        logger.info("Re-embedding to `%s` finished", self.target_model_id)
+        self.target_model_id = None
+
+    def shadow_of(self, index_name: str) -> str | None:
+        """Теневая коллекция индекса, если для него сейчас нужно двойное чтение"""
+
+        return self._dual_read.get(index_name)
+
+    async def embed_queries(self, queries: list[str]) -> list[list[float]]:
+        """Векторизация запросов новой моделью для чтения из теневой коллекции"""
+
+        if self.query_client is None:
+            raise RuntimeError("Re-embedding is not copying, there is no shadow to read!")
+        return await self.query_client.embed(queries, batch_size=len(queries))
+
+
+reembedding = Reembedding(
+    path=REEMBEDDING_STATE_PATH,
+    page_size=settings.rag.reembed_page_size,
+    pause=settings.rag.reembed_pause,
+    refresh_interval=settings.rag.reembed_refresh_interval,
+)
@@ -0,0 +1,437 @@
+# Модуль реализует векторное хранилище на Postgres с расширением pgvector.
+# Клиент и коллекции повторяют используемое модулем rag подмножество API Chroma,
+# методы асинхронные и вызываются через `run_in_store` прямо в event loop.
+
+from typing import Any, Literal
+
+import asyncio
+import hashlib
+import json
+import logging
+import struct
+from collections.abc import AsyncGenerator, Sequence
+from contextlib import asynccontextmanager
+from operator import itemgetter
+
+import asyncpg
+import numpy as np
+from chromadb.errors import NotFoundError
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_TABLE = "rag_collections"
+
+# Операторы фильтров Chroma, сравнивающие значение метаданных с операндом как jsonb
+_COMPARISONS = {"$ne": "IS DISTINCT FROM", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _encode_vector(vector: Any) -> bytes:
+    # Бинарный формат pgvector: размерность, зарезервированное поле и float32 big-endian
+    values = np.asarray(vector, dtype=">f4")
+    return struct.pack(">HH", len(values), 0) + values.tobytes()
+
+
+def _decode_vector(data: bytes) -> np.ndarray:
+    dims, _ = struct.unpack_from(">HH", data)
+    return np.frombuffer(data, dtype=">f4", count=dims, offset=4).astype(np.float32)
+
+
+def _param(params: list[Any], value: Any) -> str:
+    params.append(value)
+    return f"${len(params)}"
+
+
+def _filter_sql(where: dict[str, Any], params: list[Any]) -> str:
+    """Перевод фильтра по метаданным из синтаксиса Chroma в условие SQL.
+    Семантика совпадает с `lexical.matches_filter`.
+    """
+
+    clauses = []
+    for key, condition in where.items():
+        if key in {"$and", "$or"}:
+            joined = f" {key[1:].upper()} ".join(_filter_sql(sub, params) for sub in condition)
+            clauses.append(f"({joined})")
+            continue
+        operator, operand = (
+            next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+        )
+        if operator == "$eq":
+            # Условие вхождения использует GIN индекс по метаданным
+            clauses.append(f"metadata @> {_param(params, json.dumps({key: operand}))}::jsonb")
+            continue
+        field = f"(metadata -> {_param(params, key)}::text)"
+        if operator in {"$in", "$nin"}:
+            values = _param(params, [json.dumps(value) for value in operand])
+            clause = f"coalesce({field} = ANY({values}::jsonb[]), FALSE)"
+            clauses.append(clause if operator == "$in" else f"NOT {clause}")
+        elif operator in _COMPARISONS:
+            operand_sql = _param(params, json.dumps(operand))
+            clauses.append(f"{field} {_COMPARISONS[operator]} {operand_sql}::jsonb")
+        else:
+            raise ValueError(f"Unsupported filter operator `{operator}`!")
+    return " AND ".join(clauses) or "TRUE"
+
+
+def _where_sql(
+        params: list[Any],
+        ids: Sequence[str] | None = None,
+        where: dict[str, Any] | None = None,
+        where_document: dict[str, Any] | None = None,
+) -> str:
+    clauses = []
+    if ids is not None:
+        clauses.append(f"id = ANY({_param(params, list(ids))}::text[])")
+    if where:
+        clauses.append(_filter_sql(where, params))
+    if where_document:
+        clauses.append(f"strpos(document, {_param(params, where_document['$contains'])}) > 0")
+    return " AND ".join(clauses) or "TRUE"
+
+
+class PgVectorCollection:
+    """Коллекция - отдельная таблица с колонкой `vector(dims)` и ANN индексом.
+    Таблица создаётся при первой записи, когда становится известна размерность.
+    """
+
+    def __init__(
+            self,
+            client: "PgVectorClient",
+            name: str,
+            table: str,
+            metadata: dict[str, Any] | None,
+            dims: int | None,
+    ) -> None:
+        self.client = client
+        self.name = name
+        self.table = table
+        self.metadata = metadata
+        self.dims = dims
+
+    @staticmethod
+    def _columns(include: Sequence[str]) -> list[str]:
+        fields = {"documents": "document", "metadatas": "metadata", "embeddings": "embedding"}
+        return ["id", *(column for field, column in fields.items() if field in include)]
+
+    @staticmethod
+    def _row_value(row: asyncpg.Record, column: str) -> Any:
+        if column == "metadata":
+            return None if row[column] is None else json.loads(row[column])
+        return row[column]
+
+    async def _has_table(self) -> bool:
+        """Таблица могла быть создана другим процессом после получения коллекции"""
+
+        if self.dims is None:
+            async with self.client.acquire() as conn:
+                self.dims = await conn.fetchval(
+                    f"SELECT dims FROM {REGISTRY_TABLE} WHERE name = $1", self.name  # noqa: S608
+                )
+        return self.dims is not None
+
+    async def count(self) -> int:
+        if not await self._has_table():
+            return 0
+        async with self.client.acquire() as conn:
+            return await conn.fetchval(f"SELECT count(*) FROM {self.table}")  # noqa: S608
+
+    async def get(
+            self,
+            ids: Sequence[str] | None = None,
+            where: dict[str, Any] | None = None,
+            limit: int | None = None,
+            offset: int | None = None,
+            include: Sequence[str] = ("documents", "metadatas"),
+    ) -> dict[str, Any]:
+        columns = self._columns(include)
+        result: dict[str, Any] = {
+            field: [] if field in include else None
+            for field in ("documents", "metadatas", "embeddings")
+        }
+        result["ids"] = []
+        if not await self._has_table():
+            return result
+        params: list[Any] = []
+        query = (
+            f"SELECT {', '.join(columns)} FROM {self.table} "  # noqa: S608
+            f"WHERE {_where_sql(params, ids=ids, where=where)} ORDER BY seq"
+        )
+        if limit is not None:
+            query += f" LIMIT {_param(params, limit)}"
+        if offset:
+            query += f" OFFSET {_param(params, offset)}"
+        async with self.client.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+        for field, column in zip(
+            ("ids", "documents", "metadatas", "embeddings"),
+            ("id", "document", "metadata", "embedding"),
+            strict=True,
+        ):
+            if column in columns:
+                result[field] = [self._row_value(row, column) for row in rows]
+        return result
+
+    async def query(
+            self,
+            query_embeddings: Any,
+            n_results: int = 10,
+            where: dict[str, Any] | None = None,
+            where_document: dict[str, Any] | None = None,
+            include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> dict[str, Any]:
+        """Поиск ближайших соседей. Расстояния - квадрат L2, как у Chroma"""
+
+        fields = ("ids", "documents", "metadatas", "embeddings", "distances")
+        result: dict[str, Any] = {
+            field: [] if field == "ids" or field in include else None for field in fields
+        }
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if not await self._has_table():
+            for field in fields:
+                if result[field] is not None:
+                    result[field] = [[] for _ in queries]
+            return result
+        columns = self._columns(include)
+        params: list[Any] = [None]
+        condition = _where_sql(params, where=where, where_document=where_document)
+        query = (
+            f"SELECT {', '.join(columns)}, embedding <-> $1 AS distance "  # noqa: S608
+            f"FROM {self.table} WHERE {condition} "
+            f"ORDER BY embedding <-> $1 LIMIT {_param(params, n_results)}"
+        )
+        async with self.client.acquire() as conn:
+            for query_vector in queries:
+                params[0] = query_vector
+                rows = sorted(await conn.fetch(query, *params), key=itemgetter("distance"))
+                result["ids"].append([row["id"] for row in rows])
+                for field, column in (
+                        ("documents", "document"),
+                        ("metadatas", "metadata"),
+                        ("embeddings", "embedding"),
+                ):
+                    if result[field] is not None:
+                        result[field].append([self._row_value(row, column) for row in rows])
+                if result["distances"] is not None:
+                    result["distances"].append([row["distance"] ** 2 for row in rows])
+        return result
+
+    async def upsert(
+            self,
+            ids: Sequence[str],
+            embeddings: Any,
+            documents: Sequence[str] | None = None,
+            metadatas: Sequence[dict[str, Any] | None] | None = None,
+    ) -> None:
+        """Пакетная запись через COPY во временную таблицу и один INSERT ... ON CONFLICT"""
+
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        if not await self._has_table():
+            await self.client.create_table(self, vectors.shape[1])
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+        records = [
+            (doc_id, document, None if metadata is None else json.dumps(metadata), vector)
+            for doc_id, document, metadata, vector in zip(
+                ids, documents, metadatas, vectors, strict=True
+            )
+        ]
+        async with self.client.acquire() as conn, conn.transaction():
+            await conn.execute(
+                "CREATE TEMP TABLE rag_staging "
+                "(id TEXT, document TEXT, metadata JSONB, embedding vector) ON COMMIT DROP"
+            )
+            await conn.copy_records_to_table(
+                "rag_staging",
+                records=records,
+                columns=["id", "document", "metadata", "embedding"],
+            )
+            await conn.execute(
+                f"INSERT INTO {self.table} (id, document, metadata, embedding) "  # noqa: S608
+                "SELECT DISTINCT ON (id) id, document, metadata, embedding FROM rag_staging "
+                "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document, "
+                "metadata = EXCLUDED.metadata, embedding = EXCLUDED.embedding"
+            )
+
+    async def update(
+            self, ids: Sequence[str], metadatas: Sequence[dict[str, Any]]
+    ) -> None:
+        if not await self._has_table():
+            return
+        async with self.client.acquire() as conn:
+            await conn.executemany(
+                f"UPDATE {self.table} SET metadata = $2::jsonb WHERE id = $1",  # noqa: S608
+                [
+                    (doc_id, json.dumps(metadata))
+                    for doc_id, metadata in zip(ids, metadatas, strict=True)
+                ],
+            )
+
+    async def delete(self, ids: Sequence[str]) -> None:
+        if not await self._has_table():
+            return
+        async with self.client.acquire() as conn:
+            await conn.execute(
+                f"DELETE FROM {self.table} WHERE id = ANY($1::text[])", list(ids)  # noqa: S608
+            )
+
+
+class PgVectorClient:
+    """Клиент хранилища pgvector с пулом соединений asyncpg.
+
+    :param dsn: Строка подключения к Postgres.
+    :param index_type: ANN индекс новых коллекций: `hnsw` или `ivfflat`.
+    :param index_options: Параметры построения индекса (`m`, `ef_construction` или `lists`).
+    :param search_options: Параметры поиска сессии (`hnsw.ef_search` или `ivfflat.probes`).
+    """
+
+    def __init__(
+            self,
+            dsn: str,
+            index_type: Literal["hnsw", "ivfflat"] = "hnsw",
+            index_options: dict[str, int] | None = None,
+            search_options: dict[str, int] | None = None,
+            max_connections: int = 10,
+    ) -> None:
+        self.dsn = dsn
+        self.index_type = index_type
+        self.index_options = index_options or {}
+        self.search_options = search_options or {}
+        self.max_connections = max_connections
+        self._pool: asyncpg.Pool | None = None
+        self._lock = asyncio.Lock()
+
+    async def _init_connection(self, conn: asyncpg.Connection) -> None:
+        await conn.set_type_codec(
+            "vector",
+            schema="public",
+            encoder=_encode_vector,
+            decoder=_decode_vector,
+            format="binary",
+        )
+        for option, value in self.search_options.items():
+            await conn.execute(f"SET {option} = {int(value)}")
+        # Итеративный обход индекса (pgvector >= 0.8) добирает результаты при фильтрах,
+        # ivfflat поддерживает только нестрогий порядок, поэтому выдача досортировывается
+        scan = "strict_order" if self.index_type == "hnsw" else "relaxed_order"
+        await conn.execute(f"SET {self.index_type}.iterative_scan = {scan}")
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        async with self._lock:
+            if self._pool is None:
+                conn = await asyncpg.connect(self.dsn)
+                try:
+                    await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+                    await conn.execute(
+                        f"""CREATE TABLE IF NOT EXISTS {REGISTRY_TABLE} (
+                            name TEXT PRIMARY KEY,
+                            table_name TEXT NOT NULL,
+                            metadata JSONB,
+                            dims INTEGER
+                        )"""
+                    )
+                finally:
+                    await conn.close()
+                self._pool = await asyncpg.create_pool(
+                    self.dsn, max_size=self.max_connections, init=self._init_connection
+                )
+                logger.info("pgvector store connected, `%s` index", self.index_type)
+        return self._pool
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncGenerator[asyncpg.Connection]:
+        """Соединение из пула"""
+
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            yield conn
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def _collection(self, row: asyncpg.Record) -> PgVectorCollection:
+        metadata = None if row["metadata"] is None else json.loads(row["metadata"])
+        return PgVectorCollection(self, row["name"], row["table_name"], metadata, row["dims"])
+
+    async def get_or_create_collection(
+            self, name: str, metadata: dict[str, Any] | None = None
+    ) -> PgVectorCollection:
+        table = f"rag_vectors_{hashlib.sha1(name.encode()).hexdigest()[:16]}"  # noqa: S324
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                f"INSERT INTO {REGISTRY_TABLE} (name, table_name, metadata) "  # noqa: S608
+                "VALUES ($1, $2, $3::jsonb) ON CONFLICT (name) DO NOTHING",
+                name, table, None if metadata is None else json.dumps(metadata),
+            )
+            row = await conn.fetchrow(
+                f"SELECT * FROM {REGISTRY_TABLE} WHERE name = $1", name  # noqa: S608
+            )
+        return self._collection(row)
+
+    async def get_collection(self, name: str) -> PgVectorCollection:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(
+                f"SELECT * FROM {REGISTRY_TABLE} WHERE name = $1", name  # noqa: S608
+            )
+        if row is None:
+            raise NotFoundError(f"Collection `{name}` does not exist")
+        return self._collection(row)
+
+    async def list_collections(self) -> list[PgVectorCollection]:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f"SELECT * FROM {REGISTRY_TABLE} ORDER BY name")  # noqa: S608
+        return [self._collection(row) for row in rows]
+
+    async def delete_collection(self, name: str) -> None:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn, conn.transaction():
+            table = await conn.fetchval(
+                f"DELETE FROM {REGISTRY_TABLE} WHERE name = $1 RETURNING table_name",  # noqa: S608
+                name,
+            )
+            if table is None:
+                raise NotFoundError(f"Collection `{name}` does not exist")
+            await conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+    async def create_table(self, collection: PgVectorCollection, dims: int) -> None:
+        """Создание таблицы коллекции с ANN индексом по векторам и GIN индексом по метаданным"""
+
+        options = ", ".join(
+            f"{option} = {int(value)}" for option, value in self.index_options.items()
+        )
+        pool = await self._get_pool()
+        async with pool.acquire() as conn, conn.transaction():
+            await conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {collection.table} (
+                    seq BIGSERIAL,
+                    id TEXT PRIMARY KEY,
+                    document TEXT,
+                    metadata JSONB,
+                    embedding vector({dims}) NOT NULL
+                )"""
+            )
+            await conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {collection.table}_embedding ON {collection.table} "
+                f"USING {self.index_type} (embedding vector_l2_ops)"
+                + (f" WITH ({options})" if options else "")
+            )
+            await conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {collection.table}_metadata ON {collection.table} "
+                "USING gin (metadata jsonb_path_ops)"
+            )
+            await conn.execute(
+                f"UPDATE {REGISTRY_TABLE} SET dims = $2 WHERE name = $1",  # noqa: S608
+                collection.name, dims,
+            )
+        collection.dims = dims
+
+    async def reindex(self, collection: PgVectorCollection) -> None:
+        """Перестроение ANN индекса. Кластеры ivfflat вычисляются по данным на момент
+        построения, поэтому индекс, созданный на пустой таблице, нужно перестроить после загрузки.
+        """
+
+        async with self.acquire() as conn:
+            await conn.execute(f"REINDEX INDEX {collection.table}_embedding")
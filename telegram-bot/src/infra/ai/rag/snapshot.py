@@ -0,0 +1,210 @@
+# Модуль реализует экспорт и импорт снимков коллекций в один файл
+
+from typing import Any
+
+import json
+import logging
+import time
+from pathlib import Path
+
+import aiosqlite
+import anyio
+import numpy as np
+from pydantic import BaseModel
+
+from . import compact
+from .cache import embedding_cache
+from .dedup import duplicates_filter
+from .documents import drop_index
+from .lexical import lexical_indexes
+from .store import VectorCollection, find_collection, get_collection, run_in_store
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+# Попыток экспорта, если коллекция менялась во время выгрузки
+EXPORT_ATTEMPTS = 3
+
+
+class SnapshotManifest(BaseModel):
+    """Описание снимка коллекции"""
+
+    format: int = SNAPSHOT_FORMAT
+    index_name: str
+    model_id: str
+    dims: int = 0
+    count: int = 0
+    created_at: float
+
+
+async def _write_snapshot(
+        collection: VectorCollection,
+        ids: list[str],
+        path: Path,
+        manifest: SnapshotManifest,
+        page_size: int,
+) -> None:
+    await anyio.Path(path).unlink(missing_ok=True)
+    async with aiosqlite.connect(path) as conn:
+        await conn.execute("PRAGMA journal_mode=OFF")
+        await conn.execute("CREATE TABLE manifest (payload TEXT NOT NULL)")
+        await conn.execute(
+            """CREATE TABLE records (
+                position INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document TEXT,
+                metadata TEXT,
+                vector BLOB NOT NULL
+            )"""
+        )
+        for i in range(0, len(ids), page_size):
+            page = await compact.get(
+                collection,
+                ids=ids[i:i + page_size],
+                include=["documents", "metadatas", "embeddings"],
+            )
+            if not page["ids"]:
+                continue
+            matrix = np.asarray(page["embeddings"], dtype="<f4").reshape(len(page["ids"]), -1)
+            manifest.dims = matrix.shape[1]
+            await conn.executemany(
+                "INSERT INTO records (id, document, metadata, vector) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        doc_id,
+                        document,
+                        None if metadata is None else json.dumps(metadata, ensure_ascii=False),
+                        vector.tobytes(),
+                    )
+                    for doc_id, document, metadata, vector in zip(
+                        page["ids"], page["documents"], page["metadatas"], matrix, strict=True
+                    )
+                ],
+            )
+            manifest.count += len(page["ids"])
+        await conn.execute(
+            "INSERT INTO manifest (payload) VALUES (?)", (manifest.model_dump_json(),)
+        )
+        await conn.commit()
+
+
+async def export_snapshot(
+        index_name: str, path: Path, page_size: int = 1000
+) -> SnapshotManifest:
+    """Экспорт коллекции индекса (векторы, документы, метаданные) в один SQLite файл.
+
+    Коллекция выгружается постранично без остановки записи, поэтому список
+    идентификаторов фиксируется до выгрузки и сверяется после неё: если документы
+    добавились или удалились, экспорт повторяется, и снимок всегда соответствует
+    одному состоянию набора документов.
+    Векторы всегда полноразмерные float32, в том числе для компактных коллекций.
+
+    :param index_name: Экспортируемый индекс.
+    :param path: Путь к файлу снимка, существующий файл перезаписывается.
+    :param page_size: Документов, читаемых из коллекции за один запрос.
+    :returns: Описание записанного снимка.
+    :exception LookupError: Индекса не существует.
+    :exception RuntimeError: Коллекция менялась во время всех попыток экспорта.
+    """
+
+    start_time = time.monotonic()
+    collection = await find_collection(index_name)
+    if collection is None:
+        raise LookupError(f"Index `{index_name}` does not exist!")
+    ids = (await run_in_store("get", collection.get, include=[]))["ids"]
+    for attempt in range(1, EXPORT_ATTEMPTS + 1):
+        manifest = SnapshotManifest(
+            index_name=index_name, model_id=embedding_cache.model_id, created_at=time.time()
+        )
+        await _write_snapshot(collection, ids, path, manifest, page_size)
+        current_ids = (await run_in_store("get", collection.get, include=[]))["ids"]
+        if manifest.count == len(ids) and set(current_ids) == set(ids):
+            break
+        logger.warning(
+            "Index `%s` changed during export attempt %s: %s exported, %s now",
+            index_name, attempt, manifest.count, len(current_ids)
+        )
+        ids = current_ids
+    else:
+        await anyio.Path(path).unlink(missing_ok=True)
+        raise RuntimeError(f"Index `{index_name}` is being modified, try again later!")
+    logger.info(
+        "Exported %s documents of `%s` to `%s` in %s seconds",
+        manifest.count, index_name, path, round(time.monotonic() - start_time, 2)
+    )
+    return manifest
+
+
+async def read_manifest(conn: aiosqlite.Connection) -> SnapshotManifest:
+    """Описание снимка с проверкой версии формата"""
+
+    async with conn.execute("SELECT payload FROM manifest") as cursor:
+        row = await cursor.fetchone()
+    if row is None:
+        raise ValueError("Snapshot is incomplete, manifest is missing!")
+    manifest = SnapshotManifest.model_validate_json(row[0])
+    if manifest.format != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format `{manifest.format}`!")
+    return manifest
+
+
+async def _upsert_page(
+        collection: VectorCollection, rows: list[tuple[Any, ...]], dims: int
+) -> None:
+    matrix = np.frombuffer(b"".join(row[3] for row in rows), dtype="<f4").reshape(-1, dims)
+    # Chroma не принимает пустые метаданные, такие документы пишутся отдельной пачкой
+    for with_metadata in (True, False):
+        positions = [i for i, row in enumerate(rows) if (row[2] is not None) == with_metadata]
+        if not positions:
+            continue
+        await compact.upsert(
+            collection,
+            ids=[rows[i][0] for i in positions],
+            documents=[rows[i][1] for i in positions],
+            embeddings=matrix[positions].astype(np.float32),
+            metadatas=[json.loads(rows[i][2]) for i in positions] if with_metadata else None,
+        )
+
+
+async def import_snapshot(
+        path: Path,
+        index_name: str | None = None,
+        replace: bool = False,
+        page_size: int = 1000,
+) -> SnapshotManifest:
+    """Импорт снимка пачками `upsert` без повторной векторизации.
+
+    :param path: Путь к файлу снимка.
+    :param index_name: Индекс, в который загружается снимок (по умолчанию исходный).
+    :param replace: Удалить индекс перед загрузкой, иначе документы дописываются
+    (документы с теми же идентификаторами перезаписываются).
+    :param page_size: Документов в одной пачке записи.
+    :returns: Описание загруженного снимка.
+    """
+
+    start_time = time.monotonic()
+    async with aiosqlite.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        manifest = await read_manifest(conn)
+        if manifest.model_id != embedding_cache.model_id:
+            raise ValueError(
+                f"Snapshot is embedded with `{manifest.model_id}`, "
+                f"but the active model is `{embedding_cache.model_id}`!"
+            )
+        index_name = index_name or manifest.index_name
+        if replace:
+            await drop_index(index_name)
+        collection = await get_collection(index_name)
+        async with conn.execute(
+            "SELECT id, document, metadata, vector FROM records ORDER BY position"
+        ) as cursor:
+            while rows := await cursor.fetchmany(page_size):
+                await _upsert_page(collection, rows, manifest.dims)
+    # Лексический индекс и отпечатки перечитаются из коллекции при следующем обращении
+    lexical_indexes.forget(index_name)
+    duplicates_filter.forget(index_name)
+    await duplicates_filter.changed(index_name)
+    logger.info(
+        "Imported %s documents from `%s` into `%s` in %s seconds",
+        manifest.count, path, index_name, round(time.monotonic() - start_time, 2)
+    )
+    return manifest
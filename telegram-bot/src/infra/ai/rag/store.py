@@ -0,0 +1,361 @@
+# Модуль выносит синхронные вызовы Chroma из event loop в отдельный пул потоков
+# и объединяет конкурентные запросы поиска к одной коллекции
+
+from typing import Any, Protocol
+
+import asyncio
+import inspect
+import json
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+import asyncpg
+import chromadb
+import httpx
+import numpy as np
+from chromadb.errors import NotFoundError
+
+from src.settings import CHROMA_PATH, settings
+from src.utils.metrics import metrics
+
+from .pgvector import PgVectorClient
+
+logger = logging.getLogger(__name__)
+
+
+class VectorCollection(Protocol):
+    """Коллекция векторного хранилища - используемое модулем подмножество API
+    `chromadb.Collection`. Методы синхронные (Chroma) или асинхронные (pgvector),
+    поэтому вызываются только через `run_in_store`.
+    """
+
+    name: str
+    metadata: dict[str, Any] | None
+
+    def count(self) -> Any: ...
+
+    def get(self, *args: Any, **kwargs: Any) -> Any: ...
+
+    def query(self, *args: Any, **kwargs: Any) -> Any: ...
+
+    def upsert(self, *args: Any, **kwargs: Any) -> Any: ...
+
+    def update(self, *args: Any, **kwargs: Any) -> Any: ...
+
+    def delete(self, *args: Any, **kwargs: Any) -> Any: ...
+
+
+class VectorClient(Protocol):
+    """Клиент векторного хранилища. Отсутствующая коллекция - `chromadb.errors.NotFoundError`"""
+
+    def get_or_create_collection(self, name: str, metadata: dict[str, Any] | None = None) -> Any:
+        ...
+
+    def get_collection(self, name: str) -> Any: ...
+
+    def delete_collection(self, name: str) -> Any: ...
+
+    def list_collections(self) -> Any: ...
+
+
+def _create_client() -> VectorClient:
+    """Клиент выбранного хранилища: pgvector, сервер Chroma (`RAG_STORE_URL`)
+    или встроенная Chroma.
+
+    Встроенное хранилище допускает только один процесс-писатель, поэтому при нескольких
+    воркерах uvicorn или отдельном процессе генерации нужен сервер или pgvector.
+    Компактный режим (`RAG_VECTOR_DIMS`) хранит полные векторы в локальном SQLite файле
+    и поэтому доступен только со встроенной Chroma.
+    """
+
+    if settings.rag.vector_dims is not None and (
+        settings.rag.backend != "chroma" or settings.rag.store_url is not None
+    ):
+        raise RuntimeError(
+            "RAG_VECTOR_DIMS requires the embedded Chroma store: full-size vectors are kept "
+            "in a local file that other hosts of a shared store cannot read!"
+        )
+    if settings.rag.backend == "pgvector":
+        hnsw = settings.rag.pgvector_index == "hnsw"
+        return PgVectorClient(
+            settings.postgres.dsn,
+            index_type=settings.rag.pgvector_index,
+            index_options=(
+                {
+                    "m": settings.rag.pgvector_hnsw_m,
+                    "ef_construction": settings.rag.pgvector_hnsw_ef_construction,
+                }
+                if hnsw else {"lists": settings.rag.pgvector_ivf_lists}
+            ),
+            search_options=(
+                {"hnsw.ef_search": settings.rag.pgvector_hnsw_ef_search}
+                if hnsw else {"ivfflat.probes": settings.rag.pgvector_ivf_probes}
+            ),
+            max_connections=settings.rag.pgvector_max_connections,
+        )
+    if settings.rag.store_url is None:
+        return chromadb.PersistentClient(CHROMA_PATH)
+    url = urlsplit(settings.rag.store_url)
+    logger.info("Using vector store server at `%s`", settings.rag.store_url)
+    return chromadb.HttpClient(
+        host=url.hostname, port=url.port or 8000, ssl=url.scheme == "https"
+    )
+
+
+client = _create_client()
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.rag.store_workers, thread_name_prefix="vector-store"
+)
+
+_collections: dict[str, VectorCollection] = {}
+# Индекс -> физическая коллекция, отличается от имени индекса после перевекторизации
+_aliases: dict[str, str] = {}
+
+# Ключ метаданных коллекции с размерностью усечённых векторов компактного режима
+COMPACT_DIMS_KEY = "compact_dims"
+
+
+def is_transient_store_error(error: BaseException) -> bool:
+    """Сбой связи с векторным хранилищем, который имеет смысл повторить"""
+
+    # httpx - транспорт клиента Chroma в режиме сервера, asyncpg - хранилища pgvector
+    return isinstance(
+        error,
+        (
+            OSError,
+            TimeoutError,
+            httpx.TransportError,
+            asyncpg.PostgresConnectionError,
+            asyncpg.ConnectionDoesNotExistError,
+        ),
+    )
+
+
+async def run_in_store[T](operation: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполнение блокирующего вызова векторного хранилища в пуле потоков.
+    Асинхронные функции (хранилище pgvector) выполняются в event loop.
+
+    :param operation: Название операции для гистограммы задержек, например `query`.
+    :param func: Функция хранилища.
+    :returns: Результат вызова функции.
+    """
+
+    loop = asyncio.get_running_loop()
+    start_time = time.perf_counter()
+    try:
+        if inspect.iscoroutinefunction(func):
+            return await func(*args, **kwargs)
+        return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+    finally:
+        metrics.histogram(f"vector_store.{operation}").observe(time.perf_counter() - start_time)
+
+
+# Поля результата `query` со списком значений на каждый запрос, остальные общие
+PER_QUERY_FIELDS = frozenset(
+    {"ids", "documents", "metadatas", "distances", "embeddings", "uris", "data"}
+)
+
+
+class QueryBatcher:
+    """Объединение конкурентных запросов поиска к одной коллекции в один вызов `query`.
+
+    Запросы с одинаковыми параметрами (коллекция, фильтры, `n_results`, поля) копятся
+    `max_wait` секунд и отправляются одним вызовом со всеми эмбеддингами, а пачки разных
+    коллекций и фильтров уходят параллельно через пул потоков. С сервером хранилища это
+    сокращает число HTTP запросов при одновременных поисках.
+
+    Запросы объединяются в пределах процесса: общей точкой для воркеров служит сам
+    сервер хранилища, а пересылка запросов между процессами стоила бы дольше окна сбора.
+    """
+
+    def __init__(self, max_wait: float = 0.002, max_batch_size: int = 32) -> None:
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self._pending: dict[str, list[tuple[Any, asyncio.Future[dict[str, Any]]]]] = {}
+        self._targets: dict[str, tuple[VectorCollection, dict[str, Any]]] = {}
+        self._flush_handles: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def query(
+            self, collection: VectorCollection, query_embeddings: Any, **params: Any
+    ) -> dict[str, Any]:
+        """Поиск с результатом только для переданных эмбеддингов запросов"""
+
+        if self.max_wait <= 0:
+            return await run_in_store(
+                "query", collection.query, query_embeddings=query_embeddings, **params
+            )
+        key = json.dumps([collection.name, params], sort_keys=True, default=str)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._targets[key] = (collection, params)
+        pending = self._pending.setdefault(key, [])
+        pending.append((np.asarray(query_embeddings, dtype=np.float32), future))
+        if sum(len(embeddings) for embeddings, _ in pending) >= self.max_batch_size:
+            self._flush(key)
+        elif key not in self._flush_handles:
+            self._flush_handles[key] = loop.call_later(self.max_wait, self._flush, key)
+        return await future
+
+    def _flush(self, key: str) -> None:
+        handle = self._flush_handles.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+        pending = self._pending.pop(key, [])
+        if not pending:
+            return
+        collection, params = self._targets.pop(key)
+        task = asyncio.create_task(self._send(collection, pending, params))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    async def _send(
+            collection: VectorCollection,
+            pending: list[tuple[Any, asyncio.Future[dict[str, Any]]]],
+            params: dict[str, Any],
+    ) -> None:
+        try:
+            result = await run_in_store(
+                "query",
+                collection.query,
+                query_embeddings=np.vstack([embeddings for embeddings, _ in pending]),
+                **params,
+            )
+        except Exception as error:  # noqa: BLE001
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        start = 0
+        for embeddings, future in pending:
+            end = start + len(embeddings)
+            if not future.done():
+                future.set_result({
+                    field: (
+                        value[start:end]
+                        if field in PER_QUERY_FIELDS and value is not None else value
+                    )
+                    for field, value in result.items()
+                })
+            start = end
+        if len(pending) > 1:
+            metrics.increment("vector_store.query.coalesced", len(pending) - 1)
+
+    async def close(self) -> None:
+        """Отправка оставшихся запросов и ожидание их завершения"""
+
+        for key in list(self._pending):
+            self._flush(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+query_batcher = QueryBatcher(
+    max_wait=settings.rag.query_coalesce_window,
+    max_batch_size=settings.rag.query_max_batch_size,
+)
+
+
+def resolve(index_name: str) -> str:
+    """Имя физической коллекции индекса"""
+
+    return _aliases.get(index_name, index_name)
+
+
+def aliases() -> dict[str, str]:
+    """Индексы, переключённые на коллекции с другими именами"""
+
+    return dict(_aliases)
+
+
+def set_aliases(aliases: dict[str, str]) -> None:
+    """Переключение индексов на другие коллекции одним шагом (без ожиданий в event loop)"""
+
+    for index_name, collection_name in aliases.items():
+        if collection_name == index_name:
+            _aliases.pop(index_name, None)
+        else:
+            _aliases[index_name] = collection_name
+        _collections.pop(index_name, None)
+
+
+def collection_metadata() -> dict[str, Any] | None:
+    """Метаданные новой коллекции. Режим хранения фиксируется при создании,
+    поэтому уже существующие коллекции не меняют формат при смене настроек.
+    """
+
+    if settings.rag.vector_dims is None:
+        return None
+    return {COMPACT_DIMS_KEY: settings.rag.vector_dims}
+
+
+def compact_dims(collection: VectorCollection) -> int | None:
+    """Размерность векторов компактной коллекции, `None` для полноразмерной"""
+
+    return (collection.metadata or {}).get(COMPACT_DIMS_KEY)
+
+
+async def create_collection(collection_name: str) -> VectorCollection:
+    """Получение физической коллекции, при отсутствии создаётся в текущем режиме хранения"""
+
+    return await run_in_store(
+        "get_or_create_collection",
+        client.get_or_create_collection,
+        collection_name,
+        metadata=collection_metadata(),
+    )
+
+
+async def get_collection(index_name: str) -> VectorCollection:
+    """Получение коллекции индекса, хендл кэшируется после первого обращения"""
+
+    collection = _collections.get(index_name)
+    if collection is None:
+        collection = await create_collection(resolve(index_name))
+        _collections[index_name] = collection
+    return collection
+
+
+async def find_collection(index_name: str) -> VectorCollection | None:
+    """Коллекция индекса без создания, `None` если индекса нет"""
+
+    collection = _collections.get(index_name)
+    if collection is not None:
+        return collection
+    try:
+        return await run_in_store("get_collection", client.get_collection, resolve(index_name))
+    except NotFoundError:
+        return None
+
+
+def partition_name(index_name: str, partition: Any) -> str:
+    """Имя коллекции-партиции индекса, например `main-index--<course_id>`"""
+
+    return f"{index_name}--{partition}"
+
+
+async def drop_collection(index_name: str) -> None:
+    """Удаление коллекции индекса целиком одной операцией"""
+
+    _collections.pop(index_name, None)
+    collection_name = _aliases.pop(index_name, index_name)
+    try:
+        await run_in_store("delete_collection", client.delete_collection, collection_name)
+    except NotFoundError:
+        logger.warning("Collection `%s` does not exist, nothing to drop", index_name)
+
+
+async def shutdown() -> None:
+    """Остановка пула потоков и соединений хранилища (вызывается при завершении приложения)"""
+
+    if isinstance(client, PgVectorClient):
+        await client.close()
+    executor.shutdown(wait=True)
+    _collections.clear()
+    logger.info("Vector store executor stopped")
@@ -0,0 +1,273 @@
+# Модуль реализует персистентную очередь отложенной записи в точное хранилище
+
+from typing import IO, Any, NamedTuple
+
+import asyncio
+import fcntl
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import suppress
+from itertools import count
+from pathlib import Path
+from uuid import uuid4
+
+import aiosqlite
+
+from src.utils.metrics import metrics
+
+from .documents import SearchHit
+from .embeddings import get_embeddings
+from .exact import ExactIndex, ExactStore
+
+logger = logging.getLogger(__name__)
+
+
+def _merge_hits(
+        stored: list[SearchHit], queued: list[SearchHit], n_results: int
+) -> list[SearchHit]:
+    """Слияние результатов коллекции и очереди. Документ, записанный воркером во время
+    поиска, находится в обоих списках и остаётся один раз с меньшим расстоянием.
+    """
+
+    hits: dict[str, SearchHit] = {}
+    for hit in stored + queued:
+        if hit.id not in hits or hit.distance < hits[hit.id].distance:
+            hits[hit.id] = hit
+    return sorted(hits.values(), key=lambda hit: hit.distance)[:n_results]
+
+
+class PendingWrite(NamedTuple):
+    """Документ, принятый в очередь, но ещё не записанный в коллекцию"""
+
+    row_id: int
+    doc_id: str
+    partition: Any
+    document: str
+    metadata: dict[str, Any]
+
+
+def claim_journal(path: Path) -> tuple[Path, IO]:
+    """Захват свободного журнала очереди эксклюзивной блокировкой файла.
+
+    У каждого процесса (воркера) свой журнал: `path`, `path-1`, `path-2`, ...
+    Блокировка держится до закрытия очереди, поэтому при перезапуске каждый
+    воркер восстанавливает только журнал, который никто больше не пишет.
+
+    :returns: Путь журнала и открытый файл блокировки.
+    """
+
+    for slot in count():
+        journal = path if slot == 0 else path.with_name(f"{path.stem}-{slot}{path.suffix}")
+        lock_file = journal.with_name(f"{journal.name}.lock").open("w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        return journal, lock_file
+    raise AssertionError("unreachable")
+
+
+class WriteBehindQueue:
+    """Очередь отложенной записи документов в `ExactStore`.
+
+    Документ сохраняется в SQLite журнал и сразу виден поиску через `search_many`,
+    а фоновый воркер пачками векторизует и записывает его в коллекцию.
+    Незаписанные при остановке документы дописываются при следующем запуске.
+    Идентификатор документа задаётся журналом (id журнала и номер строки),
+    поэтому повторная запись после сбоя перезаписывает документ, а не дублирует его.
+    """
+
+    def __init__(
+            self,
+            store: ExactStore,
+            path: Path,
+            batch_size: int = 32,
+            flush_interval: float = 1.0,
+    ) -> None:
+        self.store = store
+        self.base_path = path
+        self.path = path
+        self.journal_id = ""
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn: aiosqlite.Connection | None = None
+        self._pending: dict[Any, list[PendingWrite]] = defaultdict(list)
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+        self._lock_file: IO | None = None
+
+    async def open(self) -> None:
+        """Открытие журнала, восстановление незаписанных документов и запуск воркера"""
+
+        if self._conn is not None:
+            return
+        self.path, self._lock_file = await asyncio.to_thread(claim_journal, self.base_path)
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.execute("PRAGMA journal_mode=WAL")
+        await self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pending_writes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                partition TEXT NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        # Номера строк AUTOINCREMENT не переиспользуются в пределах файла журнала
+        await self._conn.execute("CREATE TABLE IF NOT EXISTS journal (id TEXT NOT NULL)")
+        await self._conn.execute(
+            "INSERT INTO journal (id) SELECT ? WHERE NOT EXISTS (SELECT 1 FROM journal)",
+            (str(uuid4()),),
+        )
+        await self._conn.commit()
+        async with self._conn.execute("SELECT id FROM journal") as cursor:
+            (self.journal_id,) = await cursor.fetchone()
+        async with self._conn.execute(
+            "SELECT id, partition, document, metadata FROM pending_writes ORDER BY id"
+        ) as cursor:
+            async for row_id, partition, document, metadata in cursor:
+                write = PendingWrite(
+                    row_id,
+                    self._doc_id(row_id),
+                    json.loads(partition),
+                    document,
+                    json.loads(metadata),
+                )
+                self._pending[write.partition].append(write)
+        if self._pending:
+            logger.info("Recovered %s pending writes from `%s`", len(self), self.path)
+        self._worker = asyncio.create_task(self._run())
+
+    def _doc_id(self, row_id: int) -> str:
+        return f"{self.journal_id}-{row_id}"
+
+    def __len__(self) -> int:
+        return sum(len(writes) for writes in self._pending.values())
+
+    async def close(self) -> None:
+        """Остановка воркера с попыткой дописать очередь и закрытие журнала"""
+
+        if self._conn is None:
+            return
+        if self._worker is not None:
+            # Дожидаемся отмены, чтобы прерванная пачка не писалась одновременно с дозаписью
+            self._worker.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._worker
+            self._worker = None
+        try:
+            while self._pending:
+                await self._flush()
+        except Exception:
+            logger.exception("%s pending writes left in `%s`", len(self), self.path)
+        await self._conn.close()
+        self._conn = None
+        self._lock_file.close()
+        self._lock_file = None
+
+    async def enqueue(self, partition: Any, document: str, metadata: dict[str, Any]) -> None:
+        """Постановка документа в очередь. Возвращается после записи в журнал."""
+
+        if self._conn is None:
+            raise RuntimeError("Write-behind queue is not opened, call `open()` first!")
+        async with self._conn.execute(
+            "INSERT INTO pending_writes (partition, document, metadata, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (json.dumps(partition), document, json.dumps(metadata), time.time()),
+        ) as cursor:
+            row_id = cursor.lastrowid
+        await self._conn.commit()
+        self._pending[partition].append(
+            PendingWrite(row_id, self._doc_id(row_id), partition, document, metadata)
+        )
+        metrics.increment("write_behind.enqueued")
+        if len(self) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            with suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("Failed to flush %s pending writes, will retry", len(self))
+                await asyncio.sleep(self.flush_interval)
+
+    async def _flush(self) -> None:
+        """Векторизация и запись одной пачки документов одним запросом к эмбеддингам.
+
+        Строки журнала удаляются сразу после записи своего раздела: сбой на следующем
+        разделе не приводит к повторной записи уже записанных.
+        """
+
+        batch = sorted(
+            (write for writes in self._pending.values() for write in writes),
+            key=lambda write: write.row_id,
+        )[:self.batch_size]
+        start_time = time.perf_counter()
+        embeddings = await get_embeddings([write.document for write in batch])
+        by_partition: dict[Any, list[int]] = defaultdict(list)
+        for i, write in enumerate(batch):
+            by_partition[write.partition].append(i)
+        for partition, positions in by_partition.items():
+            await self.store.add(
+                partition,
+                documents=[batch[i].document for i in positions],
+                metadatas=[batch[i].metadata for i in positions],
+                embeddings=[embeddings[i] for i in positions],
+                ids=[batch[i].doc_id for i in positions],
+            )
+            written = {batch[i].row_id for i in positions}
+            await self._conn.executemany(
+                "DELETE FROM pending_writes WHERE id = ?", [(row_id,) for row_id in written]
+            )
+            await self._conn.commit()
+            self._pending[partition] = [
+                write for write in self._pending[partition] if write.row_id not in written
+            ]
+            if not self._pending[partition]:
+                del self._pending[partition]
+        metrics.histogram("write_behind.flush").observe(time.perf_counter() - start_time)
+        logger.info("Flushed %s pending writes, %s left", len(batch), len(self))
+
+    async def search_many(
+            self,
+            partition: Any,
+            queries: list[str],
+            metadata_filter: dict[str, Any] | None = None,
+            n_results: int = 10,
+    ) -> list[list[SearchHit]]:
+        """Поиск в разделе с учётом документов, ещё не записанных из очереди.
+
+        Ожидающие документы векторизуются вместе с запросами (эмбеддинги попадают
+        в кэш и переиспользуются воркером) и ранжируются вместе с записанными.
+        """
+
+        pending = list(self._pending.get(partition, ()))
+        if not pending:
+            return await self.store.search_many(partition, queries, metadata_filter, n_results)
+        if not queries:
+            return []
+        embeddings = await get_embeddings(queries + [write.document for write in pending])
+        query_embeddings = embeddings[:len(queries)]
+        pending_index = ExactIndex(
+            [write.doc_id for write in pending],
+            [write.document for write in pending],
+            [{**write.metadata, self.store.partition_key: partition} for write in pending],
+            embeddings[len(queries):],
+        )
+        stored = await self.store.search_embeddings(
+            partition, query_embeddings, metadata_filter, n_results
+        )
+        queued = pending_index.search(query_embeddings, n_results, metadata_filter)
+        return [
+            _merge_hits(stored_hits, queued_hits, n_results)
+            for stored_hits, queued_hits in zip(stored, queued, strict=True)
+        ]
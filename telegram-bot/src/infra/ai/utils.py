@@ -0,0 +1,81 @@
+# Модуль содержит общие утилиты LLM вызовов: учёт попаданий в кэш промптов провайдера
+
+from typing import Any
+
+import logging
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from src.core.commons import current_datetime
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def current_date() -> str:
+    """Текущая дата с точностью до дня.
+
+    Изменчивые значения в промпте округляются и ставятся в конец, чтобы префикс
+    запроса совпадал между вызовами и обслуживался кэшем провайдера.
+    """
+
+    return current_datetime().strftime("%d.%m.%Y")
+
+
+def _cache_hit_tokens(usage: dict[str, Any], token_usage: dict[str, Any]) -> int:
+    # OpenAI-совместимый формат попадает в usage_metadata, DeepSeek отдаёт своё поле
+    cache_read = (usage.get("input_token_details") or {}).get("cache_read")
+    if cache_read is not None:
+        return cache_read
+    return token_usage.get("prompt_cache_hit_tokens") or 0
+
+
+class PromptCacheUsage(AsyncCallbackHandler):
+    """Учёт токенов промпта, обслуженных кэшем провайдера (context caching)"""
+
+    def __init__(self) -> None:
+        self.prompt_tokens: dict[str, int] = {}
+        self.cache_hit_tokens: dict[str, int] = {}
+
+    async def on_llm_end(self, response: LLMResult, **_: Any) -> None:
+        llm_output = response.llm_output or {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+                metadata = getattr(message, "response_metadata", None) or {}
+                token_usage = metadata.get("token_usage") or llm_output.get("token_usage") or {}
+                prompt_tokens = usage.get("input_tokens") or token_usage.get("prompt_tokens")
+                if not prompt_tokens:
+                    continue
+                model_name = (
+                    metadata.get("model_name") or llm_output.get("model_name") or "unknown"
+                )
+                cache_hit_tokens = _cache_hit_tokens(usage, token_usage)
+                self.prompt_tokens[model_name] = (
+                    self.prompt_tokens.get(model_name, 0) + prompt_tokens
+                )
+                self.cache_hit_tokens[model_name] = (
+                    self.cache_hit_tokens.get(model_name, 0) + cache_hit_tokens
+                )
+                metrics.increment("llm.prompt_tokens", prompt_tokens)
+                metrics.increment("llm.prompt_cache_hit_tokens", cache_hit_tokens)
+                logger.info(
+                    "LLM `%s` prompt: %s tokens, %s from provider cache",
+                    model_name, prompt_tokens, cache_hit_tokens
+                )
+
+    @property
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {
+            model_name: {
+                "prompt_tokens": prompt_tokens,
+                "cache_hit_tokens": self.cache_hit_tokens[model_name],
+                "hit_ratio": round(self.cache_hit_tokens[model_name] / prompt_tokens, 4),
+            }
+            for model_name, prompt_tokens in self.prompt_tokens.items()
+        }
+
+
+prompt_cache_usage = PromptCacheUsage()
@@ -1,6 +1,7 @@
-from collections.abc import AsyncIterator
+from collections.abc import AsyncGenerator, AsyncIterator
 from contextlib import asynccontextmanager
 
+import asyncpg
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker,
@@ -19,3 +20,12 @@ sessionmaker = async_sessionmaker(
 async def session_factory() -> AsyncIterator[AsyncSession]:
     async with sessionmaker() as session:
         yield session
+
+
+@asynccontextmanager
+async def raw_connection() -> AsyncGenerator[asyncpg.Connection]:
+    """Соединение asyncpg из общего пула движка для кода, работающего с драйвером напрямую"""
+
+    async with engine.connect() as conn:
+        fairy = await conn.get_raw_connection()
+        yield fairy.driver_connection
@@ -9,6 +9,8 @@ from ...app.schemas import Leader
 from ...core.entities.course import Course, Module
 from ...core.entities.student import DailyChatLimit, Group, LearningProgress, StudentTask
 from ...core.entities.user import AnyUser, Student, Teacher
+from ...core.errors import ConflictError
+from ...utils.context_cache import module_context_cache
 from .base import Base
 from .models import (
     AnyUserOrm,
@@ -117,6 +119,7 @@ class StudentRepository(UserRepository):
         stmt = insert(LearningProgressOrm).values(**progress.model_dump())
         await self.session.execute(stmt)
         await self.session.commit()
+        module_context_cache.invalidate_student(progress.student_id)
 
     async def get_learning_progress(self, student_id: int) -> LearningProgress | None:
         stmt = select(LearningProgressOrm).where(LearningProgressOrm.student_id == student_id)
@@ -133,6 +136,7 @@ class StudentRepository(UserRepository):
         )
         result = await self.session.execute(stmt)
         await self.session.commit()
+        module_context_cache.invalidate_student(student_id)
         model = result.scalar_one()
         return LearningProgress.model_validate(model)
 
@@ -140,6 +144,19 @@ class StudentRepository(UserRepository):
         model = LearningProgressOrm(**progress.model_dump())
         await self.session.merge(model)
         await self.session.commit()
+        module_context_cache.invalidate_student(progress.student_id)
+
+    async def get_current_module_id(self, student_id: int) -> UUID | None:
+        """Текущий модуль студента, без обращения к БД, пока прогресс не менялся"""
+
+        module_id = module_context_cache.get_current_module(student_id)
+        if module_id is not None:
+            return module_id
+        progress = await self.get_learning_progress(student_id)
+        if progress is None:
+            return None
+        module_context_cache.set_current_module(student_id, progress.current_module_id)
+        return progress.current_module_id
 
     async def save_task(self, task: StudentTask) -> None:
         model = StudentTaskOrm(**task.model_dump())
@@ -259,14 +276,59 @@ class CourseRepository(SqlAlchemyRepository[Course, CourseOrm]):
         model = self._to_orm(course)
         self.session.add(model)
         await self.session.commit()
+        # Контекст модулей мог закэшироваться ещё во время генерации курса
+        module_context_cache.invalidate_modules(module.id for module in course.modules)
 
     async def refresh(self, course: Course) -> None:
         model = self._to_orm(course)
         await self.session.merge(model)
         await self.session.commit()
+        module_context_cache.invalidate_modules(module.id for module in course.modules)
+
+    async def delete(self, id: UUID) -> None:  # noqa: A002
+        """Удаление курса вместе с модулями.
+
+        :exception ConflictError: У курса есть группы или студенты с прогрессом по нему.
+        """
+
+        groups = await self.session.scalar(
+            select(func.count()).select_from(GroupOrm).where(GroupOrm.course_id == id)
+        )
+        students = await self.session.scalar(
+            select(func.count())
+            .select_from(LearningProgressOrm)
+            .where(LearningProgressOrm.course_id == id)
+        )
+        if groups or students:
+            raise ConflictError(
+                f"Course has {groups} groups and {students} students with learning progress!"
+            )
+        result = await self.session.execute(
+            delete(ModuleOrm).where(ModuleOrm.course_id == id).returning(ModuleOrm.id)
+        )
+        module_ids = result.scalars().all()
+        await self.session.execute(delete(CourseOrm).where(CourseOrm.id == id))
+        await self.session.commit()
+        module_context_cache.invalidate_modules(module_ids)
 
     async def get_module(self, module_id: UUID) -> Module | None:
         stmt = select(ModuleOrm).where(ModuleOrm.id == module_id)
         result = await self.session.execute(stmt)
         model = result.scalar_one_or_none()
         return None if model is None else Module.model_validate(model)
+
+    async def get_module_context(
+            self,
+            module_id: UUID,
+            include_content_blocks: bool = True,
+            include_assignment: bool = False,
+    ) -> str | None:
+        """Markdown контекст модуля, модуль читается из БД только при промахе кэша"""
+
+        context = module_context_cache.get(module_id, include_content_blocks, include_assignment)
+        if context is not None:
+            return context
+        module = await self.get_module(module_id)
+        if module is None:
+            return None
+        return module_context_cache.render(module, include_content_blocks, include_assignment)
@@ -10,6 +10,10 @@ TIMEZONE = pytz.timezone("Europe/Moscow")
 BASE_DIR = Path(__file__).resolve().parent.parent
 ENV_PATH = BASE_DIR / ".env"
 CHROMA_PATH = BASE_DIR / ".chroma"
+EMBEDDINGS_CACHE_PATH = BASE_DIR / "embeddings-cache.sqlite"
+MEMORY_QUEUE_PATH = BASE_DIR / "memory-queue.sqlite"
+REEMBEDDING_STATE_PATH = BASE_DIR / "reembedding.sqlite"
+RESCORE_VECTORS_PATH = BASE_DIR / "rescore-vectors.sqlite"
 TEMPLATES_DIR = BASE_DIR / "templates"
 
 load_dotenv(ENV_PATH)
@@ -20,6 +24,7 @@ class TelegramSettings(BaseSettings):
 
     bot_token: str = "<BOT TOKEN>"
     webhook_path: str = "/hook"
+    stream_edit_interval: float = 1.5  # Минимальный интервал правок потокового ответа (секунды)
 
 
 class YandexCloudSettings(BaseSettings):
@@ -71,11 +76,91 @@ class PostgresSettings(BaseSettings):
     def sqlalchemy_url(self) -> str:
         return f"postgresql+{self.driver}://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}"
 
+    @property
+    def dsn(self) -> str:
+        return f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}"
+
 
 class HuggingFaceSettings(BaseSettings):
     model_config = SettingsConfigDict(env_prefix="HF_")
 
     space_url: str = "http://localhost:8001"
+    model_id: str = "deepvk/USER-bge-m3"  # Модель эмбеддингов, которую обслуживает space
+    batch_size: int = 10  # Стартовый размер батча, дальше подстраивается под задержку
+    max_batch_size: int = 64
+    target_latency: float = 2.0  # Целевая задержка одного батча в секундах
+    max_concurrency: int = 4  # Максимум батчей в полёте одновременно
+    max_connections: int = 8  # Размер пула keep-alive соединений
+    coalesce_window: float = 0.005  # Окно сбора одиночных запросов в один батч (секунды)
+    coalesce_max_batch_size: int = 32
+    request_timeout: float = 30  # Таймаут одной попытки отправки батча (секунды)
+    connect_timeout: float = 5
+    max_attempts: int = 3  # Попыток на батч, повторяются только сетевые ошибки, 429 и 5xx
+    # Ошибок подряд, после которых space считается недоступным и запросы сразу отклоняются
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30  # Через сколько секунд пропустить пробный запрос
+    # Новая модель, на которую переводятся коллекции фоновой перевекторизацией
+    target_space_url: str | None = None
+    target_model_id: str | None = None
+
+
+class RAGSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="RAG_")
+
+    embeddings_cache_size: int = 100_000  # Максимум эмбеддингов в дисковом кэше
+    backend: Literal["chroma", "pgvector"] = "chroma"  # Векторное хранилище
+    store_workers: int = 4  # Потоки для блокирующих вызовов векторного хранилища
+    # Адрес сервера Chroma (`chroma run --path .chroma`), единственного владельца данных,
+    # к которому подключаются все воркеры. None - встроенное хранилище в CHROMA_PATH
+    store_url: str | None = None
+    query_coalesce_window: float = 0.002  # Окно сбора одинаковых запросов в один (секунды)
+    query_max_batch_size: int = 32  # Максимум эмбеддингов запросов в одном вызове `query`
+    pgvector_index: Literal["hnsw", "ivfflat"] = "hnsw"  # ANN индекс новых коллекций pgvector
+    pgvector_hnsw_m: int = 16
+    pgvector_hnsw_ef_construction: int = 64
+    pgvector_hnsw_ef_search: int = 100  # Кандидатов при поиске, больше - точнее и медленнее
+    # Кластеров ivfflat (порядка строк / 1000), индекс перестраивается после массовой загрузки
+    pgvector_ivf_lists: int = 100
+    pgvector_ivf_probes: int = 10  # Просматриваемых кластеров при поиске
+    pgvector_max_connections: int = 10
+    indexing_window: int = 32  # Чанков в одном окне потоковой индексации
+    dedup_threshold: float = 0.9  # Порог SimHash-сходства, выше которого чанк считается дублем
+    context_token_budget: int = 2000  # Бюджет токенов на результаты поиска в промпте
+    memory_cache_users: int = 1000  # Пользователей, чья память держится в процессе
+    # Через сколько секунд память пользователя перечитывается (её меняют и другие воркеры)
+    memory_cache_ttl: float = 60.0
+    reembed_page_size: int = 64  # Документов в одной странице перевекторизации
+    reembed_pause: float = 0.5  # Пауза между страницами, чтобы не отнимать space у запросов
+    # Период, с которым воркеры подхватывают переключение индексов на новую модель (секунды)
+    reembed_refresh_interval: float = 10.0
+    # Компактный режим новых коллекций: в Chroma хранятся первые `vector_dims` координат,
+    # а полноразмерные float32 векторы в SQLite используются для пересчёта кандидатов.
+    # Уменьшает индекс в памяти, но на диске вместе с полными векторами занимает больше.
+    # Только для встроенной Chroma: файл полных векторов локален для хоста
+    vector_dims: int | None = None
+    rescore_oversample: int = 4  # Кандидатов из Chroma на один итоговый результат
+
+
+class MemorySettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="MEMORY_")
+
+    consolidation_interval: int = 6 * 60 * 60  # Период фоновой консолидации в секундах
+    duplicate_similarity: float = 0.92  # Косинусная близость, выше которой записи сливаются
+    low_confidence: float = 0.5  # Уверенность, ниже которой запись ослабляется со временем
+    confidence_decay: float = 0.8  # Множитель уверенности слабой записи за период ослабления
+    confidence_decay_days: float = 7.0  # Период ослабления, отсчитывается от обновления записи
+    min_confidence: float = 0.2  # Записи с уверенностью ниже удаляются
+    episodic_ttl_days: int = 90  # Время жизни эпизодических воспоминаний
+    write_batch_size: int = 32  # Воспоминаний в одной пачке отложенной записи
+    write_interval: float = 1.0  # Максимальная задержка отложенной записи в секундах
+
+
+class ChatbotSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="CHATBOT_")
+
+    # Хранилище истории диалогов: sqlite - файл рядом с кодом (один процесс),
+    # postgres - общая база, позволяет запускать несколько воркеров и хостов
+    checkpointer: Literal["sqlite", "postgres"] = "sqlite"
 
 
 class AppSettings(BaseSettings):
@@ -83,6 +168,9 @@ class AppSettings(BaseSettings):
 
     url: str = "http://localhost:8000"
     port: int = 8000
+    # Ключ заголовка `X-API-Key` служебных эндпоинтов (снимки, перевекторизация),
+    # без ключа они недоступны
+    admin_api_key: str | None = None
 
 
 class Settings(BaseSettings):
@@ -91,6 +179,9 @@ class Settings(BaseSettings):
     deepseek: DeepSeekSettings = DeepSeekSettings()
     postgres: PostgresSettings = PostgresSettings()
     huggingface: HuggingFaceSettings = HuggingFaceSettings()
+    rag: RAGSettings = RAGSettings()
+    memory: MemorySettings = MemorySettings()
+    chatbot: ChatbotSettings = ChatbotSettings()
     app: AppSettings = AppSettings()
 
 
@@ -0,0 +1,102 @@
+# Модуль реализует кэш отформатированного контекста модулей и текущих модулей студентов
+
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from uuid import UUID
+
+from src.core.entities.course import Module
+
+from .formatting import get_module_context
+from .metrics import metrics
+
+type ContextKey = tuple[UUID, int, bool, bool]
+
+
+class ModuleContextCache:
+    """LRU кэш Markdown контекста модулей для агентов.
+
+    Ключ контекста - id модуля, версия его содержимого и параметры форматирования.
+    Версия увеличивается при записи курса (`CourseRepository.refresh`), поэтому
+    устаревший контекст больше не запрашивается и вытесняется по LRU.
+    Отдельно хранится текущий модуль каждого студента, сбрасываемый при записи прогресса.
+    Сброс действует в пределах процесса, изменения, сделанные другими воркерами,
+    видны после истечения `ttl` секунд жизни записи.
+    """
+
+    def __init__(
+            self, max_contexts: int = 512, max_students: int = 10_000, ttl: float = 60.0
+    ) -> None:
+        self.max_contexts = max_contexts
+        self.max_students = max_students
+        self.ttl = ttl
+        self._versions: dict[UUID, int] = {}
+        self._contexts: OrderedDict[ContextKey, tuple[float, str]] = OrderedDict()
+        self._current_modules: OrderedDict[int, tuple[float, UUID]] = OrderedDict()
+
+    def _key(
+            self, module_id: UUID, include_content_blocks: bool, include_assignment: bool
+    ) -> ContextKey:
+        version = self._versions.get(module_id, 0)
+        return module_id, version, include_content_blocks, include_assignment
+
+    def get(
+            self,
+            module_id: UUID,
+            include_content_blocks: bool = True,
+            include_assignment: bool = False,
+    ) -> str | None:
+        """Закэшированный контекст актуальной версии модуля"""
+
+        key = self._key(module_id, include_content_blocks, include_assignment)
+        entry = self._contexts.get(key)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            metrics.increment("module_context.cache.miss")
+            return None
+        self._contexts.move_to_end(key)
+        metrics.increment("module_context.cache.hit")
+        return entry[1]
+
+    def render(
+            self,
+            module: Module,
+            include_content_blocks: bool = True,
+            include_assignment: bool = False,
+    ) -> str:
+        """`get_module_context` с кэшированием результата"""
+
+        context = self.get(module.id, include_content_blocks, include_assignment)
+        if context is not None:
+            return context
+        context = get_module_context(module, include_content_blocks, include_assignment)
+        key = self._key(module.id, include_content_blocks, include_assignment)
+        self._contexts[key] = (time.monotonic(), context)
+        self._contexts.move_to_end(key)
+        while len(self._contexts) > self.max_contexts:
+            self._contexts.popitem(last=False)
+        return context
+
+    def invalidate_modules(self, module_ids: Iterable[UUID]) -> None:
+        """Новая версия содержимого модулей"""
+
+        for module_id in module_ids:
+            self._versions[module_id] = self._versions.get(module_id, 0) + 1
+
+    def get_current_module(self, student_id: int) -> UUID | None:
+        entry = self._current_modules.get(student_id)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            return None
+        self._current_modules.move_to_end(student_id)
+        return entry[1]
+
+    def set_current_module(self, student_id: int, module_id: UUID) -> None:
+        self._current_modules[student_id] = (time.monotonic(), module_id)
+        self._current_modules.move_to_end(student_id)
+        while len(self._current_modules) > self.max_students:
+            self._current_modules.popitem(last=False)
+
+    def invalidate_student(self, student_id: int) -> None:
+        self._current_modules.pop(student_id, None)
+
+
+module_context_cache = ModuleContextCache()
@@ -35,41 +35,45 @@ def get_assignment_context(assignment: AnyAssignment) -> str:
     return context
 
 
+def get_content_block_context(content_block: AnyContentBlock) -> str:
+    context = f"### {content_block.content_type.value}\n"
+    match content_block.content_type:
+        case ContentType.TEXT:
+            context += f"{content_block.md_content}\n\n"
+        case ContentType.VIDEO:
+            context += (
+                f"Платформа: {content_block.platform}\n"
+                f"Ссылка на видео: {content_block.url}\n"
+                f"Название видео: {content_block.title}\n"
+                "Вопросы для обсуждения:\n"
+                f" - {'\n - '.join(content_block.discussion_questions)}"
+            )
+        case ContentType.QUIZ:
+            context += (
+                "Вопросы для самопроверки:\n"
+                f" - {'\n - '.join([
+                    f"вопрос: {question}; ответ: {answer}"
+                    for question, answer in content_block.questions
+                ])}"
+            )
+        case ContentType.PROGRAM_CODE:
+            context += (
+                f"```{content_block.language}\n{content_block.code}\n```\n\n"
+                f"Объяснение: {content_block.explanation}"
+            )
+        case ContentType.MERMAID:
+            context += (
+                f"Название диаграммы: {content_block.title}\n"
+                f"Диаграмма:\n{content_block.mermaid_code}\n"
+                f"Объяснение: {content_block.explanation}"
+            )
+    return context
+
+
 def get_content_blocks_context(content_blocks: list[AnyContentBlock]) -> str:
     context = "## Теоретический материал\n\n"
     for content_block in content_blocks:
-        context += f"### {content_block.content_type.value}\n"
-        match content_block.content_type:
-            case ContentType.TEXT:
-                context += f"{content_block.md_content}\n\n"
-            case ContentType.VIDEO:
-                context += (
-                    f"Платформа: {content_block.platform}\n"
-                    f"Ссылка на видео: {content_block.url}\n"
-                    f"Название видео: {content_block.title}\n"
-                    "Вопросы для обсуждения:\n"
-                    f" - {'\n - '.join(content_block.discussion_questions)}"
-                )
-            case ContentType.QUIZ:
-                context += (
-                    "Вопросы для самопроверки:\n"
-                    f" - {'\n - '.join([
-                        f"вопрос: {question}; ответ: {answer}"
-                        for question, answer in content_block.questions
-                    ])}"
-                )
-            case ContentType.PROGRAM_CODE:
-                context = (
-                    f"```{content_block.language}\n{content_block.code}\n```\n\n"
-                    f"Объяснение: {content_block.explanation}"
-                )
-            case ContentType.MERMAID:
-                context += (
-                    f"Название диаграммы: {content_block.title}\n"
-                    f"Диаграмма:\n{content_block.mermaid_code}\n"
-                    f"Объяснение: {content_block.explanation}"
-                )
-        context += "\n\n"
+        context += f"{get_content_block_context(content_block)}\n\n"
     return context
 
 
@@ -0,0 +1,96 @@
+# Модуль реализует простые in-process метрики (счётчики и гистограммы задержек)
+
+import asyncio
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов гистограммы в секундах
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными бакетами"""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхней границе бакета"""
+
+        if self.count == 0:
+            return 0.0
+        rank, cumulative = q * self.count, 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> dict[str, float | dict[str, int]]:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "avg": round(self.total / self.count, 6) if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": round(self.max, 6),
+            "buckets": {
+                f"le_{bucket}": count
+                for bucket, count in zip(self.buckets, self.counts, strict=False)
+            } | {"le_inf": self.counts[-1]},
+        }
+
+
+class MetricsRegistry:
+    """Реестр метрик приложения"""
+
+    def __init__(self) -> None:
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self.counters: dict[str, float] = {}
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        if name not in self.histograms:
+            self.histograms[name] = LatencyHistogram()
+        return self.histograms[name]
+
+    def increment(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            "counters": dict(self.counters),
+            "histograms": {name: hist.snapshot() for name, hist in self.histograms.items()},
+        }
+
+
+metrics = MetricsRegistry()
+
+
+async def monitor_event_loop_lag(interval: float = 0.25) -> None:
+    """Фоновый замер задержки event loop (насколько дольше ожидаемого спал таймер).
+    Показывает, как долго loop был заблокирован синхронным кодом.
+    """
+
+    loop = asyncio.get_running_loop()
+    while True:
+        start_time = loop.time()
+        await asyncio.sleep(interval)
+        lag = loop.time() - start_time - interval
+        metrics.histogram("event_loop.lag").observe(max(lag, 0.0))
+        if lag > 1:
+            logger.warning("Event loop was blocked for %s seconds", round(lag, 2))
@@ -25,3 +25,18 @@ export async function chat(userId, text, courseId) {
   console.log(JSON.stringify(request));
   return response;
 }
+
+export async function chatStream(userId, text, courseId) {
+  const request = {
+    user_id: userId,
+    text: text,
+  };
+  return await fetch(`/api/v1/agents/chatbot/stream?course_id=${courseId}`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      Accept: "text/event-stream",
+    },
+    body: JSON.stringify(request),
+  });
+}
@@ -1,4 +1,14 @@
-import { chat } from "../general/rest.js";
+import { chatStream } from "../general/rest.js";
+
+// Подписи инструментов ассистента, пока он ими пользуется
+const TOOL_STATUSES = {
+  knowledge_search: "Ищу в материалах курса…",
+  batch_knowledge_search: "Ищу в материалах курса…",
+  get_current_module_context: "Смотрю текущий модуль…",
+  remember: "Запоминаю…",
+  search_memory: "Вспоминаю…",
+  batch_search_memory: "Вспоминаю…",
+};
 
 let userId = null;
 let courseId = null;
@@ -90,41 +100,132 @@ async function sendMessage() {
   showTypingIndicator();
 
   try {
-    const response = await chat(userId, message, courseId);
+    const response = await chatStream(userId, message, courseId);
 
     if (response.status === 429) {
       addMessage(
         "Ой, мы так увлеклись беседой, что потратили все сегодняшние сообщения! Возвращайся завтра.",
         "ai",
       );
-    } else if (!response.ok) {
-      addMessage(
-        "Извините, произошла ошибка при получении ответа. Пожалуйста, попробуйте позже.",
-        "ai",
-      );
+    } else if (!response.ok || !response.body) {
+      addMessage(ERROR_TEXT, "ai");
+    } else {
+      await renderStream(response.body);
     }
-    const result = await response.json();
-
+  } catch (error) {
+    console.error("Error getting AI response:", error);
+    addMessage(ERROR_TEXT, "ai");
+  } finally {
     // Убираем индикатор печатания
     hideTypingIndicator();
+    setToolStatus(null);
+  }
+}
 
-    // Добавляем ответ ИИ
-    addMessage(result.text, "ai");
+const ERROR_TEXT =
+  "Извините, произошла ошибка при получении ответа. Пожалуйста, попробуйте позже.";
+
+// ================== ПОТОКОВЫЙ ОТВЕТ ==================
+async function renderStream(body) {
+  const reader = body.pipeThrough(new TextDecoderStream()).getReader();
+  let messageDiv = null;
+  let text = "";
+  let buffer = "";
+  let renderScheduled = false;
+
+  // Markdown перерисовывается не чаще одного раза за кадр
+  const scheduleRender = () => {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(() => {
+      renderScheduled = false;
+      if (!messageDiv) return;
+      messageDiv.innerHTML = formatMessage(text);
+      scrollToBottom();
+    });
+  };
+
+  const handleEvent = (type, data) => {
+    if (type === "token") {
+      if (!messageDiv) {
+        // Первый токен заменяет точки индикатора, но отправка блокируется до конца ответа
+        document.getElementById("typingIndicator")?.remove();
+        messageDiv = addMessage("", "ai");
+      }
+      setToolStatus(null);
+      text += data.text;
+      scheduleRender();
+    } else if (type === "tool_start") {
+      setToolStatus(TOOL_STATUSES[data.tool] || "Работаю с инструментами…");
+    } else if (type === "tool_end") {
+      setToolStatus(null);
+    } else if (type === "done") {
+      text = data.text || text;
+      if (!messageDiv) messageDiv = addMessage("", "ai");
+      scheduleRender();
+    } else if (type === "error") {
+      addMessage(ERROR_TEXT, "ai");
+    }
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+    // События SSE разделены пустой строкой, последний фрагмент может быть неполным
+    const events = buffer.split("\n\n");
+    buffer = events.pop();
+    for (const raw of events) {
+      const event = parseEvent(raw);
+      if (event) handleEvent(event.type, event.data);
+    }
+  }
+}
+
+function parseEvent(raw) {
+  let type = "message";
+  const dataLines = [];
+  for (const line of raw.split("\n")) {
+    if (line.startsWith("event:")) type = line.slice(6).trim();
+    else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
+  }
+  if (!dataLines.length) return null;
+  try {
+    return { type, data: JSON.parse(dataLines.join("\n")) };
   } catch (error) {
-    console.error("Error getting AI response:", error);
-    hideTypingIndicator();
+    console.error("Malformed chat event:", error);
+    return null;
   }
 }
 
-function addMessage(text, sender) {
+function setToolStatus(status) {
+  let statusDiv = document.getElementById("chatToolStatus");
+  if (!status) {
+    statusDiv?.remove();
+    return;
+  }
   const chatMessages = document.getElementById("chatMessages");
   if (!chatMessages) return;
+  if (!statusDiv) {
+    statusDiv = document.createElement("div");
+    statusDiv.className = "chat-tool-status";
+    statusDiv.id = "chatToolStatus";
+  }
+  statusDiv.textContent = status;
+  chatMessages.appendChild(statusDiv);
+  scrollToBottom();
+}
+
+function addMessage(text, sender) {
+  const chatMessages = document.getElementById("chatMessages");
+  if (!chatMessages) return null;
 
   const messageDiv = document.createElement("div");
   messageDiv.className = `chat-message ${sender}-message`;
   messageDiv.innerHTML = formatMessage(text);
   chatMessages.appendChild(messageDiv);
   scrollToBottom();
+  return messageDiv;
 }
 
 // ================== MARKDOWN RENDERER ==================